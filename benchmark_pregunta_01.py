@@ -0,0 +1,493 @@
+# -*- coding: utf-8 -*-
+
+# Datos sintéticos y benchmark de escalamiento para pregunta_01.py
+#
+#   python benchmark_pregunta_01.py                    # escalas 1x y 10x
+#   python benchmark_pregunta_01.py --escalas 1 10 100
+#   python benchmark_pregunta_01.py --solo-generar --escalas 1
+#   python benchmark_pregunta_01.py --escalas 1 --procesos 1 2 4 8
+#
+# Los datos se generan en data/sintetico/x<escala>/ (fuera de git) y cada
+# corrida se agrega a data/benchmark/historial_pregunta_01.csv.
+
+#librerias
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import pregunta_01 as p01
+
+
+################ Generador de datos sintéticos ####################
+
+# Nombres tal como vienen en maestro_productos.csv (con tildes y mayúsculas)
+CATEGORIAS = [
+    "Despensa", "Hogar", "Lencería", "Pequeños Electrodomésticos", "Carnes",
+    "Cuidado del Bebé", "Viaje", "Bebidas", "Ropa Niño", "Higiene Personal",
+    "Salud", "Relojería", "Electrónica", "Panadería", "Automotriz",
+    "Informática", "Ropa Mujer", "Jardín", "Pescados", "Mascotas", "Camping",
+    "Papelería", "Belleza", "Limpieza", "Bisutería", "Lácteos", "Congelados",
+    "Televisión y Audio", "Muebles", "Iluminación", "Juguetes", "Ropa Hombre",
+    "Alimentos", "Farmacia", "Decoración", "Frutas y Verduras", "Calzado",
+    "Ferretería", "Deportes", "Accesorios Móviles", "Moda",
+]
+
+COLORES = [
+    "DarkGoldenRod", "Blue", "LightCyan", "MediumPurple", "FloralWhite",
+    "GoldenRod", "LightSeaGreen", "Plum", "LightGoldenRodYellow", "DarkBlue",
+    "DarkSalmon", "WhiteSmoke", "LightGray", "Purple", "MediumBlue", "Coral",
+    "Teal", "Olive", "Navy", "Crimson", "Khaki", "Orchid", "Sienna", "Tomato",
+]
+
+# Filas base a escala 1x (similar a los archivos originales)
+PRODUCTOS_1X = 5_000
+SKUS_INVENTARIO_1X = 1_000
+TRANSACCIONES_1X = 100_000
+DIAS = pd.date_range("2025-01-01", "2025-12-31")
+
+
+def _ensuciar_texto(rng, textos):
+    """
+    Errores de captura en textos (sobre los valores distintos): mayúsculas,
+    encoding roto (UTF-8 leído como latin-1), espacios, letras traspuestas
+    y vacíos.
+    """
+    textos = pd.Series(textos, dtype=object)
+    r = rng.random(len(textos))
+
+    def _mojibake(x):
+        return x.encode("utf-8").decode("latin-1")
+
+    def _trasponer(x):
+        i = len(x) // 2
+        return x[:i - 1] + x[i] + x[i - 1] + x[i + 1:] if len(x) > 3 else x
+
+    for desde, hasta, f in [
+        (0.00, 0.04, str.upper),
+        (0.04, 0.07, _mojibake),
+        (0.07, 0.09, lambda x: f" {x} "),
+        (0.09, 0.10, _trasponer),
+    ]:
+        m = (r >= desde) & (r < hasta) & textos.notna().to_numpy()
+        codigos, unicos = pd.factorize(textos[m])
+        textos[m] = np.array([f(x) for x in unicos], dtype=object)[codigos]
+
+    textos[(r >= 0.10) & (r < 0.12)] = np.nan
+    return textos.to_numpy(object)
+
+
+def _ensuciar_fecha(rng, fechas):
+    """
+    Fechas en formatos mezclados: dd-mm-aaaa, aaaa-mm-dd, dd/mm/aaaa, años
+    equivocados, solo el año, letras pegadas y vacíos. Cada formato se
+    aplica sobre los días distintos y se reparte por códigos.
+    """
+    codigos, dias = pd.factorize(pd.DatetimeIndex(fechas))
+    dias = pd.DatetimeIndex(dias)
+    formatos = [
+        (0.00, 0.40, dias.strftime("%d-%m-%Y")),
+        (0.40, 0.70, dias.strftime("%Y-%m-%d")),
+        (0.70, 0.75, dias.strftime("%d/%m/%Y")),
+        (0.75, 0.78, dias.strftime("%d-%m-2024")),
+        (0.78, 0.80, pd.Index(["2025"] * len(dias))),
+        (0.80, 0.82, dias.strftime("%d-%m-%Y") + "x"),
+        (0.84, 0.85, pd.Index(["sin fecha"] * len(dias))),
+    ]
+
+    r = rng.random(len(codigos))
+    salida = np.full(len(codigos), np.nan, dtype=object)
+    for desde, hasta, textos in formatos:
+        m = (r >= desde) & (r < hasta)
+        salida[m] = textos.to_numpy(object)[codigos[m]]
+    return salida
+
+
+def _ensuciar_numero(rng, valores, decimales=2):
+    """
+    Números como texto con prefijo $, signo -, espacios, "N/A" y vacíos.
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    texto = np.round(valores, decimales).astype(str).astype(object) if decimales else \
+        valores.astype(np.int64).astype(str).astype(object)
+    r = rng.random(len(texto))
+    texto[r < 0.05] = np.char.add("$", texto[r < 0.05].astype(str)).astype(object)
+    m = (r >= 0.05) & (r < 0.07)
+    texto[m] = np.char.add("-", texto[m].astype(str)).astype(object)
+    m = (r >= 0.07) & (r < 0.09)
+    texto[m] = np.char.add(np.char.add(" ", texto[m].astype(str)), " ").astype(object)
+    texto[(r >= 0.09) & (r < 0.11)] = np.nan
+    texto[(r >= 0.11) & (r < 0.115)] = "N/A"
+    return texto
+
+
+def _ids_con_faltantes(rng, ids, tasa=0.02):
+    ids = np.asarray(ids, dtype=object).copy()
+    ids[rng.random(len(ids)) < tasa] = np.nan
+    return ids
+
+
+def generar_maestro(rng, n_productos):
+    """
+    Maestro de productos limpio (verdad) con sku_name "PRE-Color-NNN".
+    """
+    categoria = rng.integers(0, len(CATEGORIAS), n_productos)
+    nombres_cat = np.array(CATEGORIAS, dtype=object)[categoria]
+    prefijo = np.array([c[:3].upper() for c in CATEGORIAS], dtype=object)[categoria]
+    color = np.array(COLORES, dtype=object)[rng.integers(0, len(COLORES), n_productos)]
+    numero = rng.integers(100, 1000, n_productos).astype(str)
+    costo = np.round(rng.gamma(2.0, 15.0, n_productos) + 1, 2)
+    return pd.DataFrame({
+        "product_id": [f"{x:08x}" for x in rng.choice(2**32, n_productos, replace=False)],
+        "sku_name": prefijo + "-" + color + "-" + numero,
+        "categoria": nombres_cat,
+        "costo_unitario": costo,
+        "precio_lista": np.round(costo * rng.uniform(1.2, 2.0, n_productos), 2),
+    })
+
+
+def _stock_con_quiebres(rng, n_skus, n_dias, tasa_quiebre=0.01):
+    """
+    Stock diario (sku-mayor) con rachas de stock 0 que no cruzan de SKU.
+    """
+    n = n_skus * n_dias
+    stock = rng.poisson(20, n).astype(np.float64)
+    idx = np.arange(n)
+    inicio = rng.random(n) < tasa_quiebre
+    fin_bloque = (idx // n_dias + 1) * n_dias
+    fin = np.where(inicio, np.minimum(idx + rng.geometric(0.35, n), fin_bloque), -1)
+    stock[idx < np.maximum.accumulate(fin)] = 0
+    return stock
+
+
+def plantar_sustituciones(rng, maestro, n_skus, n_pares):
+    """
+    Sucesores para n_pares SKUs del inventario: mismo prefijo, color,
+    categoría y precios, otro número y otro product_id. Desde el día de
+    cambio las ventas del SKU antiguo pasan al sucesor.
+
+    Retorna
+    -------
+    tuple
+        (nuevos, sucesor, dia_cambio, verdad): filas a agregar al maestro,
+        índice del sucesor y día de cambio por fila del maestro (-1 = sin
+        sucesor) y el DataFrame de pares plantados
+    """
+    antiguos = rng.choice(n_skus, n_pares, replace=False)
+    nuevos = maestro.iloc[antiguos].copy()
+    base = nuevos["sku_name"].str.rsplit("-", n=1).str[0]
+    numero = nuevos["sku_name"].str.rsplit("-", n=1).str[1].astype(int)
+    nuevos["sku_name"] = base + "-" + ((numero + rng.integers(1, 900, n_pares) - 100) % 900 + 100).astype(str)
+    usados = set(maestro["product_id"])
+    candidatos = [f"{x:08x}" for x in rng.choice(2**32, 2 * n_pares, replace=False)]
+    nuevos["product_id"] = [x for x in candidatos if x not in usados][:n_pares]
+
+    sucesor = np.full(len(maestro), -1)
+    sucesor[antiguos] = len(maestro) + np.arange(n_pares)
+    dia_cambio = np.full(len(maestro), -1)
+    dia_cambio[antiguos] = rng.integers(60, len(DIAS) - 60, n_pares)
+    verdad = pd.DataFrame({
+        "product_id_antiguo": maestro["product_id"].to_numpy()[antiguos],
+        "product_id_nuevo": nuevos["product_id"].to_numpy(),
+        "fecha_cambio": DIAS[dia_cambio[antiguos]].strftime("%d-%m-%Y"),
+    })
+    return nuevos.reset_index(drop=True), sucesor, dia_cambio, verdad
+
+
+def generar_datos(ruta, escala=1, semilla=0, skus_por_bloque=2_000, sustituciones=0):
+    """
+    Escribe maestro_productos.csv, inventario_diario.csv y
+    transacciones_ventas.csv sucios en ruta, a la escala pedida
+    (1x ≈ 5 mil productos, 1 mil SKUs × 365 días, 100 mil transacciones).
+
+    El inventario y las transacciones se generan y escriben por bloques de
+    SKUs, así la memoria no crece con la escala.
+
+    Con sustituciones > 0 se plantan esa cantidad de pares SKU antiguo →
+    sucesor (ver plantar_sustituciones) y la verdad queda en
+    sustituciones.csv. Los pares usan su propio generador: con
+    sustituciones=0 los datos son los mismos de siempre.
+    """
+    ruta = Path(ruta)
+    ruta.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(semilla)
+
+    maestro = generar_maestro(rng, int(PRODUCTOS_1X * escala))
+    n_skus = int(SKUS_INVENTARIO_1X * escala)
+    n_trx = int(TRANSACCIONES_1X * escala)
+
+    nuevos, sucesor, dia_cambio = maestro.iloc[:0], np.full(len(maestro), -1), None
+    if sustituciones:
+        nuevos, sucesor, dia_cambio, verdad = plantar_sustituciones(
+            np.random.default_rng([semilla, 1]), maestro, n_skus, sustituciones
+        )
+        verdad.to_csv(ruta / "sustituciones.csv", index=False, encoding="utf-8")
+
+    # Maestro sucio: ids, categorías y montos con errores, más duplicados
+    sucio = maestro.assign(
+        product_id=_ids_con_faltantes(rng, maestro["product_id"]),
+        categoria=_ensuciar_texto(rng, maestro["categoria"]),
+        costo_unitario=np.where(rng.random(len(maestro)) < 0.02, np.nan, maestro["costo_unitario"]),
+        precio_lista=np.where(rng.random(len(maestro)) < 0.02, np.nan, maestro["precio_lista"]),
+    )
+    duplicados = sucio.sample(frac=0.02, random_state=semilla)
+    pd.concat([sucio, duplicados, nuevos], ignore_index=True).to_csv(
+        ruta / "maestro_productos.csv", index=False, encoding="utf-8"
+    )
+
+    inventario = maestro.iloc[:n_skus]
+    n_maestro = len(maestro)
+    maestro = pd.concat([maestro, nuevos], ignore_index=True)
+    precio = maestro["precio_lista"].to_numpy()
+    archivo_inv = ruta / "inventario_diario.csv"
+    archivo_trx = ruta / "transacciones_ventas.csv"
+    transaccion = 0
+
+    for bloque, desde in enumerate(range(0, n_skus, skus_por_bloque)):
+        skus = inventario.iloc[desde:desde + skus_por_bloque]
+        n_dias = len(DIAS)
+        stock = _stock_con_quiebres(rng, len(skus), n_dias)
+        costo = np.repeat(skus["costo_unitario"].to_numpy(), n_dias)
+
+        inv = pd.DataFrame({
+            "fecha": _ensuciar_fecha(rng, np.tile(DIAS, len(skus))),
+            "product_id": _ids_con_faltantes(rng, np.repeat(skus["product_id"].to_numpy(), n_dias)),
+            "categoria": _ensuciar_texto(rng, np.repeat(skus["categoria"].to_numpy(), n_dias)),
+            "cantidad_stock": _ensuciar_numero(rng, stock, decimales=0),
+            "valor_inventario_costo": _ensuciar_numero(rng, stock * costo),
+        })
+        inv.to_csv(archivo_inv, index=False, header=bloque == 0, mode="w" if bloque == 0 else "a")
+
+        # Transacciones del bloque: días con stock (un quiebre no vende) y un
+        # 5% de productos del maestro que no están en el inventario
+        n = int(n_trx * len(skus) / n_skus)
+        fila = rng.integers(0, len(stock), int(n * 1.2))
+        fila = fila[stock[fila] > 0][:n]
+        producto = desde + fila // n_dias
+        externos = rng.random(len(fila)) < 0.05
+        producto[externos] = rng.integers(0, n_maestro, externos.sum())
+        if sustituciones:
+            cambia = (sucesor[producto] >= 0) & (fila % n_dias >= dia_cambio[producto])
+            producto[cambia] = sucesor[producto[cambia]]
+
+        lista = precio[producto]
+        descuento = np.round(lista * rng.choice([0, 0, 0, 0.1, 0.2, 0.3], len(fila)), 2)
+        trx = pd.DataFrame({
+            "transaction_id": np.arange(transaccion, transaccion + len(fila)),
+            "fecha": _ensuciar_fecha(rng, DIAS[fila % n_dias]),
+            "product_id": _ids_con_faltantes(rng, maestro["product_id"].to_numpy()[producto]),
+            "categoria": _ensuciar_texto(rng, maestro["categoria"].to_numpy()[producto]),
+            "unidades_vendidas": _ensuciar_numero(rng, rng.integers(1, 10, len(fila)), decimales=0),
+            "precio_unitario_venta": _ensuciar_numero(rng, lista - descuento),
+            "precio_lista_original": _ensuciar_numero(rng, lista),
+            "monto_descuento_unitario": _ensuciar_numero(rng, descuento),
+            "costo_unitario": _ensuciar_numero(rng, maestro["costo_unitario"].to_numpy()[producto]),
+        })
+        trx.to_csv(archivo_trx, index=False, header=bloque == 0, mode="w" if bloque == 0 else "a")
+        transaccion += len(fila)
+
+    marca = {"escala": escala, "semilla": semilla}
+    if sustituciones:
+        marca["sustituciones"] = sustituciones
+    (ruta / "generado.json").write_text(json.dumps(marca))
+    return ruta
+
+
+def datos_sinteticos(escala, semilla=0, base="data/sintetico"):
+    """
+    Carpeta con los datos de la escala pedida; se generan solo si no existen
+    (o si se generaron con otra semilla).
+    """
+    ruta = Path(base) / f"x{escala:g}"
+    marca = ruta / "generado.json"
+    if not (marca.exists() and json.loads(marca.read_text()) == {"escala": escala, "semilla": semilla}):
+        generar_datos(ruta, escala, semilla)
+    return ruta
+
+
+################ Benchmark ####################
+
+def _kpis(tablas, ruta):
+    """
+    Etapas de KPI medidas (misma forma que las etapas del pipeline). La de
+    sustituciones incluye el reparseo de fechas (ventas_fechadas), igual que
+    main --sustituciones; en 10x son ~50 mil SKUs en el maestro.
+    """
+    inv, trx, prod = tablas["inv"], tablas["trx"], tablas["prod"]
+    return [
+        ("kpi.gmroi", lambda: p01.calcular_gmroi(inv, trx)),
+        ("kpi.markdown", lambda: p01.calcular_markdown(trx)),
+        ("kpi.cubo", lambda: p01.CuboKPI.desde_tablas(inv, trx).alertas_markdown()),
+        ("kpi.quiebres", lambda: p01.estimar_demanda_sin_censura(inv, trx)),
+        ("kpi.sustituciones", lambda: p01.IndiceSustitucion(prod, p01.ventas_fechadas(trx, ruta)).mapa()),
+    ]
+
+
+def medir_escala(ruta, repeticiones=1):
+    """
+    Tiempo por etapa (carga, limpieza, completado y KPIs) sobre los CSV de
+    ruta. Con varias repeticiones se guarda el mínimo de cada etapa.
+    """
+    corridas = []
+    for _ in range(repeticiones):
+        registro = []
+
+        inicio = time.perf_counter()
+        tablas = dict(zip(["inv", "prod", "trx"], p01.cargar_tablas(ruta)))
+        registro.append({
+            "etapa": "cargar",
+            "segundos": time.perf_counter() - inicio,
+            "filas": sum(len(t) for t in tablas.values()),
+        })
+
+        # Tabla de alias en memoria: cada corrida puntúa desde cero
+        tabla_alias = p01.TablaAliasCategorias(p01.categorias_reales)
+        etapas = p01.etapas_limpieza({}, tabla_alias) + p01.ETAPAS_COMPLETADO
+        tablas = p01.PipelineLimpieza(etapas, registro=registro).ejecutar(tablas)
+
+        for etapa, funcion in _kpis(tablas, ruta):
+            inicio = time.perf_counter()
+            funcion()
+            registro.append({
+                "etapa": etapa,
+                "segundos": time.perf_counter() - inicio,
+                "filas": len(tablas["inv"]) + len(tablas["trx"]),
+            })
+
+        corridas.append(pd.DataFrame(registro))
+
+    resultado = pd.concat(corridas).groupby("etapa", sort=False).agg(
+        segundos=("segundos", "min"), filas=("filas", "first")
+    ).reset_index()
+    total = pd.DataFrame([{"etapa": "total", "segundos": resultado["segundos"].sum(),
+                           "filas": resultado.loc[0, "filas"]}])
+    return pd.concat([resultado, total], ignore_index=True)
+
+
+def medir_procesos(ruta, procesos=(1, 2, 4, 8), repeticiones=1):
+    """
+    Tiempo de cargar_tablas_limpias (sin caché) con cada número de procesos
+    de limpiar_tablas_paralelo; aceleración respecto de procesos=1. Con más
+    procesos que núcleos (os.cpu_count) la aceleración no es esperable.
+    """
+    filas = []
+    for n in procesos:
+        segundos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            p01.cargar_tablas_limpias(
+                ruta, tabla_alias=p01.TablaAliasCategorias(p01.categorias_reales), usar_cache=False, procesos=n
+            )
+            segundos.append(time.perf_counter() - inicio)
+        filas.append({"procesos": n, "segundos": min(segundos)})
+    resultado = pd.DataFrame(filas)
+    base = resultado.loc[resultado["procesos"] == 1, "segundos"]
+    resultado["aceleracion"] = base.iloc[0] / resultado["segundos"] if len(base) else np.nan
+    return resultado.assign(nucleos=os.cpu_count())
+
+
+def _version_codigo():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def detectar_regresiones(historial, resultados, factor=1.5, minimo=0.05):
+    """
+    Compara cada etapa con la mediana de las corridas anteriores de la misma
+    escala. Es regresión si tarda más de factor veces esa mediana y además
+    la diferencia supera minimo segundos.
+    """
+    if historial.empty:
+        return resultados.assign(mediana_historica=np.nan, regresion=False)
+
+    referencia = (
+        historial.groupby(["escala", "etapa"])["segundos"].median()
+        .rename("mediana_historica").reset_index()
+    )
+    comparacion = resultados.merge(referencia, on=["escala", "etapa"], how="left")
+    comparacion["regresion"] = (
+        (comparacion["segundos"] > factor * comparacion["mediana_historica"])
+        & (comparacion["segundos"] - comparacion["mediana_historica"] > minimo)
+    )
+    return comparacion
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Datos sintéticos y benchmark de escalamiento de la pregunta 1"
+    )
+    parser.add_argument("--escalas", type=float, nargs="+", default=[1, 10],
+                        help="escalas a generar/medir (default: 1 10)")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--repeticiones", type=int, default=1,
+                        help="corridas por escala; se guarda el mínimo por etapa")
+    parser.add_argument("--solo-generar", action="store_true",
+                        help="solo genera los CSV (en --destino si se indica) y termina")
+    parser.add_argument("--destino", default=None,
+                        help="carpeta de salida para --solo-generar (default: data/sintetico/x<escala>)")
+    parser.add_argument("--procesos", type=int, nargs="+", default=None,
+                        help="mide la limpieza con estos números de procesos (p. ej. 1 2 4 8) y termina")
+    parser.add_argument("--historial", default="data/benchmark/historial_pregunta_01.csv")
+    parser.add_argument("--factor-regresion", type=float, default=1.5)
+    args = parser.parse_args()
+
+    if args.solo_generar:
+        for escala in args.escalas:
+            ruta = generar_datos(args.destino, escala, args.semilla) if args.destino else \
+                datos_sinteticos(escala, args.semilla)
+            print(f"x{escala:g}: {ruta}")
+        return 0
+
+    if args.procesos:
+        for escala in args.escalas:
+            ruta = datos_sinteticos(escala, args.semilla)
+            print(f"Limpieza paralela x{escala:g} ({ruta}) ...")
+            print(medir_procesos(ruta, args.procesos, args.repeticiones).to_string(index=False))
+        return 0
+
+    ruta_historial = Path(args.historial)
+    historial = pd.read_csv(ruta_historial) if ruta_historial.exists() else pd.DataFrame()
+
+    marca = {
+        "fecha_hora": datetime.now().isoformat(timespec="seconds"),
+        "commit": _version_codigo(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "maquina": platform.node(),
+    }
+
+    resultados = []
+    for escala in args.escalas:
+        ruta = datos_sinteticos(escala, args.semilla)
+        print(f"Midiendo x{escala:g} ({ruta}) ...")
+        resultados.append(medir_escala(ruta, args.repeticiones).assign(escala=escala, **marca))
+    resultados = pd.concat(resultados, ignore_index=True)
+
+    comparacion = detectar_regresiones(historial, resultados, args.factor_regresion)
+    with pd.option_context("display.width", 200, "display.max_rows", 200, "display.max_columns", 20):
+        print(comparacion[["escala", "etapa", "filas", "segundos", "mediana_historica", "regresion"]])
+
+    ruta_historial.parent.mkdir(parents=True, exist_ok=True)
+    pd.concat([historial, resultados], ignore_index=True).to_csv(ruta_historial, index=False)
+
+    if comparacion["regresion"].any():
+        print("Regresiones detectadas en:", ", ".join(
+            f"x{e:g} {s}" for e, s in comparacion.loc[comparacion["regresion"], ["escala", "etapa"]].to_numpy()
+        ))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,27 +4,223 @@
 #pip install rapidfuzz
 
 #librerias
+import argparse
+import functools
+import hashlib
+import json
 import pandas as pd
 import numpy as np
 import re
+import shutil
+import tempfile
+import time
 import unicodedata
+import warnings
+from pandas.tseries.api import guess_datetime_format
+from pathlib import Path
 from rapidfuzz import process, fuzz
 
+# Copy-on-write: las etapas trabajan sobre copias livianas (df.copy(deep=False))
+# y una columna solo se copia si se modifica en su lugar. Se activa solo dentro
+# de las funciones marcadas con @_copy_on_write (sin cambiar la opción global
+# de pandas para quien importe el módulo); sin él, un .loc sobre la copia
+# liviana escribiría en la tabla del llamador. Con copy-on-write, to_numpy() /
+# .values entregan vistas de solo lectura: todo arreglo que se modifica en su
+# lugar (x[m] = ..., np.*.at, out=) debe ser propio (np.full, indexado,
+# np.append, astype o to_numpy(copy=True)).
+def _copy_on_write(funcion):
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        with pd.option_context("mode.copy_on_write", True):
+            return funcion(*args, **kwargs)
+    return envoltura
+
+try:
+    import pyarrow  # noqa: F401  (backend de strings para limpiar_cols_num)
+    PYARROW_DISPONIBLE = True
+except ImportError:
+    PYARROW_DISPONIBLE = False
+
+try:
+    import duckdb  # backend SQL opcional para los KPIs (calcular_kpis_duckdb)
+    DUCKDB_DISPONIBLE = True
+except ImportError:
+    DUCKDB_DISPONIBLE = False
+
 #Cargar archivos
 #inv = pd.read_csv('C:/Users/felip/Desktop/Magíster/8. Marketing y Analítica del Retail/Tarea 1/inventario_diario.csv')
 #prod = pd.read_csv('C:/Users/felip/Desktop/Magíster/8. Marketing y Analítica del Retail/Tarea 1/maestro_productos.csv')
 #trx = pd.read_csv('C:/Users/felip/Desktop/Magíster/8. Marketing y Analítica del Retail/Tarea 1/transacciones_ventas.csv')
 
-inv = pd.read_csv("data/inventario_diario.csv")
-prod = pd.read_csv("data/maestro_productos.csv")
-trx = pd.read_csv("data/transacciones_ventas.csv")
+def cargar_tablas(ruta_datos="data"):
+    """
+    Lee inventario, maestro de productos y transacciones desde ruta_datos.
+    """
+    inv = pd.read_csv(f"{ruta_datos}/inventario_diario.csv")
+    prod = pd.read_csv(f"{ruta_datos}/maestro_productos.csv")
+    trx = pd.read_csv(f"{ruta_datos}/transacciones_ventas.csv")
+    return inv, prod, trx
 
 
 #Funciones de limpieza, normalización y relleno de datos
 #_________________________________________________________________________
 
 ##################### Limpieza de columna fecha ###########################
-def limpiar_fecha(df, col_fecha):
+
+def detectar_formatos_fecha(valores):
+    """
+    Detecta una sola vez los formatos con que pandas interpreta la columna.
+
+    pandas infiere el formato a partir del primer valor no nulo, tanto para el
+    intento dayfirst (dd-mm-aaaa) como para el intento yearfirst (aaaa-mm-dd).
+    Se replica esa misma regla para poder parsear solo los valores únicos (o
+    chunks sucesivos) con exactamente el mismo resultado que la columna completa.
+
+    Retorna
+    -------
+    tuple
+        (formato_dayfirst, formato_yearfirst); None si no se pudo inferir
+    """
+    for v in valores:
+        if isinstance(v, str) and v != "":
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)
+                return (
+                    guess_datetime_format(v, dayfirst=True),
+                    guess_datetime_format(v, dayfirst=False),
+                )
+    return None, None
+
+
+def _forzar_anio(fechas, anio=2025):
+    """
+    Reemplaza el año de un arreglo datetime64 conservando mes y día,
+    usando aritmética de datetime64 (sin objetos Timestamp).
+    """
+    meses = fechas.astype("datetime64[M]")
+    mes_del_anio = meses - meses.astype("datetime64[Y]").astype("datetime64[M]")
+    dias = fechas.astype("datetime64[D]") - meses.astype("datetime64[D]")
+    base = np.datetime64(f"{anio}-01", "M")
+    return ((base + mes_del_anio).astype("datetime64[D]") + dias).astype(fechas.dtype)
+
+
+def _ffill_datetime64(fechas):
+    """
+    Forward-fill vectorizado de un arreglo datetime64 (NaT = vacío).
+    """
+    validos = ~np.isnat(fechas)
+    idx = np.where(validos, np.arange(len(fechas)), -1)
+    np.maximum.accumulate(idx, out=idx)
+    resultado = fechas[np.maximum(idx, 0)]
+    resultado[idx < 0] = np.datetime64("NaT")
+    return resultado
+
+
+def _textos_fecha_limpios(fechas):
+    """
+    Factoriza la columna y limpia solo los textos distintos (quita letras
+    y todo lo que no sea dígito, "-" o "/").
+
+    Retorna
+    -------
+    tuple
+        (códigos por fila, textos limpios únicos); código -1 = vacío
+    """
+    codigos, unicos = pd.factorize(fechas)
+    textos = (
+        pd.Series(unicos, dtype=object)
+        .astype(str)
+        .str.replace(r"[a-zA-Z]", "", regex=True)
+        .str.replace(r"[^0-9\-\/]", "", regex=True)
+    )
+
+    # Distintos textos crudos pueden quedar iguales tras la limpieza
+    codigos_limpios, limpios = pd.factorize(textos.replace("", pd.NA))
+    codigos = np.append(codigos_limpios, -1)[codigos]
+    return codigos, pd.Series(limpios, dtype=object)
+
+
+@_copy_on_write
+def limpiar_fecha(df, col_fecha, estado=None):
+    """
+    Limpia y normaliza la columna fecha al formato dd-mm-aaaa (año 2025).
+
+    Cada texto distinto se limpia y parsea una sola vez: la columna se
+    factoriza, se trabaja sobre los valores únicos y el resultado se
+    reparte de vuelta a las filas mediante los códigos. El forzado de año
+    y el relleno hacia adelante se hacen con aritmética datetime64.
+    Entrega el mismo resultado que limpiar_fecha_referencia.
+
+    Parámetros
+    ----------
+    df : pd.DataFrame
+        DataFrame de entrada
+    col_fecha : str
+        Nombre de la columna de fecha
+    estado : dict, opcional
+        Estado compartido entre llamadas sucesivas (p. ej. chunks de un mismo
+        archivo): guarda los formatos detectados ("formatos") y la última
+        fecha válida ("ultima_fecha") para continuar el relleno hacia adelante.
+
+    Retorna
+    -------
+    pd.DataFrame
+        DataFrame con la fecha limpia
+    """
+    df = df.copy(deep=False)
+    if estado is None:
+        estado = {}
+
+    # 1. Factorizar: solo se procesan los textos distintos
+    codigos, limpios = _textos_fecha_limpios(df[col_fecha])
+
+    # 2. Formatos detectados una sola vez (se reutilizan entre chunks)
+    if "formatos" not in estado:
+        estado["formatos"] = detectar_formatos_fecha(limpios)
+    formato_1, formato_2 = estado["formatos"]
+
+    # Intento 1: dd-mm-aaaa / Intento 2: aaaa-mm-dd (solo sobre únicos)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        fecha_1 = pd.to_datetime(limpios, errors="coerce", format=formato_1, dayfirst=True)
+        fecha_2 = pd.to_datetime(limpios, errors="coerce", format=formato_2, yearfirst=True)
+    fechas_unicas = fecha_1.combine_first(fecha_2)
+
+    # Casos donde solo viene el año (yyyy)
+    solo_anio = limpios.str.fullmatch(r"\d{4}").fillna(False).to_numpy(bool)
+    fechas_unicas[solo_anio] = pd.to_datetime(
+        limpios[solo_anio] + "-01-01", errors="coerce"
+    )
+
+    # 3. Forzar todos los años a 2025
+    valores = fechas_unicas.to_numpy("datetime64[ns]")
+    valores = np.where(np.isnat(valores), valores, _forzar_anio(valores))
+
+    # Reparto a las filas mediante los códigos (código -1 → NaT)
+    valores = np.append(valores, np.datetime64("NaT", "ns"))
+    por_fila = valores[codigos]
+
+    # 4. Rellenar fechas vacías con la inmediatamente anterior
+    if estado.get("ultima_fecha") is not None and len(por_fila) and np.isnat(por_fila[0]):
+        por_fila[0] = estado["ultima_fecha"]
+    por_fila = _ffill_datetime64(por_fila)
+    if len(por_fila) and not np.isnat(por_fila[-1]):
+        estado["ultima_fecha"] = por_fila[-1]
+
+    # Formato final: strftime solo sobre las fechas distintas
+    codigos_fecha, fechas_finales = pd.factorize(por_fila)
+    texto_final = pd.DatetimeIndex(fechas_finales).strftime("%d-%m-%Y").to_numpy(object)
+    texto_final = np.append(texto_final, np.nan)
+    df[col_fecha] = texto_final[codigos_fecha]
+
+    return df
+
+
+def limpiar_fecha_referencia(df, col_fecha):
+    """
+    Implementación original fila a fila; se mantiene como referencia
+    para validar y medir limpiar_fecha.
+    """
     df = df.copy()
 
     # 1. Eliminar letras y caracteres raros
@@ -78,37 +274,76 @@ def limpiar_fecha(df, col_fecha):
 
 #------- Normalización -------#
 
-def normalizar_categoria(df, col_categoria):
-    df = df.copy()
+def _normalizar_texto_categoria(x):
+    """
+    Normaliza un texto de categoría: corrige encoding roto, pasa a minúsculas,
+    quita tildes y caracteres no alfabéticos y normaliza espacios.
+    """
+    x = str(x)
 
-    def _normalizar(x):
-        if pd.isna(x):
-            return x
+    # Corregir encoding roto (MÃ³ → ó)
+    try:
+        x = x.encode("latin1").decode("utf-8")
+    except Exception:
+        pass
 
-        x = str(x)
+    # Minúsculas
+    x = x.lower()
 
-        # Corregir encoding roto (MÃ³ → ó)
-        try:
-            x = x.encode("latin1").decode("utf-8")
-        except Exception:
-            pass
+    # Quitar tildes
+    x = unicodedata.normalize("NFKD", x)
+    x = "".join(c for c in x if not unicodedata.combining(c))
+
+    # Eliminar caracteres no alfabéticos
+    x = re.sub(r"[^a-z\s]", "", x)
 
-        # Minúsculas
-        x = x.lower()
+    # Normalizar espacios
+    x = re.sub(r"\s+", " ", x).strip()
 
-        # Quitar tildes
-        x = unicodedata.normalize("NFKD", x)
-        x = "".join(c for c in x if not unicodedata.combining(c))
+    return x
 
-        # Eliminar caracteres no alfabéticos
-        x = re.sub(r"[^a-z\s]", "", x)
 
-        # Normalizar espacios
-        x = re.sub(r"\s+", " ", x).strip()
+@_copy_on_write
+def normalizar_categoria(df, col_categoria, alias=None):
+    """
+    Normaliza la columna de categorías y la devuelve como pd.Categorical.
+
+    La columna se factoriza y solo se normalizan los valores distintos;
+    el resultado se reparte a las filas mediante los códigos.
+
+    Parámetros
+    ----------
+    df : pd.DataFrame
+        DataFrame de entrada
+    col_categoria : str
+        Nombre de la columna de categorías
+    alias : dict, opcional
+        Caché texto original → texto normalizado. Si se entrega el mismo
+        diccionario para inv, trx y prod, cada escritura distinta se
+        normaliza una sola vez en toda la ejecución.
+
+    Retorna
+    -------
+    pd.DataFrame
+        DataFrame con la categoría normalizada (dtype category)
+    """
+    df = df.copy(deep=False)
+    if alias is None:
+        alias = {}
+
+    codigos, unicos = pd.factorize(df[col_categoria])
+
+    for x in unicos:
+        if x not in alias:
+            alias[x] = _normalizar_texto_categoria(x)
 
-        return x
+    # Categorías ordenadas para mantener el orden alfabético de los groupby
+    codigos_norm, categorias = pd.factorize(
+        np.array([alias[x] for x in unicos], dtype=object), sort=True
+    )
+    codigos = np.append(codigos_norm, -1)[codigos]
 
-    df[col_categoria] = df[col_categoria].apply(_normalizar)
+    df[col_categoria] = pd.Categorical.from_codes(codigos, categories=categorias)
 
     return df
 
@@ -158,18 +393,120 @@ categorias_reales = [
     "moda"
 ]
 
+# Umbral de similitud usado al corregir categorías contra categorias_reales
+UMBRAL_CATEGORIA = 40
+
 # ----- Match por similitud ----- #
 
+class TablaAliasCategorias:
+    """
+    Tabla persistente de alias de categorías: texto normalizado → mejor
+    categoría real y su puntaje de similitud.
+
+    Se guarda el mejor match con su puntaje (no la decisión final), así la
+    misma tabla sirve para cualquier umbral. El archivo se nombra con una
+    firma de la lista de categorías reales y del scorer: si la lista cambia,
+    se parte con una tabla nueva.
+    """
+
+    def __init__(self, categorias_reales, directorio=None, scorer=fuzz.token_sort_ratio):
+        self.categorias_reales = list(categorias_reales)
+        self.scorer = scorer
+        self.alias = {}  # valor -> (categoria_real, score)
+
+        # Contadores (valores distintos consultados)
+        self.consultados = 0
+        self.aciertos = 0
+        self.puntuados = 0
+        self.bajo_umbral = 0
+
+        self.ruta = None
+        if directorio is not None:
+            firma = hashlib.sha1(
+                "\n".join([scorer.__name__] + self.categorias_reales).encode("utf-8")
+            ).hexdigest()[:10]
+            self.ruta = Path(directorio) / f"alias_categorias_{firma}.csv"
+            self.cargar()
+
+    def cargar(self):
+        if self.ruta is None or not self.ruta.exists():
+            return
+        tabla = pd.read_csv(self.ruta, keep_default_na=False, dtype={"valor": str, "categoria": str})
+        self.alias.update(
+            zip(tabla["valor"], zip(tabla["categoria"], tabla["score"].astype(float)))
+        )
+
+    def guardar(self):
+        if self.ruta is None:
+            return
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        pd.DataFrame(
+            [(v, c, s) for v, (c, s) in self.alias.items()],
+            columns=["valor", "categoria", "score"],
+        ).to_csv(self.ruta, index=False, encoding="utf-8")
+
+    def resolver(self, valores, threshold):
+        """
+        Retorna la categoría real para cada valor (o el mismo valor si no
+        alcanza el umbral). Solo los valores nunca vistos se puntúan, todos
+        juntos en una sola llamada a process.cdist usando todos los núcleos.
+        """
+        valores = [str(v) for v in valores]
+        nuevos = [v for v in dict.fromkeys(valores) if v not in self.alias]
+
+        self.consultados += len(set(valores))
+        self.aciertos += len(set(valores)) - len(nuevos)
+
+        if nuevos:
+            scores = process.cdist(
+                nuevos,
+                self.categorias_reales,
+                scorer=self.scorer,
+                dtype=np.float64,
+                workers=-1,
+            )
+            mejor = scores.argmax(axis=1)
+            for v, i, s in zip(nuevos, mejor, scores[np.arange(len(nuevos)), mejor]):
+                self.alias[v] = (self.categorias_reales[i], float(s))
+            self.puntuados += len(nuevos)
+            self.guardar()
+
+        resultado = []
+        for v in valores:
+            categoria, score = self.alias[v]
+            if score >= threshold:
+                resultado.append(categoria)
+            else:
+                self.bajo_umbral += 1
+                resultado.append(v)  # si no alcanza el umbral, no se reemplaza
+        return resultado
+
+    def reporte(self):
+        return {
+            "valores_consultados": self.consultados,
+            "aciertos_tabla": self.aciertos,
+            "tasa_aciertos": self.aciertos / self.consultados if self.consultados else float("nan"),
+            "valores_puntuados": self.puntuados,
+            "valores_bajo_umbral": self.bajo_umbral,
+            "alias_en_tabla": len(self.alias),
+        }
+
+
+@_copy_on_write
 def match_categoria_con_reales(
     df,
     col_categoria,
     categorias_reales,
-    threshold=80
+    threshold=80,
+    tabla_alias=None
 ):
     """
     Asigna cada categoría a la mejor coincidencia dentro de categorias_reales
     usando fuzzy matching.
 
+    Solo se comparan los valores distintos de la columna, y solo los que no
+    estén ya en la tabla de alias.
+
     Parámetros
     ----------
     df : pd.DataFrame
@@ -180,31 +517,30 @@ def match_categoria_con_reales(
         Lista de categorías válidas (normalizadas)
     threshold : int
         Umbral mínimo de similitud (0–100)
+    tabla_alias : TablaAliasCategorias, opcional
+        Tabla de alias compartida/persistente. Si no se entrega se usa
+        una tabla en memoria solo para esta llamada.
 
     Retorna
     -------
     pd.DataFrame
-        DataFrame con la categoría corregida
+        DataFrame con la categoría corregida (dtype category)
     """
 
-    df = df.copy()
-
-    def _match(x):
-        if pd.isna(x):
-            return x
-
-        match = process.extractOne(
-            x,
-            categorias_reales,
-            scorer=fuzz.token_sort_ratio
-        )
+    df = df.copy(deep=False)
+    if tabla_alias is None:
+        tabla_alias = TablaAliasCategorias(categorias_reales)
 
-        if match and match[1] >= threshold:
-            return match[0]
+    codigos, unicos = pd.factorize(df[col_categoria])
+    corregidos = tabla_alias.resolver(unicos, threshold)
 
-        return x  # si no alcanza el umbral, no se reemplaza
+    # Varios alias pueden caer en la misma categoría real
+    codigos_nuevos, categorias = pd.factorize(
+        np.array(corregidos, dtype=object), sort=True
+    )
+    codigos = np.append(codigos_nuevos, -1)[codigos]
 
-    df[col_categoria] = df[col_categoria].apply(_match)
+    df[col_categoria] = pd.Categorical.from_codes(codigos, categories=categorias)
 
     return df
 
@@ -213,51 +549,209 @@ def match_categoria_con_reales(
 
 ################ Limpieza de columna precios y cantidad ####################
 
-def limpiar_col_num(df, col):
+def _tipo_compacto(valores):
+    """
+    Convierte un arreglo float64 (NaN = faltante) al tipo más compacto que no
+    pierda información: Int32 si todos los valores son enteros en rango,
+    float32 si el ida y vuelta es exacto, y si no float64.
     """
-    Elimina símbolos $ y -, limpia separadores y convierte la columna a numérica.
+    validos = valores[~np.isnan(valores)]
+
+    if np.all(np.mod(validos, 1) == 0) and np.all(np.abs(validos) <= np.iinfo(np.int32).max):
+        faltantes = np.isnan(valores)
+        enteros = np.where(faltantes, 0, valores).astype(np.int32)
+        return pd.arrays.IntegerArray(enteros, faltantes)
+
+    if np.array_equal(validos.astype(np.float32).astype(np.float64), validos):
+        return valores.astype(np.float32)
+
+    return valores
+
+
+@_copy_on_write
+def limpiar_cols_num(df, cols, compactar=True):
+    """
+    Elimina símbolos $ y -, espacios, y convierte varias columnas a numéricas
+    de una sola vez.
+
+    Las columnas de texto se apilan en un solo arreglo de strings (pyarrow si
+    está disponible) y se limpian con una sola pasada vectorizada, sin
+    llamadas Python por elemento.
 
     Parámetros
     ----------
     df : pd.DataFrame
         DataFrame de entrada
-    col : str
-        Nombre de la columna a limpiar
+    cols : list
+        Columnas a limpiar
+    compactar : bool
+        Si True, usa Int32 / float32 cuando no se pierde información
 
     Retorna
     -------
     pd.DataFrame
-        DataFrame con la columna convertida a numérica
+        DataFrame con las columnas convertidas a numéricas
     """
 
-    df = df.copy()
+    df = df.copy(deep=False)
+    cols = list(cols)
 
-    def _limpiar(x):
-        if pd.isna(x):
-            return x
+    # Columnas ya numéricas: quitar "-" equivale al valor absoluto
+    numericas = [c for c in cols if pd.api.types.is_numeric_dtype(df[c])]
+    texto = [c for c in cols if c not in numericas]
 
-        x = str(x)
+    valores = {c: np.abs(df[c].to_numpy(dtype=np.float64, na_value=np.nan)) for c in numericas}
 
-        # Eliminar símbolos $ y -
-        x = re.sub(r"[\$-]", "", x)
+    if texto:
+        apilado = pd.concat([df[c] for c in texto], ignore_index=True).astype(
+            "string[pyarrow]" if PYARROW_DISPONIBLE else "string"
+        )
 
-        # Eliminar espacios
-        x = x.strip()
+        # Eliminar símbolos $ y -, y espacios
+        apilado = apilado.str.replace(r"[\$-]", "", regex=True).str.strip()
 
-        return x
+        # Convertir a numérico (valores no convertibles → NaN)
+        numeros = pd.to_numeric(apilado, errors="coerce").to_numpy(
+            dtype=np.float64, na_value=np.nan
+        )
 
-    df[col] = df[col].apply(_limpiar)
+        for i, c in enumerate(texto):
+            valores[c] = numeros[i * len(df):(i + 1) * len(df)]
 
-    # Convertir a numérico (valores no convertibles → NaN)
-    df[col] = pd.to_numeric(df[col], errors="coerce")
+    for c in cols:
+        df[c] = _tipo_compacto(valores[c]) if compactar else valores[c]
 
     return df
 
 
+def limpiar_col_num(df, col):
+    """
+    Limpia una sola columna numérica (ver limpiar_cols_num).
+    """
+    return limpiar_cols_num(df, [col])
+
+
 
 ################ Completar tablas con categorías faltantes ####################
 
-import pandas as pd
+def _rellenar(df, col, valores):
+    """
+    Rellena solo los faltantes de df[col] con valores (alineados por fila),
+    sin sobrescribir. Si la columna es Categorical, antes se agregan las
+    categorías nuevas (manteniendo el orden alfabético).
+    """
+    valores = pd.Series(valores, index=df.index)
+    if isinstance(df[col].dtype, pd.CategoricalDtype):
+        actuales = df[col].cat.categories
+        nuevas = pd.Index(pd.unique(valores.dropna())).difference(actuales)
+        if len(nuevas):
+            df[col] = df[col].cat.set_categories(actuales.append(nuevas).sort_values())
+    elif df[col].dtype == object or valores.dtype == object:
+        valores = valores.astype(object)
+    df[col] = df[col].fillna(valores)
+
+
+class IndiceProductos:
+    """
+    Tabla de atributos por producto indexada por un código entero de
+    product_id (la posición en self.ids).
+
+    Cada atributo guarda el primer valor no nulo visto para el producto; las
+    fuentes se agregan en orden de prioridad y nunca se sobrescribe un
+    atributo ya conocido. Las tablas de hechos se codifican una sola vez y
+    todos sus atributos faltantes se rellenan tomando por código (un join
+    indexado por tabla, en vez de un diccionario y un .map por columna).
+    """
+
+    def __init__(self, ids):
+        self.ids = pd.Index(ids)
+        self.atributos = {}
+
+    @classmethod
+    def desde_prod(cls, prod, col_id="product_id", columnas=("categoria", "costo_unitario", "precio_lista")):
+        codigos, ids = pd.factorize(prod[col_id])
+        indice = cls(ids)
+        indice.agregar_fuente(prod, codigos, {c: c for c in columnas})
+        return indice
+
+    def codificar(self, ids):
+        """
+        Código de cada product_id (-1 si es nulo o no está en el índice).
+        """
+        return self.ids.get_indexer(ids)
+
+    def extender(self, ids):
+        """
+        Agrega al índice los product_id no vistos (al final, sin alterar los
+        códigos existentes) y retorna el código de cada id entregado.
+        """
+        nuevos = pd.Index(pd.unique(pd.Series(ids).dropna())).difference(self.ids, sort=False)
+        if len(nuevos):
+            self.ids = self.ids.append(nuevos)
+            for atributo, valores in self.atributos.items():
+                self.atributos[atributo] = np.append(
+                    valores, np.full(len(nuevos), np.nan, dtype=valores.dtype)
+                )
+        return self.codificar(ids)
+
+    def a_dataframe(self, col_id="product_id"):
+        return pd.DataFrame({col_id: self.ids, **self.atributos})
+
+    @classmethod
+    def desde_dataframe(cls, df, col_id="product_id"):
+        indice = cls(df[col_id])
+        for col in df.columns.drop(col_id):
+            # Copia propia: agregar_fuente escribe en estos arreglos y, con
+            # copy-on-write, to_numpy() entrega vistas de solo lectura
+            indice.atributos[col] = df[col].to_numpy(copy=True)
+        return indice
+
+    def agregar_fuente(self, df, codigos, columnas):
+        """
+        Incorpora el primer valor no nulo por producto de cada columna de df
+        (columnas: {columna_df: atributo}), solo donde el atributo falte.
+        """
+        for col, atributo in columnas.items():
+            serie = df[col]
+            valores = np.asarray(serie.astype(object) if isinstance(serie.dtype, pd.CategoricalDtype) else serie)
+            validas = (codigos >= 0) & serie.notna().to_numpy()
+
+            codigos_validos = codigos[validas]
+            primera = ~pd.Series(codigos_validos).duplicated().to_numpy()
+
+            actual = self.atributos.get(atributo)
+            if actual is None:
+                dtype = object if valores.dtype == object else np.float64
+                actual = np.full(len(self.ids), np.nan, dtype=dtype)
+            elif actual.dtype != object and valores.dtype == object:
+                actual = actual.astype(object)
+
+            nuevos = np.zeros(len(self.ids), dtype=bool)
+            nuevos[codigos_validos[primera]] = True
+            nuevos &= pd.isna(actual)
+
+            destino = np.full(len(self.ids), -1)
+            destino[codigos_validos[primera]] = np.flatnonzero(validas)[primera]
+            actual[nuevos] = valores[destino[nuevos]]
+            self.atributos[atributo] = actual
+
+    def tomar(self, codigos, atributo):
+        """
+        Valor del atributo para cada fila (NaN si el código es -1).
+        """
+        valores = self.atributos[atributo]
+        return np.append(valores, np.array([np.nan], dtype=valores.dtype))[codigos]
+
+    def rellenar(self, df, codigos, destinos):
+        """
+        Rellena los faltantes de df con los atributos (destinos:
+        {columna_df: atributo}), sin sobrescribir valores existentes.
+        """
+        for col, atributo in destinos.items():
+            if col not in df:
+                df[col] = np.nan
+            _rellenar(df, col, self.tomar(codigos, atributo))
+
 
 def construir_prod_completo(
     prod,
@@ -275,88 +769,44 @@ def construir_prod_completo(
     """
 
     # -------------------------------------------------
-    # 1. Copia inicial de prod
-    prod_nuevo = prod.copy()
-
-    # -------------------------------------------------
-    # 2. Incorporar product_id faltantes desde inv
-    inv_ids = inv[col_id].dropna().unique()
-    prod_ids = prod_nuevo[col_id].dropna().unique()
-
-    nuevos_inv = inv.loc[
-        inv[col_id].isin(set(inv_ids) - set(prod_ids)),
-        [col_id, col_categoria]
-    ].drop_duplicates(subset=[col_id])
-
-    prod_nuevo = pd.concat([prod_nuevo, nuevos_inv], ignore_index=True)
-
-    # -------------------------------------------------
-    # 3. Incorporar product_id faltantes desde trx
-    prod_ids = prod_nuevo[col_id].dropna().unique()
-
-    nuevos_trx = trx.loc[
-        trx[col_id].isin(set(trx[col_id].dropna()) - set(prod_ids)),
-        [col_id, col_categoria]
-    ].drop_duplicates(subset=[col_id])
-
-    prod_nuevo = pd.concat([prod_nuevo, nuevos_trx], ignore_index=True)
-
-    # -------------------------------------------------
-    # 4. Completar categoría (prioridad: inv → trx)
-    mapa_cat_inv = (
-        inv[[col_id, col_categoria]]
-        .dropna()
-        .drop_duplicates(subset=[col_id])
-        .set_index(col_id)[col_categoria]
-        .to_dict()
-    )
-
-    mapa_cat_trx = (
-        trx[[col_id, col_categoria]]
-        .dropna()
-        .drop_duplicates(subset=[col_id])
-        .set_index(col_id)[col_categoria]
-        .to_dict()
-    )
-
-    mask_cat = prod_nuevo[col_categoria].isna() & prod_nuevo[col_id].notna()
-
-    prod_nuevo.loc[mask_cat, col_categoria] = (
-        prod_nuevo.loc[mask_cat, col_id]
-        .map(mapa_cat_inv)
-        .fillna(prod_nuevo.loc[mask_cat, col_id].map(mapa_cat_trx))
+    # 1. Un solo código entero por product_id para las tres tablas
+    #    (orden de aparición: prod, luego inv, luego trx)
+    codigos, ids = pd.factorize(
+        pd.concat([prod[col_id], inv[col_id], trx[col_id]], ignore_index=True)
     )
+    cod_prod, cod_inv, cod_trx = np.split(codigos, [len(prod), len(prod) + len(inv)])
+    indice = IndiceProductos(ids)
 
     # -------------------------------------------------
-    # 5. Completar costo_unitario desde trx
-    mapa_costo = (
-        trx[[col_id, col_costo]]
-        .dropna()
-        .drop_duplicates(subset=[col_id])
-        .set_index(col_id)[col_costo]
-        .to_dict()
-    )
-
-    mask_costo = prod_nuevo[col_costo].isna() & prod_nuevo[col_id].notna()
-
-    prod_nuevo.loc[mask_costo, col_costo] = (
-        prod_nuevo.loc[mask_costo, col_id].map(mapa_costo)
+    # 2. Atributos por producto (prioridad categoría: inv → trx)
+    indice.agregar_fuente(inv, cod_inv, {col_categoria: col_categoria})
+    indice.agregar_fuente(
+        trx,
+        cod_trx,
+        {
+            col_categoria: col_categoria,
+            col_costo: col_costo,
+            col_precio_trx: col_precio_prod,
+        },
     )
 
     # -------------------------------------------------
-    # 6. Completar precio_lista desde trx
-    mapa_precio = (
-        trx[[col_id, col_precio_trx]]
-        .dropna()
-        .drop_duplicates(subset=[col_id])
-        .set_index(col_id)[col_precio_trx]
-        .to_dict()
-    )
-
-    mask_precio = prod_nuevo[col_precio_prod].isna() & prod_nuevo[col_id].notna()
+    # 3. Incorporar product_id faltantes (primero los de inv, luego los de trx)
+    n_prod = cod_prod.max() + 1 if (cod_prod >= 0).any() else 0
+    nuevos = pd.DataFrame({col_id: ids[n_prod:]})
+    prod_nuevo = pd.concat([prod, nuevos], ignore_index=True)
+    cod_nuevo = np.concatenate([cod_prod, np.arange(n_prod, len(ids))])
 
-    prod_nuevo.loc[mask_precio, col_precio_prod] = (
-        prod_nuevo.loc[mask_precio, col_id].map(mapa_precio)
+    # -------------------------------------------------
+    # 4. Completar categoría, costo_unitario y precio_lista en un solo paso
+    indice.rellenar(
+        prod_nuevo,
+        cod_nuevo,
+        {
+            col_categoria: col_categoria,
+            col_costo: col_costo,
+            col_precio_prod: col_precio_prod,
+        },
     )
 
     return prod_nuevo
@@ -366,66 +816,39 @@ def construir_prod_completo(
 
 ############# Completar tabla transacciones #################
 
+@_copy_on_write
 def completar_trx_desde_prod(
     trx,
     prod,
-    col_product_id="product_id"
+    col_product_id="product_id",
+    imputar_mediana=True,
+    indice=None
 ):
     """
     Completa campos faltantes en trx usando la tabla maestra prod
     y luego imputa unidades_vendidas por mediana por categoria.
-    """
-
-    trx = trx.copy()
-    prod = prod.copy()
-
-    # ---------------------------------
-    # Diccionarios desde prod
-    # ---------------------------------
-    mapa_categoria = (
-        prod[[col_product_id, "categoria"]]
-        .dropna(subset=[col_product_id, "categoria"])
-        .drop_duplicates(col_product_id)
-        .set_index(col_product_id)["categoria"]
-        .to_dict()
-    )
-
-    mapa_precio_lista = (
-        prod[[col_product_id, "precio_lista"]]
-        .dropna(subset=[col_product_id, "precio_lista"])
-        .drop_duplicates(col_product_id)
-        .set_index(col_product_id)["precio_lista"]
-        .to_dict()
-    )
-
-    mapa_costo = (
-        prod[[col_product_id, "costo_unitario"]]
-        .dropna(subset=[col_product_id, "costo_unitario"])
-        .drop_duplicates(col_product_id)
-        .set_index(col_product_id)["costo_unitario"]
-        .to_dict()
-    )
 
-    # ---------------------------------
-    # 1. Categoria
-    # ---------------------------------
-    mask = trx["categoria"].isna() & trx[col_product_id].notna()
-    trx.loc[mask, "categoria"] = trx.loc[mask, col_product_id].map(mapa_categoria)
+    Con imputar_mediana=False se omite la imputación por mediana (p. ej. al
+    procesar por chunks, donde la mediana debe ser la de todo el archivo).
+    Se puede entregar un IndiceProductos ya construido desde prod.
+    """
 
-    # ---------------------------------
-    # 2. Precio lista original
-    # ---------------------------------
-    mask = trx["precio_lista_original"].isna() & trx[col_product_id].notna()
-    trx.loc[mask, "precio_lista_original"] = (
-        trx.loc[mask, col_product_id].map(mapa_precio_lista)
-    )
+    trx = trx.copy(deep=False)
+    if indice is None:
+        indice = IndiceProductos.desde_prod(prod, col_product_id)
 
     # ---------------------------------
-    # 3. Costo unitario
+    # 1-3. Categoria, precio lista original y costo unitario
+    #      (un solo join por código de producto)
     # ---------------------------------
-    mask = trx["costo_unitario"].isna() & trx[col_product_id].notna()
-    trx.loc[mask, "costo_unitario"] = (
-        trx.loc[mask, col_product_id].map(mapa_costo)
+    indice.rellenar(
+        trx,
+        indice.codificar(trx[col_product_id]),
+        {
+            "categoria": "categoria",
+            "precio_lista_original": "precio_lista",
+            "costo_unitario": "costo_unitario",
+        },
     )
 
     # ---------------------------------
@@ -458,13 +881,16 @@ def completar_trx_desde_prod(
         - trx.loc[mask, "precio_unitario_venta"]
     )
 
+    if not imputar_mediana:
+        return trx
+
     # =========================================================
     # 6. IMPUTACIÓN: unidades_vendidas por mediana de categoria
     # =========================================================
 
     # Mediana por categoria (solo valores válidos)
     mediana_por_categoria = (
-        trx.groupby("categoria")["unidades_vendidas"]
+        trx.groupby("categoria", observed=True)["unidades_vendidas"]
         .median()
         .round()
         .astype("Int64")
@@ -482,265 +908,2343 @@ def completar_trx_desde_prod(
 
 ############# Completar tabla inventario #################
 
+@_copy_on_write
 def completar_inv_desde_prod(
     inv,
     prod,
-    col_product_id="product_id"
+    col_product_id="product_id",
+    imputar_mediana=True,
+    indice=None
 ):
     """
     Completa la categoría en inv desde prod usando product_id,
     imputa cantidad_stock por mediana por categoria,
     e imputa valor_inventario_costo cuando esté vacío.
+
+    Con imputar_mediana=False se omite la imputación de cantidad_stock.
+    Se puede entregar un IndiceProductos ya construido desde prod.
     """
 
-    inv = inv.copy()
-    prod = prod.copy()
+    inv = inv.copy(deep=False)
+    if indice is None:
+        indice = IndiceProductos.desde_prod(prod, col_product_id)
 
     # ---------------------------------
-    # 1. Diccionario product_id → categoria
+    # 1. Código de producto (un solo hash de product_id)
     # ---------------------------------
-    mapa_categoria = (
-        prod[[col_product_id, "categoria"]]
-        .dropna(subset=[col_product_id, "categoria"])
-        .drop_duplicates(col_product_id)
-        .set_index(col_product_id)["categoria"]
-        .to_dict()
-    )
+    codigos = indice.codificar(inv[col_product_id])
 
     # ---------------------------------
     # 2. Completar categoria en inv
     # ---------------------------------
-    mask = inv["categoria"].isna() & inv[col_product_id].notna()
-
-    inv.loc[mask, "categoria"] = (
-        inv.loc[mask, col_product_id].map(mapa_categoria)
-    )
+    indice.rellenar(inv, codigos, {"categoria": "categoria"})
 
     # ---------------------------------
     # 3. Imputar cantidad_stock por mediana de categoria
     # ---------------------------------
-    mediana_stock = (
-        inv.groupby("categoria")["cantidad_stock"]
-        .median()
-        .round()
-        .astype("Int64")
-    )
+    if imputar_mediana:
+        mediana_stock = (
+            inv.groupby("categoria", observed=True)["cantidad_stock"]
+            .median()
+            .round()
+            .astype("Int64")
+        )
 
-    mask = inv["cantidad_stock"].isna() & inv["categoria"].notna()
+        mask = inv["cantidad_stock"].isna() & inv["categoria"].notna()
 
-    inv.loc[mask, "cantidad_stock"] = (
-        inv.loc[mask, "categoria"].map(mediana_stock)
-    )
+        inv.loc[mask, "cantidad_stock"] = (
+            inv.loc[mask, "categoria"].map(mediana_stock)
+        )
 
     # ---------------------------------
     # 4. Imputar valor_inventario_costo
     #    = cantidad_stock * costo_unitario (desde prod)
     # ---------------------------------
-    mapa_costo = (
-        prod[[col_product_id, "costo_unitario"]]
-        .dropna(subset=[col_product_id, "costo_unitario"])
-        .drop_duplicates(col_product_id)
-        .set_index(col_product_id)["costo_unitario"]
-        .to_dict()
+    valor_imputado = (
+        inv["cantidad_stock"].to_numpy(dtype=np.float64, na_value=np.nan)
+        * indice.tomar(codigos, "costo_unitario")
     )
+    _rellenar(inv, "valor_inventario_costo", valor_imputado)
 
-    mask = (
-        inv["valor_inventario_costo"].isna()
-        & inv["cantidad_stock"].notna()
-        & inv[col_product_id].notna()
-    )
+    return inv
+
+
+################ Etapas del análisis ####################
+
+class Etapa:
+    """
+    Una etapa del pipeline de limpieza.
+
+    Con tabla="inv"/"trx"/"prod" se aplica funcion(df, **kwargs) → df sobre
+    esa tabla; con tabla=None se aplica funcion(tablas) → tablas sobre el
+    diccionario completo (etapas que cruzan tablas).
+    """
 
-    inv.loc[mask, "valor_inventario_costo"] = (
-        inv.loc[mask, "cantidad_stock"]
-        * inv.loc[mask, col_product_id].map(mapa_costo)
+    def __init__(self, nombre, funcion, tabla=None, **kwargs):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.tabla = tabla
+        self.kwargs = kwargs
+
+
+class PipelineLimpieza:
+    """
+    Ejecuta una lista de etapas y registra por etapa el tiempo, las filas
+    procesadas y (con medir_memoria=True, vía tracemalloc) la memoria
+    incremental y el pico de la etapa. tracemalloc ralentiza las etapas
+    que crean muchos objetos Python (p. ej. limpiar_cols_num).
+
+    Bajo copy-on-write las etapas reciben copias livianas: solo las columnas
+    que cambian ocupan memoria nueva.
+    """
+
+    def __init__(self, etapas, medir_memoria=False, registro=None):
+        self.etapas = list(etapas)
+        self.medir_memoria = medir_memoria
+        self.registro = [] if registro is None else registro
+
+    @_copy_on_write
+    def ejecutar(self, tablas):
+        import tracemalloc
+
+        medir = self.medir_memoria and not tracemalloc.is_tracing()
+        if medir:
+            tracemalloc.start()
+        try:
+            for etapa in self.etapas:
+                if self.medir_memoria:
+                    tracemalloc.reset_peak()
+                    memoria_inicial = tracemalloc.get_traced_memory()[0]
+                inicio = time.perf_counter()
+
+                if etapa.tabla is not None:
+                    tablas[etapa.tabla] = etapa.funcion(tablas[etapa.tabla], **etapa.kwargs)
+                    filas = len(tablas[etapa.tabla])
+                else:
+                    tablas = etapa.funcion(tablas, **etapa.kwargs)
+                    filas = sum(len(t) for t in tablas.values() if isinstance(t, pd.DataFrame))
+
+                fila = {
+                    "etapa": etapa.nombre,
+                    "segundos": time.perf_counter() - inicio,
+                    "filas": filas,
+                }
+                if self.medir_memoria:
+                    actual, pico = tracemalloc.get_traced_memory()
+                    fila["mb_incremental"] = (actual - memoria_inicial) / 2**20
+                    fila["mb_pico_etapa"] = (pico - memoria_inicial) / 2**20
+                self.registro.append(fila)
+        finally:
+            if medir:
+                tracemalloc.stop()
+        return tablas
+
+    def reporte(self):
+        return pd.DataFrame(self.registro)
+
+
+def etapas_limpieza(alias, tabla_alias, threshold=UMBRAL_CATEGORIA):
+    """
+    Etapas de limpieza de las tres tablas. Todas comparten un mismo caché
+    de alias de normalización y una misma tabla de alias del fuzzy matching.
+    """
+    etapas = []
+    for tabla, numericas, con_fecha in [
+        ("inv", ["cantidad_stock", "valor_inventario_costo"], True),
+        ("trx", [
+            "unidades_vendidas",
+            "precio_unitario_venta",
+            "precio_lista_original",
+            "monto_descuento_unitario",
+            "costo_unitario",
+        ], True),
+        ("prod", ["costo_unitario", "precio_lista"], False),
+    ]:
+        if con_fecha:
+            etapas.append(Etapa(f"{tabla}.fecha", limpiar_fecha, tabla, col_fecha="fecha"))
+        etapas += [
+            Etapa(f"{tabla}.categoria", normalizar_categoria, tabla,
+                  col_categoria="categoria", alias=alias),
+            Etapa(f"{tabla}.categoria_real", match_categoria_con_reales, tabla,
+                  col_categoria="categoria", categorias_reales=categorias_reales,
+                  threshold=threshold, tabla_alias=tabla_alias),
+            Etapa(f"{tabla}.numericas", limpiar_cols_num, tabla, cols=numericas),
+        ]
+    return etapas
+
+
+def _etapa_prod_completo(tablas):
+    tablas["prod"] = construir_prod_completo(tablas["prod"], tablas["inv"], tablas["trx"])
+    # Atributos por producto: se construyen una vez para ambas tablas
+    tablas["indice"] = IndiceProductos.desde_prod(tablas["prod"])
+    return tablas
+
+
+def _etapa_trx_completo(tablas):
+    tablas["trx"] = completar_trx_desde_prod(tablas["trx"], tablas["prod"], indice=tablas["indice"])
+    return tablas
+
+
+def _etapa_inv_completo(tablas):
+    tablas["inv"] = completar_inv_desde_prod(tablas["inv"], tablas["prod"], indice=tablas["indice"])
+    return tablas
+
+
+def _etapa_esquema_compacto(tablas):
+    # product_id Categorical y fecha datetime64 (ver compactar_tablas)
+    tablas["inv"], tablas["trx"], tablas["prod"], _ = compactar_tablas(
+        tablas["inv"], tablas["trx"], tablas["prod"], fecha_como="datetime", ids_como="categoria"
     )
+    return tablas
 
-    return inv
-#_________________________________________________________________________
 
-##### Corregir y normalizar tablas #####
-
-# normalizar tabla inv
-inv = limpiar_fecha(inv, "fecha")
-inv = normalizar_categoria(inv, "categoria")
-inv = match_categoria_con_reales(inv, "categoria", categorias_reales, threshold=40)
-inv = limpiar_col_num(inv, "cantidad_stock")
-inv = limpiar_col_num(inv, "valor_inventario_costo")
-
-# normalizar tabla trx
-trx = limpiar_fecha(trx, "fecha")
-trx = normalizar_categoria(trx, "categoria")
-trx = match_categoria_con_reales(trx, "categoria", categorias_reales, threshold=40)
-trx = limpiar_col_num(trx, "unidades_vendidas")
-trx = limpiar_col_num(trx, "precio_unitario_venta")
-trx = limpiar_col_num(trx, "precio_lista_original")
-trx = limpiar_col_num(trx, "monto_descuento_unitario")
-trx = limpiar_col_num(trx, "costo_unitario")
-
-#normalizar tabla prod
-prod = normalizar_categoria(prod, "categoria")
-prod = match_categoria_con_reales(prod, "categoria", categorias_reales, threshold=40)
-prod = limpiar_col_num(prod, "costo_unitario")
-prod = limpiar_col_num(prod, "precio_lista")
+ETAPAS_COMPLETADO = [
+    Etapa("prod.completar", _etapa_prod_completo),
+    Etapa("trx.completar", _etapa_trx_completo),
+    Etapa("inv.completar", _etapa_inv_completo),
+]
 
-#_________________________________________________________________________
 
-##### Imputar valores a tablas para cálculos #####
+def limpiar_tablas(inv, trx, prod, alias=None, tabla_alias=None, threshold=UMBRAL_CATEGORIA,
+                   registro=None, medir_memoria=False):
+    """
+    Corrige y normaliza fechas, categorías y columnas numéricas
+    de las tres tablas (ver etapas_limpieza). Si se entrega una lista
+    registro, se le agregan las mediciones de cada etapa.
+    """
+    if alias is None:
+        alias = {}
+    if tabla_alias is None:
+        tabla_alias = TablaAliasCategorias(categorias_reales)
 
-# Completar tabla maestra de productos
-prod = construir_prod_completo(prod, inv, trx)
+    pipeline = PipelineLimpieza(
+        etapas_limpieza(alias, tabla_alias, threshold), medir_memoria, registro
+    )
+    tablas = pipeline.ejecutar({"inv": inv, "trx": trx, "prod": prod})
+    return tablas["inv"], tablas["trx"], tablas["prod"]
 
-# Completar tabla de transacciones
-trx = completar_trx_desde_prod(trx, prod)
 
-#Completar tabla de inventario
-inv = completar_inv_desde_prod(inv, prod)
+def completar_tablas(inv, trx, prod, registro=None, medir_memoria=False):
+    """
+    Imputa valores faltantes a las tablas para los cálculos.
+    """
+    pipeline = PipelineLimpieza(ETAPAS_COMPLETADO, medir_memoria, registro)
+    tablas = pipeline.ejecutar({"inv": inv, "trx": trx, "prod": prod})
+    return tablas["inv"], tablas["trx"], tablas["prod"]
 
-#_________________________________________________________________________
 
 ##### Cálculo de GMROI por categoría #####
 
-# =========================
-# 1. Preparar TRX
-# =========================
+def calcular_gmroi(inv, trx):
+    """
+    GMROI por categoría = margen bruto / inventario promedio a costo.
+    """
 
-trx_gmroi = trx.copy()
+    # =========================
+    # 1. Preparar TRX
+    # =========================
+
+    # Eliminar filas con información incompleta para el cálculo
+    trx_gmroi = trx.dropna(
+        subset=[
+            "categoria",
+            "unidades_vendidas",
+            "precio_unitario_venta",
+            "costo_unitario"
+        ]
+    )
 
-# Eliminar filas con información incompleta para el cálculo
-trx_gmroi = trx_gmroi.dropna(
-    subset=[
-        "categoria",
-        "unidades_vendidas",
-        "precio_unitario_venta",
-        "costo_unitario"
-    ]
-)
+    # unidades_vendidas viene como Int32 compacto; los montos se calculan en float64
+    trx_gmroi = trx_gmroi.astype({"unidades_vendidas": "float64"})
 
-# Ventas
-trx_gmroi["ventas"] = (
-    trx_gmroi["unidades_vendidas"] * trx_gmroi["precio_unitario_venta"]
-)
+    # Ventas
+    trx_gmroi["ventas"] = (
+        trx_gmroi["unidades_vendidas"] * trx_gmroi["precio_unitario_venta"]
+    )
 
-# Costo de ventas
-trx_gmroi["costo_ventas"] = (
-    trx_gmroi["unidades_vendidas"] * trx_gmroi["costo_unitario"]
-)
+    # Costo de ventas
+    trx_gmroi["costo_ventas"] = (
+        trx_gmroi["unidades_vendidas"] * trx_gmroi["costo_unitario"]
+    )
 
-# Margen bruto
-trx_gmroi["margen_bruto"] = (
-    trx_gmroi["ventas"] - trx_gmroi["costo_ventas"]
-)
+    # Margen bruto
+    trx_gmroi["margen_bruto"] = (
+        trx_gmroi["ventas"] - trx_gmroi["costo_ventas"]
+    )
 
-# Margen bruto por categoría
-margen_por_categoria = (
-    trx_gmroi
-    .groupby("categoria", as_index=False)["margen_bruto"]
-    .sum()
-)
+    # Margen bruto por categoría
+    margen_por_categoria = (
+        trx_gmroi
+        .groupby("categoria", as_index=False, observed=True)["margen_bruto"]
+        .sum()
+    )
 
-# =========================
-# 2. Preparar INV
-# =========================
+    # =========================
+    # 2. Preparar INV
+    # =========================
 
-inv_gmroi = inv.copy()
+    # Eliminar filas sin categoría o sin valor de inventario
+    inv_gmroi = inv.dropna(
+        subset=[
+            "categoria",
+            "valor_inventario_costo"
+        ]
+    )
 
-# Eliminar filas sin categoría o sin valor de inventario
-inv_gmroi = inv_gmroi.dropna(
-    subset=[
-        "categoria",
-        "valor_inventario_costo"
-    ]
-)
+    # Inventario promedio a costo por categoría
+    inventario_promedio = (
+        inv_gmroi
+        .groupby("categoria", as_index=False, observed=True)["valor_inventario_costo"]
+        .mean()
+        .rename(columns={
+            "valor_inventario_costo": "inventario_promedio_costo"
+        })
+    )
 
-# Inventario promedio a costo por categoría
-inventario_promedio = (
-    inv_gmroi
-    .groupby("categoria", as_index=False)["valor_inventario_costo"]
-    .mean()
-    .rename(columns={
-        "valor_inventario_costo": "inventario_promedio_costo"
-    })
-)
+    # =========================
+    # 3. Calcular GMROI
+    # =========================
 
-# =========================
-# 3. Calcular GMROI
-# =========================
+    gmroi_categoria = (
+        margen_por_categoria
+        .merge(inventario_promedio, on="categoria", how="inner")
+    )
 
-gmroi_categoria = (
-    margen_por_categoria
-    .merge(inventario_promedio, on="categoria", how="inner")
-)
+    gmroi_categoria["gmroi"] = (
+        gmroi_categoria["margen_bruto"]
+        / gmroi_categoria["inventario_promedio_costo"]
+    )
 
-gmroi_categoria["gmroi"] = (
-    gmroi_categoria["margen_bruto"]
-    / gmroi_categoria["inventario_promedio_costo"]
-)
+    # Limpiar infinitos (por inventario = 0)
+    gmroi_categoria = gmroi_categoria.replace(
+        [np.inf, -np.inf],
+        np.nan
+    )
 
-# Limpiar infinitos (por inventario = 0)
-gmroi_categoria = gmroi_categoria.replace(
-    [np.inf, -np.inf],
-    np.nan
-)
+    return gmroi_categoria
 
-print(gmroi_categoria)
 
-#_________________________________________________________________________
+##### Cálculo de MARKDOWN por categoría #####
 
+def calcular_markdown(trx):
+    """
+    Markdown por categoría = descuentos totales / ventas brutas.
+    """
 
-##### Cálculo de MARKDOWN por categoría #####
+    # --- Filtrar filas válidas ---
+    trx_md = trx.dropna(
+        subset=[
+            "categoria",
+            "unidades_vendidas",
+            "precio_unitario_venta",
+            "monto_descuento_unitario"
+        ]
+    )
 
-trx_md = trx.copy()
+    # Eliminar categorías vacías o solo espacios
+    trx_md = trx_md[trx_md["categoria"].str.strip() != ""]
 
-# --- Filtrar filas válidas ---
-trx_md = trx_md.dropna(
-    subset=[
-        "categoria",
-        "unidades_vendidas",
-        "precio_unitario_venta",
-        "monto_descuento_unitario"
-    ]
-)
+    # unidades_vendidas viene como Int32 compacto; los montos se calculan en float64
+    trx_md = trx_md.astype({"unidades_vendidas": "float64"})
 
-# Eliminar categorías vacías o solo espacios
-trx_md = trx_md[trx_md["categoria"].str.strip() != ""]
+    # --- Calcular descuentos ---
+    trx_md["descuentos"] = (
+        trx_md["unidades_vendidas"] * trx_md["monto_descuento_unitario"]
+    )
 
-# --- Calcular descuentos ---
-trx_md["descuentos"] = (
-    trx_md["unidades_vendidas"] * trx_md["monto_descuento_unitario"]
-)
+    # --- Calcular ventas brutas (dinero real) ---
+    trx_md["ventas"] = (
+        trx_md["unidades_vendidas"] * trx_md["precio_unitario_venta"]
+    )
 
-# --- Calcular ventas brutas (dinero real) ---
-trx_md["ventas"] = (
-    trx_md["unidades_vendidas"] * trx_md["precio_unitario_venta"]
-)
+    # --- Eliminar filas con ventas <= 0 ---
+    trx_md = trx_md[trx_md["ventas"] > 0]
+
+    # --- Agrupar por categoría ---
+    markdown_categoria = (
+        trx_md
+        .groupby("categoria", as_index=False, observed=True)
+        .agg(
+            descuentos_totales=("descuentos", "sum"),
+            ventas_brutas=("ventas", "sum")
+        )
+    )
 
-# --- Eliminar filas con ventas <= 0 ---
-trx_md = trx_md[trx_md["ventas"] > 0]
+    # --- Proteger cálculo final ---
+    markdown_categoria = markdown_categoria[
+        markdown_categoria["ventas_brutas"] > 0
+    ]
 
-# --- Agrupar por categoría ---
-markdown_categoria = (
-    trx_md
-    .groupby("categoria", as_index=False)
-    .agg(
-        descuentos_totales=("descuentos", "sum"),
-        ventas_brutas=("ventas", "sum")
+    # --- Calcular Markdown ---
+    markdown_categoria["markdown"] = (
+        markdown_categoria["descuentos_totales"]
+        / markdown_categoria["ventas_brutas"]
     )
-)
 
-# --- Proteger cálculo final ---
-markdown_categoria = markdown_categoria[
-    markdown_categoria["ventas_brutas"] > 0
-]
+    # --- Markdown en porcentaje  ---
+    markdown_categoria["markdown_pct"] = (
+        markdown_categoria["markdown"] * 100
+    )
 
-# --- Calcular Markdown ---
-markdown_categoria["markdown"] = (
-    markdown_categoria["descuentos_totales"]
-    / markdown_categoria["ventas_brutas"]
+    return markdown_categoria
+
+
+##### GMROI y MARKDOWN en SQL (DuckDB, opcional) #####
+
+SQL_GMROI = """
+WITH margen AS (
+    SELECT
+        categoria,
+        SUM(
+            CAST(unidades_vendidas AS DOUBLE) * precio_unitario_venta
+            - CAST(unidades_vendidas AS DOUBLE) * costo_unitario
+        ) AS margen_bruto
+    FROM trx
+    WHERE categoria IS NOT NULL
+      AND unidades_vendidas IS NOT NULL
+      AND precio_unitario_venta IS NOT NULL
+      AND costo_unitario IS NOT NULL
+    GROUP BY categoria
+),
+inventario AS (
+    SELECT
+        categoria,
+        AVG(valor_inventario_costo) AS inventario_promedio_costo
+    FROM inv
+    WHERE categoria IS NOT NULL
+      AND valor_inventario_costo IS NOT NULL
+    GROUP BY categoria
 )
-
-# --- Markdown en porcentaje  ---
-markdown_categoria["markdown_pct"] = (
-    markdown_categoria["markdown"] * 100
+SELECT
+    m.categoria,
+    m.margen_bruto,
+    i.inventario_promedio_costo,
+    CASE WHEN i.inventario_promedio_costo = 0 OR isinf(m.margen_bruto / i.inventario_promedio_costo)
+         THEN NULL
+         ELSE m.margen_bruto / i.inventario_promedio_costo
+    END AS gmroi
+FROM margen m
+JOIN inventario i USING (categoria)
+"""
+
+SQL_MARKDOWN = """
+WITH filas AS (
+    SELECT
+        categoria,
+        CAST(unidades_vendidas AS DOUBLE) * monto_descuento_unitario AS descuentos,
+        CAST(unidades_vendidas AS DOUBLE) * precio_unitario_venta AS ventas
+    FROM trx
+    WHERE categoria IS NOT NULL
+      AND unidades_vendidas IS NOT NULL
+      AND precio_unitario_venta IS NOT NULL
+      AND monto_descuento_unitario IS NOT NULL
+      AND trim(categoria) <> ''
 )
+SELECT
+    categoria,
+    SUM(descuentos) AS descuentos_totales,
+    SUM(ventas) AS ventas_brutas
+FROM filas
+WHERE ventas > 0
+GROUP BY categoria
+HAVING SUM(ventas) > 0
+"""
+
+
+def _categoria_como_trx(df, categorias):
+    """
+    Deja el resultado SQL con la misma forma que el de pandas: categoria
+    Categorical (categorías de trx, orden alfabético), filas ordenadas e
+    índice 0..n-1.
+    """
+    df["categoria"] = pd.Categorical(df["categoria"], categories=categorias)
+    return df.sort_values("categoria").reset_index(drop=True)
+
+
+# Tamaños que acepta SET memory_limit de DuckDB ("2GB", "512 MiB", "1.5gb")
+TAMANIO_MEMORIA_RE = re.compile(r"\d+(?:\.\d+)?\s*(?:[KMGT]i?)?B", re.IGNORECASE)
+
+
+def calcular_kpis_duckdb(carpeta, memoria_max=None, directorio_temporal=None):
+    """
+    GMROI y Markdown por categoría como SQL sobre inv.parquet y trx.parquet
+    (tablas limpias del caché), con DuckDB: lectura columnar, multi-hilo y
+    con derrame a disco si la historia no cabe en memoria.
+
+    Entrega los mismos gmroi_categoria y markdown_categoria que
+    calcular_gmroi / calcular_markdown (salvo el orden de suma en punto flotante).
+
+    Parámetros
+    ----------
+    carpeta : str o Path
+        Carpeta con inv.parquet y trx.parquet
+    memoria_max : str, opcional
+        Límite de memoria de DuckDB (p. ej. "2GB")
+    directorio_temporal : str, opcional
+        Carpeta para el derrame a disco
 
-print(markdown_categoria)
+    Retorna
+    -------
+    tuple
+        (gmroi_categoria, markdown_categoria)
+    """
+    if not DUCKDB_DISPONIBLE:
+        raise ImportError("calcular_kpis_duckdb requiere duckdb (pip install duckdb)")
+
+    # SET no admite parámetros: los valores se validan antes de interpolarlos
+    if memoria_max is not None and not TAMANIO_MEMORIA_RE.fullmatch(str(memoria_max).strip()):
+        raise ValueError(f"memoria_max inválido: {memoria_max!r} (usar p. ej. '2GB' o '512MiB')")
+
+    carpeta = Path(carpeta)
+    con = duckdb.connect()
+    try:
+        if memoria_max is not None:
+            con.execute(f"SET memory_limit = '{str(memoria_max).strip()}'")
+        if directorio_temporal is not None:
+            con.execute(f"SET temp_directory = '{str(directorio_temporal).replace(chr(39), chr(39) * 2)}'")
+
+        con.read_parquet(str(carpeta / "inv.parquet")).create_view("inv")
+        con.read_parquet(str(carpeta / "trx.parquet")).create_view("trx")
+
+        categorias = sorted(
+            c for (c,) in con.execute(
+                "SELECT DISTINCT categoria FROM trx WHERE categoria IS NOT NULL"
+            ).fetchall()
+        )
+        gmroi_categoria = _categoria_como_trx(con.execute(SQL_GMROI).df(), categorias)
+        markdown_categoria = _categoria_como_trx(con.execute(SQL_MARKDOWN).df(), categorias)
+    finally:
+        con.close()
+
+    markdown_categoria["markdown"] = (
+        markdown_categoria["descuentos_totales"] / markdown_categoria["ventas_brutas"]
+    )
+    markdown_categoria["markdown_pct"] = markdown_categoria["markdown"] * 100
+
+    return gmroi_categoria, markdown_categoria
+
+
+################ Esquema compacto en memoria ####################
+
+def _fecha_compacta(fechas, fecha_como="dia_del_anio"):
+    """
+    Fechas limpias "dd-mm-aaaa" → datetime64 o día del año (Int16).
+    Se parsean solo los valores distintos; si ya son datetime64 (esquema
+    del pipeline) se usan tal cual.
+    """
+    if pd.api.types.is_datetime64_any_dtype(fechas):
+        valores = np.asarray(fechas, dtype="datetime64[ns]")
+        if fecha_como == "datetime":
+            return valores
+        return pd.Series(valores).dt.dayofyear.astype("Int16").array
+    codigos, unicos = pd.factorize(fechas)
+    parseadas = pd.to_datetime(pd.Series(unicos, dtype=object), format="%d-%m-%Y")
+    valores = np.append(parseadas.to_numpy("datetime64[ns]"), np.datetime64("NaT", "ns"))[codigos]
+    if fecha_como == "datetime":
+        return valores
+    return pd.Series(valores).dt.dayofyear.astype("Int16").array
+
+
+def compactar_tablas(inv, trx, prod, col_id="product_id", fecha_como="dia_del_anio", ids_como="codigo"):
+    """
+    Esquema compacto para inv, trx y prod (ya limpias y completadas):
+
+    - product_id → con ids_como="codigo", código int32 contra el maestro de
+      productos (-1 = faltante); el diccionario para decodificar es
+      `productos[codigo]`. Con ids_como="categoria", Categorical con los ids
+      de las tres tablas: mismos valores y nulos, pero guardados como código.
+    - categoria → Categorical con las mismas categorías en las tres tablas.
+    - fecha → día del año Int16 (o datetime64 con fecha_como="datetime").
+
+    El pipeline (cargar_tablas_limpias) usa ids_como="categoria" y
+    fecha_como="datetime", que todos los KPIs aceptan sin cambios.
+
+    Retorna
+    -------
+    tuple
+        (inv, trx, prod, productos)
+    """
+    if ids_como == "categoria":
+        productos = pd.Index(pd.unique(pd.concat([prod[col_id], inv[col_id], trx[col_id]]).dropna()))
+        tipo_producto = pd.CategoricalDtype(productos)
+    else:
+        productos = pd.Index(pd.unique(prod[col_id].dropna()))
+
+    categorias = set()
+    for df in (inv, trx, prod):
+        categorias.update(df["categoria"].dropna().astype(object).unique())
+    tipo_categoria = pd.CategoricalDtype(sorted(categorias))
+
+    def _compactar(df):
+        df = df.copy(deep=False)
+        if ids_como == "categoria":
+            df[col_id] = df[col_id].astype(object).astype(tipo_producto)
+        else:
+            df[col_id] = productos.get_indexer(df[col_id]).astype(np.int32)
+        df["categoria"] = df["categoria"].astype(object).astype(tipo_categoria)
+        if "fecha" in df:
+            df["fecha"] = _fecha_compacta(df["fecha"], fecha_como)
+        return df
+
+    return _compactar(inv), _compactar(trx), _compactar(prod), productos
+
+
+def esquema_ancho(df, col_id="product_id"):
+    """
+    Inverso del esquema del pipeline para comparar memoria: product_id y
+    fecha vuelven a strings Python ("dd-mm-aaaa"), como salen de la limpieza.
+    """
+    df = df.copy(deep=False)
+    df[col_id] = df[col_id].astype(object).where(df[col_id].notna(), None)
+    if "fecha" in df and pd.api.types.is_datetime64_any_dtype(df["fecha"]):
+        codigos, unicos = pd.factorize(df["fecha"])
+        df["fecha"] = np.append(pd.DatetimeIndex(unicos).strftime("%d-%m-%Y").to_numpy(object), None)[codigos]
+    return df
+
+
+def reporte_memoria(antes, despues):
+    """
+    Memoria (MB, deep=True) por tabla antes y después de compactar.
+    antes / despues: {nombre: DataFrame}
+    """
+    filas = []
+    for nombre in antes:
+        mb_antes = antes[nombre].memory_usage(deep=True).sum() / 2**20
+        mb_despues = despues[nombre].memory_usage(deep=True).sum() / 2**20
+        filas.append((nombre, len(antes[nombre]), mb_antes, mb_despues))
+    reporte = pd.DataFrame(filas, columns=["tabla", "filas", "mb_antes", "mb_despues"])
+    total = reporte[["filas", "mb_antes", "mb_despues"]].sum()
+    reporte.loc[len(reporte)] = ["total", total["filas"], total["mb_antes"], total["mb_despues"]]
+    reporte["filas"] = reporte["filas"].astype("int64")
+    reporte["reduccion"] = reporte["mb_antes"] / reporte["mb_despues"]
+    return reporte
+
+
+################ Cubo de KPIs (categoría × producto × mes) ####################
+
+DIMENSIONES_CUBO = ["categoria", "product_id", "mes"]
+
+
+def _mes_desde_fecha(fechas):
+    """
+    Mes (1-12) desde fechas limpias "dd-mm-aaaa"; se calcula sobre los
+    valores distintos y se reparte por códigos. Fecha faltante → <NA>.
+    También acepta las fechas del esquema compacto (datetime64 o día del año).
+    """
+    if pd.api.types.is_datetime64_any_dtype(fechas):
+        return pd.array(pd.Series(fechas).dt.month, dtype="Int8")
+    if pd.api.types.is_integer_dtype(fechas):
+        dias = pd.Series(fechas).astype("float64").to_numpy()
+        fechas_2025 = np.datetime64("2025-01-01") + (dias - 1).astype("timedelta64[D]")
+        return pd.array(pd.Series(fechas_2025).dt.month, dtype="Int8")
+
+    codigos, unicos = pd.factorize(fechas)
+    meses = pd.Series(unicos, dtype=object).str[3:5].astype("Int8").to_numpy()
+    return pd.array(np.append(meses, pd.NA)[codigos], dtype="Int8")
+
+
+class CuboKPI:
+    """
+    Cubo precalculado de GMROI y Markdown por categoría × producto × mes.
+
+    Se construye con un solo recorrido de trx y uno de inv: cada fila aporta
+    sus medidas (margen, descuentos, ventas, valor de inventario y conteos)
+    ya filtradas con las mismas reglas de calcular_gmroi/calcular_markdown,
+    y se agrupan en un solo groupby por tabla. Todas las medidas son sumas,
+    así que cualquier roll-up (categoría, mes, SKU o combinaciones) se
+    responde sumando celdas del cubo, sin volver a las filas.
+    """
+
+    def __init__(self, ventas, inventario):
+        self.ventas = ventas          # medidas de trx por celda
+        self.inventario = inventario  # medidas de inv por celda
+
+    @classmethod
+    def desde_tablas(cls, inv, trx):
+        # ----- TRX: un recorrido -----
+        unidades = trx["unidades_vendidas"].to_numpy(dtype=np.float64, na_value=np.nan)
+        precio = trx["precio_unitario_venta"].to_numpy(dtype=np.float64, na_value=np.nan)
+        costo = trx["costo_unitario"].to_numpy(dtype=np.float64, na_value=np.nan)
+        descuento = trx["monto_descuento_unitario"].to_numpy(dtype=np.float64, na_value=np.nan)
+        con_categoria = trx["categoria"].notna().to_numpy()
+
+        ventas = unidades * precio
+
+        # Mismos filtros que calcular_gmroi
+        valida_gmroi = con_categoria & ~np.isnan(unidades) & ~np.isnan(precio) & ~np.isnan(costo)
+
+        # Mismos filtros que calcular_markdown
+        valida_md = (
+            con_categoria
+            & ~np.isnan(unidades) & ~np.isnan(precio) & ~np.isnan(descuento)
+            & (trx["categoria"].astype(object).str.strip() != "").to_numpy()
+            & (ventas > 0)
+        )
+
+        medidas_trx = pd.DataFrame({
+            "categoria": trx["categoria"],
+            "product_id": trx["product_id"],
+            "mes": _mes_desde_fecha(trx["fecha"]),
+            "margen_bruto": np.where(valida_gmroi, ventas - unidades * costo, 0.0),
+            "filas_gmroi": valida_gmroi.astype(np.int64),
+            "descuentos": np.where(valida_md, unidades * descuento, 0.0),
+            "ventas": np.where(valida_md, ventas, 0.0),
+            "filas_md": valida_md.astype(np.int64),
+        })[con_categoria]
+
+        # ----- INV: un recorrido -----
+        valor = inv["valor_inventario_costo"].to_numpy(dtype=np.float64, na_value=np.nan)
+        valida_inv = inv["categoria"].notna().to_numpy() & ~np.isnan(valor)
+
+        medidas_inv = pd.DataFrame({
+            "categoria": inv["categoria"],
+            "product_id": inv["product_id"],
+            "mes": _mes_desde_fecha(inv["fecha"]),
+            "valor_inventario": np.where(valida_inv, valor, 0.0),
+            "filas_inv": valida_inv.astype(np.int64),
+        })[valida_inv]
+
+        agrupar = dict(observed=True, dropna=False, sort=True)
+        return cls(
+            medidas_trx.groupby(DIMENSIONES_CUBO, **agrupar).sum(),
+            medidas_inv.groupby(DIMENSIONES_CUBO, **agrupar).sum(),
+        )
+
+    @staticmethod
+    def _enrollar(celdas, dimensiones):
+        return celdas.groupby(level=list(dimensiones), observed=True, dropna=False, sort=True).sum()
+
+    def gmroi(self, dimensiones=("categoria",)):
+        """
+        GMROI para cualquier combinación de dimensiones del cubo
+        (mismas columnas que calcular_gmroi).
+        """
+        dimensiones = list(dimensiones)
+        margen = self._enrollar(self.ventas, dimensiones)
+        margen = margen.loc[margen["filas_gmroi"] > 0, ["margen_bruto"]]
+
+        inventario = self._enrollar(self.inventario, dimensiones)
+        inventario = inventario[inventario["filas_inv"] > 0]
+        promedio = (inventario["valor_inventario"] / inventario["filas_inv"]).rename(
+            "inventario_promedio_costo"
+        )
+
+        resultado = margen.join(promedio, how="inner").reset_index()
+        resultado["gmroi"] = resultado["margen_bruto"] / resultado["inventario_promedio_costo"]
+        return resultado.replace([np.inf, -np.inf], np.nan)
+
+    def markdown(self, dimensiones=("categoria",)):
+        """
+        Markdown para cualquier combinación de dimensiones del cubo
+        (mismas columnas que calcular_markdown).
+        """
+        dimensiones = list(dimensiones)
+        totales = self._enrollar(self.ventas, dimensiones)
+        totales = totales[(totales["filas_md"] > 0) & (totales["ventas"] > 0)]
+
+        resultado = (
+            totales[["descuentos", "ventas"]]
+            .rename(columns={"descuentos": "descuentos_totales", "ventas": "ventas_brutas"})
+            .reset_index()
+        )
+        resultado["markdown"] = resultado["descuentos_totales"] / resultado["ventas_brutas"]
+        resultado["markdown_pct"] = resultado["markdown"] * 100
+        return resultado
+
+    def alertas_markdown(self, dimensiones=("categoria",), umbral_markdown=0.20, cuantil_gmroi=0.75):
+        """
+        Pregunta 1.3: celdas con GMROI alto (sobre el cuantil indicado dentro
+        del mismo corte) que a la vez tienen Markdown > umbral_markdown.
+        """
+        dimensiones = list(dimensiones)
+        kpis = self.gmroi(dimensiones).merge(self.markdown(dimensiones), on=dimensiones, how="inner")
+        kpis["gmroi_alto"] = kpis["gmroi"] >= kpis["gmroi"].quantile(cuantil_gmroi)
+        kpis["markdown_alto"] = kpis["markdown"] > umbral_markdown
+        kpis["alerta"] = kpis["gmroi_alto"] & kpis["markdown_alto"]
+        return kpis
+
+
+################ Quiebres de stock (ceros censurados) ####################
+
+def _sku_dia(inv, columna, reduccion="max"):
+    """
+    Una fila por SKU-día de inv, ordenada por producto y día (lexsort sobre
+    códigos enteros), con la columna reducida entre los registros del mismo
+    día ("max" o "mean"). Se descartan filas sin producto, fecha o valor.
+
+    Retorna
+    -------
+    tuple
+        (ids, codigos, dias, valores, categoria_sku); dias como número de
+        día y categoria_sku con la primera categoría no nula de cada SKU
+    """
+    validas = (
+        inv["product_id"].notna() & inv["fecha"].notna() & inv[columna].notna()
+    ).to_numpy()
+    inv = inv.loc[validas]
+
+    codigos, ids = pd.factorize(inv["product_id"])
+    dias = _fecha_compacta(inv["fecha"], "datetime").astype("datetime64[D]").astype(np.int64)
+    valores = inv[columna].to_numpy(np.float64, na_value=np.nan)
+
+    orden = np.lexsort((dias, codigos))
+    codigos, dias, valores = codigos[orden], dias[orden], valores[orden]
+    nuevo_dia = np.r_[True, (codigos[1:] != codigos[:-1]) | (dias[1:] != dias[:-1])] if len(dias) else \
+        np.zeros(0, dtype=bool)
+    inicio = np.flatnonzero(nuevo_dia)
+
+    if not len(inicio):
+        reducidos = valores[:0]
+    elif reduccion == "mean":
+        reducidos = np.add.reduceat(valores, inicio) / np.diff(np.r_[inicio, len(valores)])
+    else:
+        reducidos = np.maximum.reduceat(valores, inicio)
+
+    categoria_sku = (
+        pd.Series(inv["categoria"].to_numpy()[orden])
+        .groupby(codigos, sort=True).first()
+        .reindex(range(len(ids)))
+        .to_numpy()
+    )
+    return ids, codigos[inicio], dias[inicio], reducidos, categoria_sku
+
+
+def panel_sku_dia(inv, trx):
+    """
+    Panel SKU × día ordenado por producto y fecha, con el stock del día
+    (máximo entre los registros del día: si alguno tiene stock, no hubo
+    quiebre) y las unidades vendidas ese día según trx.
+
+    Todo se trabaja con códigos enteros (producto) y números de día; las
+    ventas se asignan al panel con searchsorted sobre la clave ordenada.
+    Las ventas de SKU-días sin registro de inventario no entran al panel.
+    """
+    ids, codigos, dias, stock, categoria_sku = _sku_dia(inv, "cantidad_stock", "max")
+
+    dia_min = dias.min() if len(dias) else 0
+    ancho = (dias.max() - dia_min + 1) if len(dias) else 1
+    clave = codigos.astype(np.int64) * ancho + (dias - dia_min)
+    panel = pd.DataFrame({"codigo": codigos, "dia": dias, "stock": stock})
+
+    # Ventas por SKU-día
+    cod_trx = ids.get_indexer(trx["product_id"])
+    dias_trx = _fecha_compacta(trx["fecha"], "datetime").astype("datetime64[D]")
+    unidades = trx["unidades_vendidas"].to_numpy(np.float64, na_value=np.nan)
+    ok = (cod_trx >= 0) & ~np.isnat(dias_trx) & ~np.isnan(unidades)
+    clave_trx = cod_trx[ok].astype(np.int64) * ancho + (dias_trx[ok].astype(np.int64) - dia_min)
+    pos = np.searchsorted(clave, clave_trx)
+    pos = np.minimum(pos, max(len(clave) - 1, 0))
+    en_panel = (clave[pos] == clave_trx) if len(clave) else np.zeros(len(clave_trx), dtype=bool)
+    panel["ventas"] = np.bincount(pos[en_panel], weights=unidades[ok][en_panel], minlength=len(panel))
+
+    panel["product_id"] = ids[panel["codigo"]]
+    panel["categoria"] = categoria_sku[panel["codigo"]]
+    # strftime solo sobre los días distintos
+    cod_dia, dias_unicos = pd.factorize(panel["dia"])
+    panel["fecha"] = pd.to_datetime(dias_unicos, unit="D").strftime("%d-%m-%Y").to_numpy(object)[cod_dia]
+    return panel[["product_id", "fecha", "categoria", "codigo", "dia", "stock", "ventas"]]
+
+
+def detectar_quiebres(panel):
+    """
+    Rachas de stock 0 (run-length encoding vectorizado sobre el panel
+    ordenado): una racha se corta al cambiar de SKU, al haber stock o al
+    saltarse un día.
+
+    Retorna
+    -------
+    tuple
+        (panel con columnas quiebre y racha, tabla de rachas)
+    """
+    codigos = panel["codigo"].to_numpy()
+    dias = panel["dia"].to_numpy()
+    cero = panel["stock"].to_numpy() == 0
+
+    continua = np.r_[False, (codigos[1:] == codigos[:-1]) & (dias[1:] - dias[:-1] == 1) & cero[:-1]]
+    nueva = cero & ~continua
+    racha = np.where(cero, np.cumsum(nueva) - 1, -1)
+
+    panel = panel.assign(quiebre=cero, racha=racha)
+
+    en_racha = np.flatnonzero(cero)
+    ids_racha = racha[en_racha]
+    inicio = en_racha[np.r_[True, ids_racha[1:] != ids_racha[:-1]]] if len(en_racha) else en_racha
+    largo = np.bincount(ids_racha, minlength=len(inicio))
+    rachas = pd.DataFrame({
+        "product_id": panel["product_id"].to_numpy()[inicio],
+        "categoria": panel["categoria"].to_numpy()[inicio],
+        "inicio": panel["fecha"].to_numpy()[inicio],
+        "fin": panel["fecha"].to_numpy()[inicio + largo - 1],
+        "dias": largo,
+    })
+    return panel, rachas
+
+
+def demanda_sin_censura(panel):
+    """
+    Marca como censurados los días con quiebre y venta 0, y estima la
+    demanda de esos días con la venta diaria promedio del SKU en días no
+    censurados (si el SKU no tiene ninguno, la de su categoría).
+    """
+    codigos = panel["codigo"].to_numpy()
+    ventas = panel["ventas"].to_numpy()
+    censurado = panel["quiebre"].to_numpy() & (ventas == 0)
+    observado = ~censurado
+
+    n_sku = codigos.max() + 1 if len(codigos) else 0
+    dias_obs = np.bincount(codigos, weights=observado, minlength=n_sku)
+    ventas_obs = np.bincount(codigos, weights=ventas * observado, minlength=n_sku)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        tasa_sku = ventas_obs / dias_obs
+
+    cod_cat, _ = pd.factorize(panel["categoria"])
+    n_cat = cod_cat.max() + 1 if len(cod_cat) else 0
+    cat_ok = cod_cat >= 0
+    dias_cat = np.bincount(cod_cat[cat_ok], weights=observado[cat_ok], minlength=n_cat)
+    ventas_cat = np.bincount(cod_cat[cat_ok], weights=(ventas * observado)[cat_ok], minlength=n_cat)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        tasa_cat = np.append(ventas_cat / dias_cat, np.nan)
+
+    tasa = tasa_sku[codigos]
+    tasa = np.where(np.isnan(tasa), tasa_cat[cod_cat], tasa)
+
+    return panel.assign(
+        censurado=censurado,
+        demanda_no_censurada=np.where(censurado, np.nan_to_num(tasa), ventas),
+    )
+
+
+def estimar_demanda_sin_censura(inv, trx):
+    """
+    Panel SKU-día con quiebres, ceros censurados y demanda no censurada,
+    más la tabla de rachas de quiebre.
+    """
+    panel = panel_sku_dia(inv, trx)
+    panel, rachas = detectar_quiebres(panel)
+    panel = demanda_sin_censura(panel)
+    return panel, rachas
+
+
+def calcular_gmroi_sin_censura(inv, trx, panel):
+    """
+    GMROI por categoría usando la demanda no censurada: al margen bruto
+    observado se suma el margen de la demanda perdida en días censurados
+    (unidades estimadas × margen unitario promedio del SKU en trx).
+    """
+    gmroi_categoria = calcular_gmroi(inv, trx)
+
+    trx_ok = trx.dropna(subset=["product_id", "unidades_vendidas", "precio_unitario_venta", "costo_unitario"])
+    unidades = trx_ok["unidades_vendidas"].to_numpy(np.float64)
+    margen = unidades * (trx_ok["precio_unitario_venta"] - trx_ok["costo_unitario"]).to_numpy()
+    por_sku = pd.DataFrame({"product_id": trx_ok["product_id"].to_numpy(), "margen": margen, "unidades": unidades})
+    por_sku = por_sku.groupby("product_id").sum()
+    margen_unitario = (por_sku["margen"] / por_sku["unidades"]).replace([np.inf, -np.inf], np.nan)
+
+    perdida = panel.loc[panel["censurado"], ["product_id", "categoria", "demanda_no_censurada"]]
+    margen_perdido = (
+        perdida["demanda_no_censurada"].to_numpy()
+        * margen_unitario.reindex(perdida["product_id"]).fillna(0).to_numpy()
+    )
+    margen_perdido = (
+        pd.Series(margen_perdido, index=perdida["categoria"].to_numpy())
+        .groupby(level=0).sum()
+    )
+
+    gmroi_categoria["margen_perdido"] = (
+        gmroi_categoria["categoria"].astype(object).map(margen_perdido).fillna(0.0).to_numpy()
+    )
+    gmroi_categoria["margen_bruto_sin_censura"] = (
+        gmroi_categoria["margen_bruto"] + gmroi_categoria["margen_perdido"]
+    )
+    gmroi_categoria["gmroi_sin_censura"] = (
+        gmroi_categoria["margen_bruto_sin_censura"]
+        / gmroi_categoria["inventario_promedio_costo"]
+    ).replace([np.inf, -np.inf], np.nan)
+    return gmroi_categoria
+
+
+################ Inventario promedio ponderado en el tiempo ####################
+
+def serie_inventario_diaria(inv, limite_relleno=7, columna="valor_inventario_costo"):
+    """
+    Serie diaria por SKU, desde su primer hasta su último registro: los
+    snapshots duplicados de un día se promedian y los días sin registro se
+    rellenan con el último valor conocido hasta limite_relleno días (más
+    allá quedan NaN y no cuentan en los promedios).
+
+    La grilla de todos los SKUs se arma de una vez (segmentos contiguos por
+    SKU) y el relleno es un máximo acumulado de índices, sin loops por SKU.
+
+    Retorna
+    -------
+    pd.DataFrame
+        codigo, product_id, categoria, dia (número de día) y valor
+    """
+    ids, codigos, dias, valores, categoria_sku = _sku_dia(inv, columna, "mean")
+
+    if not len(dias):
+        return pd.DataFrame({"codigo": codigos, "product_id": ids[:0], "categoria": categoria_sku[:0],
+                             "dia": dias, "valor": valores})
+
+    # Primer y último día de cada SKU → largo de su segmento en la grilla
+    n_sku = len(ids)
+    primero = np.full(n_sku, np.iinfo(np.int64).max)
+    ultimo = np.full(n_sku, np.iinfo(np.int64).min)
+    np.minimum.at(primero, codigos, dias)
+    np.maximum.at(ultimo, codigos, dias)
+    largo = np.where(ultimo >= primero, ultimo - primero + 1, 0)
+    desplazamiento = np.r_[0, np.cumsum(largo)[:-1]]
+
+    codigo_grilla = np.repeat(np.arange(n_sku), largo)
+    dia_grilla = primero[codigo_grilla] + (np.arange(largo.sum()) - desplazamiento[codigo_grilla])
+
+    # Valores observados en su posición; el resto se rellena hacia adelante
+    # (el primer día de cada segmento siempre es observado)
+    posicion = desplazamiento[codigos] + (dias - primero[codigos])
+    ultimo_observado = np.full(len(dia_grilla), -1)
+    ultimo_observado[posicion] = posicion
+    np.maximum.accumulate(ultimo_observado, out=ultimo_observado)
+
+    valor_grilla = np.full(len(dia_grilla), np.nan)
+    valor_grilla[posicion] = valores
+    valor_grilla = valor_grilla[ultimo_observado]
+    valor_grilla[np.arange(len(dia_grilla)) - ultimo_observado > limite_relleno] = np.nan
+
+    return pd.DataFrame({
+        "codigo": codigo_grilla,
+        "product_id": ids[codigo_grilla],
+        "categoria": categoria_sku[codigo_grilla],
+        "dia": dia_grilla,
+        "valor": valor_grilla,
+    })
+
+
+def _inventario_categoria_dia(serie):
+    """
+    Matriz categoría × día con el inventario total de la categoría (suma de
+    sus SKUs con valor conocido) y cuántos SKUs aportaron ese día.
+    """
+    cod_cat, categorias = pd.factorize(serie["categoria"], sort=True)
+    dias = serie["dia"].to_numpy()
+    valores = serie["valor"].to_numpy()
+    dia_min = dias.min() if len(dias) else 0
+    n_dias = (dias.max() - dia_min + 1) if len(dias) else 0
+
+    ok = (cod_cat >= 0) & ~np.isnan(valores)
+    clave = cod_cat[ok].astype(np.int64) * n_dias + (dias[ok] - dia_min)
+    total = np.bincount(clave, weights=valores[ok], minlength=len(categorias) * n_dias)
+    skus = np.bincount(clave, minlength=len(categorias) * n_dias)
+
+    fechas = pd.to_datetime(np.arange(dia_min, dia_min + n_dias), unit="D")
+    return (
+        pd.DataFrame(total.reshape(len(categorias), n_dias).T, index=fechas, columns=categorias),
+        pd.DataFrame(skus.reshape(len(categorias), n_dias).T, index=fechas, columns=categorias),
+    )
+
+
+def inventario_promedio_ponderado(serie, periodo=None):
+    """
+    Inventario promedio a costo por SKU y categoría, ponderado en el
+    tiempo: cada día pesa lo mismo, sin importar cuántos snapshots tuvo.
+    Cada día se toma el inventario promedio de los SKUs de la categoría con
+    valor conocido (total del día / SKUs con datos) y se promedian los días
+    con datos. Queda en la misma escala que el inventario promedio de
+    calcular_gmroi (promedio por snapshot de SKU), y los SKUs sin datos más
+    allá de limite_relleno no bajan el promedio.
+
+    Parámetros
+    ----------
+    serie : pd.DataFrame
+        Salida de serie_inventario_diaria
+    periodo : str, opcional
+        Frecuencia de pandas para cortar por período ("M" mes, "Q"
+        trimestre, ...). None = toda la historia.
+
+    Retorna
+    -------
+    pd.DataFrame
+        categoria, [periodo], inventario_promedio_costo, skus_promedio
+        (SKUs con datos por día) y dias
+    """
+    total, skus = _inventario_categoria_dia(serie)
+    con_datos = skus > 0
+    por_sku = (total / skus).where(con_datos)
+    skus = skus.where(con_datos)
+
+    if periodo is None:
+        resultado = pd.DataFrame({
+            "inventario_promedio_costo": por_sku.mean(),
+            "skus_promedio": skus.mean(),
+            "dias": con_datos.sum(),
+        })
+        return resultado.rename_axis("categoria").reset_index()
+
+    grupos = total.index.to_period(periodo)
+    resultado = pd.concat({
+        "inventario_promedio_costo": por_sku.groupby(grupos).mean().stack(),
+        "skus_promedio": skus.groupby(grupos).mean().stack(),
+        "dias": con_datos.groupby(grupos).sum().stack(),
+    }, axis=1)
+    resultado.index.names = ["periodo", "categoria"]
+    return resultado.reset_index()[["categoria", "periodo", "inventario_promedio_costo", "skus_promedio", "dias"]]
+
+
+def inventario_movil(serie, ventanas=(30, 90, 365)):
+    """
+    Inventario diario promedio por SKU de cada categoría (total del día /
+    SKUs con datos), los SKUs con datos y los promedios móviles del
+    inventario (ventanas en días calendario; los días sin datos no cuentan).
+    """
+    total, skus = _inventario_categoria_dia(serie)
+    por_sku = (total / skus).where(skus > 0)
+
+    columnas = {"inventario": por_sku.stack(), "skus": skus.where(skus > 0).stack()}
+    for ventana in ventanas:
+        columnas[f"media_{ventana}d"] = por_sku.rolling(ventana, min_periods=1).mean().stack()
+    resultado = pd.concat(columnas, axis=1)
+    resultado.index.names = ["fecha", "categoria"]
+    return resultado.reset_index()
+
+
+def calcular_gmroi_ponderado(inv, trx, limite_relleno=7):
+    """
+    GMROI por categoría con el inventario promedio por SKU ponderado en el
+    tiempo (mismo margen bruto que calcular_gmroi y denominador en la misma
+    escala, así los dos GMROI son comparables).
+    """
+    margen = calcular_gmroi(inv, trx)[["categoria", "margen_bruto"]]
+    inventario = inventario_promedio_ponderado(serie_inventario_diaria(inv, limite_relleno))
+
+    gmroi_categoria = margen.merge(
+        inventario[["categoria", "inventario_promedio_costo"]].astype({"categoria": margen["categoria"].dtype}),
+        on="categoria", how="inner",
+    )
+    gmroi_categoria["gmroi"] = (
+        gmroi_categoria["margen_bruto"] / gmroi_categoria["inventario_promedio_costo"]
+    ).replace([np.inf, -np.inf], np.nan)
+    return gmroi_categoria
+
+
+################ Sustitución de SKUs ####################
+
+def _tokens_sku(nombres):
+    """
+    Separa sku_name ("CON-DarkGoldenRod-896") en prefijo de categoría
+    normalizado ("CON"), nombre comparable ("dark golden rod 896") y
+    tokens del nombre ({"darkgoldenrod", "dark", "golden", "rod"}).
+    Se trabaja sobre los nombres distintos.
+    """
+    codigos, unicos = pd.factorize(pd.Series(nombres, dtype=object).fillna(""))
+    partes = pd.Series(unicos, dtype=object).str.split("-", n=1, expand=True).reindex(columns=[0, 1])
+    cod_prefijo, prefijos = pd.factorize(partes[0].fillna(""))
+    prefijo = pd.Series(
+        np.array([_normalizar_texto_categoria(x).upper().strip() for x in prefijos], dtype=object)[cod_prefijo]
+    )
+    resto = partes[1].fillna("")
+    palabras = resto.str.replace(r"([a-z])([A-Z])", r"\1 \2", regex=True).str.replace("-", " ").str.lower()
+
+    tokens = [
+        {t for t in p.split() if not t.isdigit()} | ({c.lower()} if c else set())
+        for p, c in zip(palabras, resto.str.split("-").str[0].fillna(""))
+    ]
+    return (
+        prefijo.to_numpy(object)[codigos],
+        palabras.to_numpy(object)[codigos],
+        [tokens[c] for c in codigos],
+    )
+
+
+# Formatos que conviven fila a fila en la fecha cruda de transacciones
+FORMATOS_FECHA_VENTA = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y")
+
+
+def fecha_por_valor(fechas, formatos=FORMATOS_FECHA_VENTA):
+    """
+    Parsea la fecha cruda valor a valor, probando cada formato en orden.
+
+    limpiar_fecha infiere un solo formato por columna (el del primer valor):
+    con formatos mezclados el resto queda vacío y se rellena con la fila
+    anterior, lo que basta para KPIs por categoría pero no para fechar las
+    ventas de cada SKU. Se aplican las mismas reglas de limpieza (sin letras,
+    solo año → 1 de enero, año 2025, vacías con la fecha anterior) sobre los
+    textos distintos.
+
+    Retorna
+    -------
+    np.ndarray
+        Fechas datetime64[ns] por fila
+    """
+    codigos, limpios = _textos_fecha_limpios(fechas)
+    unicas = pd.Series(pd.NaT, index=limpios.index, dtype="datetime64[ns]")
+    for formato in formatos:
+        unicas = unicas.fillna(pd.to_datetime(limpios, format=formato, errors="coerce"))
+
+    solo_anio = limpios.str.fullmatch(r"\d{4}").fillna(False).to_numpy(bool)
+    valores = np.where(solo_anio, np.datetime64("2025-01-01", "ns"), unicas.to_numpy("datetime64[ns]"))
+    valores = np.where(np.isnat(valores), valores, _forzar_anio(valores))
+    return _ffill_datetime64(np.append(valores, np.datetime64("NaT", "ns"))[codigos])
+
+
+def ventas_fechadas(trx, ruta_datos="data"):
+    """
+    trx con la fecha de cada venta reparseada con fecha_por_valor desde
+    transacciones_ventas.csv (la limpieza conserva filas y orden del CSV).
+    Es la entrada de fechas de IndiceSustitucion.
+    """
+    crudas = pd.read_csv(f"{ruta_datos}/transacciones_ventas.csv", usecols=["fecha"], dtype=str)["fecha"]
+    if len(crudas) != len(trx):
+        raise ValueError(f"trx tiene {len(trx)} filas y {ruta_datos}/transacciones_ventas.csv {len(crudas)}")
+    return trx.assign(fecha=fecha_por_valor(crudas))
+
+
+def cambio_de_ritmo(codigos, dias, n_skus):
+    """
+    Cambio de ritmo de ventas más marcado de cada SKU: el día que mejor
+    separa sus ventas en dos tasas de Poisson (antes / después) dentro del
+    período observado. Se evalúan los cortes entre ventas consecutivas de
+    cada SKU, todos a la vez sobre los días ordenados por SKU.
+
+    Retorna
+    -------
+    tuple
+        (dia_cambio, ganancia, ritmo, ventas) por código de SKU: ganancia
+        es el log-cociente de verosimilitud contra una tasa única y ritmo la
+        tasa después / antes del corte (NaN si el SKU tiene menos de 2 ventas)
+    """
+    dia_cambio, ganancia, ritmo = (np.full(n_skus, np.nan) for _ in range(3))
+    ventas = np.bincount(codigos, minlength=n_skus)
+    if not len(dias):
+        return dia_cambio, ganancia, ritmo, ventas
+
+    orden = np.lexsort((dias, codigos))
+    codigos, dias = codigos[orden], dias[orden]
+    inicio, fin = dias.min(), dias.max() + 1
+
+    n = ventas[codigos].astype(np.float64)
+    k = np.arange(len(codigos)) - np.r_[0, np.cumsum(ventas)[:-1]][codigos] + 1.0
+    mismo = np.r_[codigos[1:] == codigos[:-1], False]
+    corte = (dias + np.r_[dias[1:], dias[-1]]) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        antes = k / (corte - inicio)
+        despues = (n - k) / (fin - corte)
+        log_vero = k * np.log(antes) + (n - k) * np.log(despues) - n * np.log(n / (fin - inicio))
+    log_vero = np.where(mismo & np.isfinite(log_vero), log_vero, -np.inf)
+
+    # Mejor corte por SKU: primero de cada grupo ordenado por ganancia
+    orden = np.lexsort((-log_vero, codigos))
+    mejor = orden[np.r_[True, codigos[orden][1:] != codigos[orden][:-1]]]
+    mejor = mejor[np.isfinite(log_vero[mejor])]
+    sku = codigos[mejor]
+    dia_cambio[sku] = corte[mejor]
+    ganancia[sku] = log_vero[mejor]
+    ritmo[sku] = despues[mejor] / antes[mejor]
+    return dia_cambio, ganancia, ritmo, ventas
+
+
+class IndiceSustitucion:
+    """
+    Índice de candidatos a sustitución de SKUs.
+
+    Los SKUs se agrupan en bloques por prefijo de categoría de sku_name y
+    token del nombre. Dentro de cada bloque se ordenan por inicio de ventas,
+    y para cada SKU antiguo se toman como candidatos los que empiezan a
+    vender cerca de donde él termina (una ventana por búsqueda binaria), a
+    lo más max_candidatos por bloque, los más cercanos a brecha 0. Así el
+    número de pares crece linealmente con los SKUs, aun con tokens comunes,
+    y se evita la comparación de todos contra todos.
+
+    La cronología no usa la primera y la última venta, que el ruido de las
+    fechas limpias mueve a los extremos (fechas de solo año → 1 de enero,
+    vacías rellenadas con la fila anterior), sino el cambio de ritmo de cada
+    SKU (ver cambio_de_ritmo): si sus ventas caen a max_ritmo veces o menos,
+    ahí terminan; si suben 1/max_ritmo veces o más, ahí empiezan. Un SKU sin
+    cambio claro (ganancia < min_ganancia) vende todo el período, y uno con
+    menos de min_ventas ventas no entra. Las fechas de trx deben venir de
+    ventas_fechadas: las de limpiar_fecha pierden los formatos mezclados.
+    """
+
+    def __init__(self, prod, trx, max_candidatos=20, min_ventas=5, min_ganancia=3.0, max_ritmo=0.5):
+        prod = prod.dropna(subset=["product_id"]).drop_duplicates("product_id")
+        self.ids = pd.Index(prod["product_id"].to_numpy())
+        self.prefijo, self.nombre, tokens = _tokens_sku(prod["sku_name"])
+        self.max_candidatos = max_candidatos
+
+        # Inicio y fin de ventas por SKU (número de día; NaN si no entra)
+        dias = _fecha_compacta(trx["fecha"], "datetime").astype("datetime64[D]")
+        codigos = self.ids.get_indexer(trx["product_id"])
+        ok = (codigos >= 0) & ~np.isnat(dias)
+        dias = dias[ok].astype(np.int64).astype(np.float64)
+        dia_cambio, ganancia, ritmo, ventas = cambio_de_ritmo(codigos[ok], dias, len(self.ids))
+        claro = ganancia >= min_ganancia
+        con_ventas = ventas >= min_ventas
+        inicio, fin = (dias.min(), dias.max() + 1) if len(dias) else (np.nan, np.nan)
+        empieza = claro & (ritmo >= 1 / max_ritmo)
+        termina = claro & (ritmo <= max_ritmo)
+        self.inicio_ventas = np.where(con_ventas, np.where(empieza, dia_cambio, inicio), np.nan)
+        self.fin_ventas = np.where(con_ventas, np.where(termina, dia_cambio, fin), np.nan)
+
+        # Bloques (prefijo|token) → SKUs con ventas, ordenados por bloque e
+        # inicio de ventas. Los bloques de un solo SKU no generan pares.
+        largos = [len(t) for t in tokens]
+        postings = pd.DataFrame({
+            "clave": [f"{p}|{t}" for p, ts in zip(self.prefijo, tokens) for t in ts],
+            "sku": np.repeat(np.arange(len(self.ids)), largos),
+        })
+        postings = postings[~np.isnan(self.inicio_ventas[postings["sku"].to_numpy()])]
+        postings = postings[postings.groupby("clave")["sku"].transform("size") > 1]
+        self.bloque = pd.factorize(postings["clave"])[0]
+        self.sku_bloque = postings["sku"].to_numpy()
+        orden = np.lexsort((self.inicio_ventas[self.sku_bloque], self.bloque))
+        self.bloque, self.sku_bloque = self.bloque[orden], self.sku_bloque[orden]
+
+    def candidatos(self, max_brecha=30, solape=7):
+        """
+        Pares (antiguo, nuevo) que comparten bloque, con
+        -solape <= inicio de ventas del nuevo - fin de ventas del antiguo <= max_brecha
+        (en días). Incluye la similitud de nombre (0-100) y la brecha.
+        """
+        antiguo, inicio = self.sku_bloque, self.inicio_ventas[self.sku_bloque]
+        if len(antiguo):
+            # Clave ordenada bloque + inicio: el desplazamiento por bloque
+            # supera el rango de días, así una ventana no cruza de bloque
+            base = np.nanmin(inicio) - solape - 1
+            ancho = np.nanmax(self.fin_ventas) - base + max_brecha + 1
+            orden = self.bloque * ancho + (inicio - base)
+            fin = self.bloque * ancho + (self.fin_ventas[antiguo] - base)
+            desde = np.searchsorted(orden, fin - solape, "left")
+            hasta = np.searchsorted(orden, fin + max_brecha, "right")
+
+            # Ventana de a lo más max_candidatos alrededor de brecha 0
+            centro = np.searchsorted(orden, fin, "left")
+            desde = np.clip(centro - self.max_candidatos // 2, desde, np.maximum(hasta - self.max_candidatos, desde))
+            cuantos = np.minimum(hasta - desde, self.max_candidatos)
+            posicion = np.repeat(desde - np.cumsum(cuantos) + cuantos, cuantos) + np.arange(cuantos.sum())
+            antiguo, nuevo = np.repeat(antiguo, cuantos), self.sku_bloque[posicion]
+        else:
+            nuevo = antiguo
+
+        # El nuevo además debe empezar después que el antiguo; un par puede
+        # compartir varios bloques: se deja una vez
+        valido = (antiguo != nuevo) & (self.inicio_ventas[nuevo] > self.inicio_ventas[antiguo])
+        clave = np.unique(antiguo[valido].astype(np.int64) * len(self.ids) + nuevo[valido])
+        antiguo, nuevo = clave // len(self.ids), clave % len(self.ids)
+        brecha = self.inicio_ventas[nuevo] - self.fin_ventas[antiguo]
+
+        similitud = process.cpdist(
+            self.nombre[antiguo], self.nombre[nuevo],
+            scorer=fuzz.token_set_ratio, dtype=np.float64, workers=-1,
+        ) if len(antiguo) else np.array([], dtype=np.float64)
+
+        return pd.DataFrame({
+            "product_id_antiguo": self.ids[antiguo],
+            "product_id_nuevo": self.ids[nuevo],
+            "similitud": similitud,
+            "brecha_dias": brecha,
+        })
+
+    def mapa(self, umbral=0.6, peso_nombre=0.6, max_brecha=30, solape=7):
+        """
+        Mapa de sustitución antiguo → nuevo. Cada par se puntúa como
+        peso_nombre * similitud + (1 - peso_nombre) * cercanía temporal
+        (1 con brecha 0, 0 con brecha max_brecha o solape total). Cada SKU
+        antiguo se queda con su mejor nuevo y cada nuevo con un solo antiguo.
+        """
+        pares = self.candidatos(max_brecha, solape)
+        cercania = np.clip(
+            1 - np.abs(pares["brecha_dias"]) / np.where(pares["brecha_dias"] < 0, solape, max_brecha), 0, 1
+        )
+        pares["score"] = peso_nombre * pares["similitud"] / 100 + (1 - peso_nombre) * cercania
+        pares = pares[pares["score"] >= umbral].sort_values("score", ascending=False, kind="stable")
+        pares = pares.drop_duplicates("product_id_antiguo").drop_duplicates("product_id_nuevo")
+        return pares.reset_index(drop=True)
+
+
+def linea_de_producto(ids, mapa):
+    """
+    Une historias: cada product_id se lleva al último SKU de su cadena de
+    sustituciones (A → B → C queda en C). Se recorre por saltos sobre el
+    mapa completo, sin ciclos infinitos.
+    """
+    siguiente = pd.Series(
+        mapa["product_id_nuevo"].to_numpy(), index=mapa["product_id_antiguo"].to_numpy()
+    )
+    linea = pd.Series(pd.Series(ids).to_numpy(), dtype=object)
+    for _ in range(len(siguiente)):
+        paso = linea.map(siguiente)
+        cambia = paso.notna() & (paso != linea)
+        if not cambia.any():
+            break
+        linea = linea.where(~cambia, paso)
+    return linea.to_numpy()
+
+
+################ Limpieza paralela por particiones ####################
+
+# Estado de cada proceso del pool: se recibe una sola vez en el inicializador
+_ESTADO_PROCESO = {}
+
+
+def _iniciar_proceso_limpieza(alias, alias_tabla, threshold, formatos):
+    """
+    Inicializador del pool: deja en el proceso el caché de normalización,
+    una copia de la tabla de alias (sin archivo) y los formatos de fecha.
+    Se recuerdan las claves ya conocidas de ambos para devolver solo las nuevas.
+    """
+    tabla_alias = TablaAliasCategorias(categorias_reales)
+    tabla_alias.alias.update(alias_tabla)
+    _ESTADO_PROCESO.update(
+        alias=dict(alias),
+        alias_conocidos=set(alias),
+        tabla_alias=tabla_alias,
+        conocidos=set(alias_tabla),
+        threshold=threshold,
+        formatos=formatos,
+    )
+
+
+def _limpiar_particion(nombre, df, numericas):
+    """
+    Etapas de limpiar_tablas sobre un rango de filas. Las columnas numéricas
+    quedan en float64 (el tipo compacto se decide sobre la tabla completa).
+
+    Retorna la partición limpia, los alias nuevos del caché de normalización
+    y de la tabla de alias, y los contadores de esta tarea.
+    """
+    tabla_alias = _ESTADO_PROCESO["tabla_alias"]
+
+    if "fecha" in df:
+        df = limpiar_fecha(df, "fecha", {"formatos": _ESTADO_PROCESO["formatos"][nombre]})
+    df = normalizar_categoria(df, "categoria", _ESTADO_PROCESO["alias"])
+    df = match_categoria_con_reales(
+        df, "categoria", categorias_reales,
+        threshold=_ESTADO_PROCESO["threshold"], tabla_alias=tabla_alias,
+    )
+    df = limpiar_cols_num(df, numericas, compactar=False)
+
+    alias = _ESTADO_PROCESO["alias"]
+    alias_nuevos = {v: alias[v] for v in alias if v not in _ESTADO_PROCESO["alias_conocidos"]}
+    _ESTADO_PROCESO["alias_conocidos"].update(alias_nuevos)
+    nuevos = {v: tabla_alias.alias[v] for v in tabla_alias.alias if v not in _ESTADO_PROCESO["conocidos"]}
+    _ESTADO_PROCESO["conocidos"].update(nuevos)
+    contadores = (tabla_alias.consultados, tabla_alias.aciertos, tabla_alias.puntuados, tabla_alias.bajo_umbral)
+    tabla_alias.consultados = tabla_alias.aciertos = tabla_alias.puntuados = tabla_alias.bajo_umbral = 0
+
+    return nombre, df, alias_nuevos, nuevos, contadores
+
+
+def _formatos_por_particiones(columna, particiones):
+    """
+    Formatos de fecha de la columna completa (regla del primer valor no nulo),
+    revisando las particiones en orden hasta encontrar uno.
+    """
+    for inicio, fin in particiones:
+        _, limpios = _textos_fecha_limpios(columna.iloc[inicio:fin])
+        formatos = detectar_formatos_fecha(limpios)
+        if formatos != (None, None):
+            return formatos
+    return None, None
+
+
+def _unir_particiones(partes, numericas):
+    """
+    Une las particiones de una tabla: categorías con la unión ordenada,
+    tipos compactos decididos sobre la columna completa y relleno de las
+    fechas vacías al inicio de cada partición con la última fecha de la anterior.
+    """
+    df = pd.concat(partes)
+    df["categoria"] = pd.api.types.union_categoricals(
+        [p["categoria"] for p in partes], sort_categories=True
+    )
+    for c in numericas:
+        df[c] = _tipo_compacto(df[c].to_numpy(np.float64))
+    if "fecha" in df:
+        # Dentro de cada partición ya se rellenó: solo quedan vacías las filas iniciales
+        df["fecha"] = df["fecha"].ffill()
+    return df
+
+
+def limpiar_tablas_paralelo(inv, trx, prod, procesos=4, alias=None, tabla_alias=None,
+                            threshold=UMBRAL_CATEGORIA, particiones_por_proceso=2):
+    """
+    Misma salida que limpiar_tablas, pero inv y trx se dividen por rangos de
+    filas y se limpian en un pool de procesos. prod (pequeña) se limpia en el
+    proceso principal.
+
+    El estado compartido (caché de alias, tabla de alias, formatos de fecha
+    de cada tabla) se entrega una sola vez por proceso en el inicializador;
+    los alias nuevos que encuentra cada proceso vuelven con su partición y
+    se agregan a alias y a tabla_alias, como en limpiar_tablas.
+
+    Parámetros
+    ----------
+    procesos : int
+        Número de procesos del pool
+    particiones_por_proceso : int
+        Particiones por tabla y proceso (más de una reparte mejor la carga)
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if alias is None:
+        alias = {}
+    if tabla_alias is None:
+        tabla_alias = TablaAliasCategorias(categorias_reales)
+
+    numericas = {"inv": NUMERICAS_INV, "trx": NUMERICAS_TRX}
+    tablas = {"inv": inv, "trx": trx}
+    rangos = {}
+    formatos = {}
+    for nombre, df in tablas.items():
+        cortes = np.linspace(0, len(df), procesos * particiones_por_proceso + 1).astype(int)
+        rangos[nombre] = [(a, b) for a, b in zip(cortes[:-1], cortes[1:]) if b > a]
+        formatos[nombre] = _formatos_por_particiones(df["fecha"], rangos[nombre])
+
+    tareas = [
+        (nombre, tablas[nombre].iloc[a:b], numericas[nombre])
+        for nombre in tablas
+        for a, b in rangos[nombre]
+    ]
+
+    partes = {nombre: [] for nombre in tablas}
+    with ProcessPoolExecutor(
+        max_workers=procesos,
+        initializer=_iniciar_proceso_limpieza,
+        initargs=(alias, tabla_alias.alias, threshold, formatos),
+    ) as pool:
+        # map conserva el orden de las tareas (y por ende de las filas)
+        for nombre, df, alias_nuevos, nuevos, contadores in pool.map(_limpiar_particion, *zip(*tareas)):
+            partes[nombre].append(df)
+            alias.update(alias_nuevos)
+            tabla_alias.alias.update(nuevos)
+            tabla_alias.consultados += contadores[0]
+            tabla_alias.aciertos += contadores[1]
+            tabla_alias.puntuados += contadores[2]
+            tabla_alias.bajo_umbral += contadores[3]
+
+    tabla_alias.guardar()
+
+    inv = _unir_particiones(partes["inv"], numericas["inv"])
+    trx = _unir_particiones(partes["trx"], numericas["trx"])
+
+    prod = normalizar_categoria(prod, "categoria", alias)
+    prod = match_categoria_con_reales(prod, "categoria", categorias_reales, threshold=threshold, tabla_alias=tabla_alias)
+    prod = limpiar_cols_num(prod, ["costo_unitario", "precio_lista"])
+
+    return inv, trx, prod
+
+
+################ Caché Parquet de tablas limpias ####################
+
+# Subir cuando cambie la lógica de limpieza/completado para invalidar el caché
+VERSION_LIMPIEZA = 2
+
+ARCHIVOS_FUENTE = ["inventario_diario.csv", "maestro_productos.csv", "transacciones_ventas.csv"]
+
+
+def huella_fuentes(ruta_datos, parametros, bloque=1 << 20):
+    """
+    Hash (sha256) del contenido de los CSV fuente más los parámetros de
+    limpieza. Si cualquiera cambia, cambia la clave del caché.
+    """
+    h = hashlib.sha256()
+    for nombre in ARCHIVOS_FUENTE:
+        h.update(nombre.encode("utf-8"))
+        with open(Path(ruta_datos) / nombre, "rb") as f:
+            for parte in iter(lambda: f.read(bloque), b""):
+                h.update(parte)
+    h.update(repr(sorted(parametros.items())).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def carpeta_tablas_limpias(ruta_datos="data", threshold=UMBRAL_CATEGORIA):
+    """
+    Carpeta del caché Parquet para las fuentes y parámetros actuales.
+    """
+    parametros = {
+        "threshold": threshold,
+        "categorias_reales": tuple(categorias_reales),
+        "version": VERSION_LIMPIEZA,
+    }
+    return Path(ruta_datos) / "cache" / f"tablas_{huella_fuentes(ruta_datos, parametros)}"
+
+
+def guardar_tablas_limpias(carpeta, inv, trx, prod):
+    """
+    Escribe el caché en una carpeta temporal única y la renombra al final: un
+    caché a medias nunca es válido. Si ya existe la carpeta destino (caché
+    parcial o de una versión anterior) se borra antes del renombre. Un error
+    de disco no interrumpe el cálculo: se avisa y la próxima ejecución vuelve
+    a procesar desde los CSV.
+    """
+    temporal = None
+    try:
+        carpeta.parent.mkdir(parents=True, exist_ok=True)
+        temporal = Path(tempfile.mkdtemp(prefix=carpeta.name + ".", suffix=".tmp", dir=carpeta.parent))
+        for nombre, tabla in [("inv", inv), ("trx", trx), ("prod", prod)]:
+            tabla.to_parquet(temporal / f"{nombre}.parquet", index=False)
+        if carpeta.exists():
+            shutil.rmtree(carpeta)
+        temporal.rename(carpeta)
+    except OSError as e:
+        warnings.warn(f"No se pudo guardar el caché en {carpeta}: {e}")
+        if temporal is not None:
+            shutil.rmtree(temporal, ignore_errors=True)
+
+
+def cargar_tablas_limpias(ruta_datos="data", threshold=UMBRAL_CATEGORIA, tabla_alias=None, usar_cache=True,
+                          procesos=1, registro=None, medir_memoria=False):
+    """
+    Retorna inv, trx y prod limpios y completados.
+
+    Si existe un caché Parquet con la misma huella (fuentes + parámetros) se
+    lee directamente (memory-mapped) y se omite limpieza y completado; si no,
+    se procesa desde los CSV y se guarda el resultado para la próxima vez.
+    Con procesos > 1 la limpieza se hace con limpiar_tablas_paralelo
+    (mismo resultado, por eso no entra en la huella).
+
+    Las tablas crudas solo quedan referenciadas desde el pipeline, así cada
+    etapa libera las columnas que reemplaza (una copia de trabajo por tabla).
+    La última etapa deja el esquema compacto (product_id Categorical, fecha
+    datetime64, ver compactar_tablas), que es también el que guarda el caché.
+    Si se entrega la lista registro, se agregan las mediciones por etapa.
+
+    Retorna
+    -------
+    tuple
+        (inv, trx, prod, desde_cache)
+    """
+    usar_cache = usar_cache and PYARROW_DISPONIBLE
+
+    if usar_cache:
+        carpeta = carpeta_tablas_limpias(ruta_datos, threshold)
+        if (carpeta / "prod.parquet").exists():
+            inv, trx, prod = (
+                pd.read_parquet(carpeta / f"{nombre}.parquet", memory_map=True)
+                for nombre in ["inv", "trx", "prod"]
+            )
+            return inv, trx, prod, True
+
+    if tabla_alias is None:
+        tabla_alias = TablaAliasCategorias(categorias_reales)
+
+    tablas = dict(zip(["inv", "prod", "trx"], cargar_tablas(ruta_datos)))
+    etapas = ETAPAS_COMPLETADO
+    if procesos > 1:
+        tablas["inv"], tablas["trx"], tablas["prod"] = limpiar_tablas_paralelo(
+            tablas.pop("inv"), tablas.pop("trx"), tablas.pop("prod"),
+            procesos=procesos, tabla_alias=tabla_alias, threshold=threshold,
+        )
+    else:
+        etapas = etapas_limpieza({}, tabla_alias, threshold) + ETAPAS_COMPLETADO
+    etapas = etapas + [Etapa("esquema_compacto", _etapa_esquema_compacto)]
+    tablas = PipelineLimpieza(etapas, medir_memoria, registro).ejecutar(tablas)
+    inv, trx, prod = tablas["inv"], tablas["trx"], tablas["prod"]
+    del tablas
+
+    if usar_cache:
+        guardar_tablas_limpias(carpeta, inv, trx, prod)
+
+    return inv, trx, prod, False
+
+
+################ Modo streaming (por chunks) ####################
+
+# Columnas y tipos explícitos: todo se lee como texto y lo convierten las
+# etapas de limpieza (igual que con la lectura completa)
+COLUMNAS_INV = ["product_id", "categoria", "cantidad_stock", "valor_inventario_costo"]
+COLUMNAS_TRX = [
+    "product_id",
+    "categoria",
+    "unidades_vendidas",
+    "precio_unitario_venta",
+    "precio_lista_original",
+    "monto_descuento_unitario",
+    "costo_unitario",
+]
+NUMERICAS_INV = ["cantidad_stock", "valor_inventario_costo"]
+NUMERICAS_TRX = COLUMNAS_TRX[2:]
+
+
+def leer_por_chunks(ruta, columnas, chunksize):
+    """
+    Lee un CSV en chunks de tamaño fijo, solo con las columnas pedidas
+    y todas como texto.
+    """
+    return pd.read_csv(
+        ruta,
+        usecols=columnas,
+        dtype={c: object for c in columnas},
+        chunksize=chunksize,
+    )
+
+
+def limpiar_chunk(df, numericas, alias, tabla_alias, threshold=UMBRAL_CATEGORIA):
+    """
+    Etapas de limpieza de limpiar_tablas aplicadas a un chunk.
+    """
+    df = normalizar_categoria(df, "categoria", alias)
+    df = match_categoria_con_reales(df, "categoria", categorias_reales, threshold=threshold, tabla_alias=tabla_alias)
+    df = limpiar_cols_num(df, numericas)
+    return df
+
+
+def _primeras_filas(df, col_id, cols):
+    """
+    Filas mínimas que necesita construir_prod_completo: la primera aparición
+    de cada product_id y la primera fila con cada columna no nula.
+    Conserva el índice original (orden del archivo).
+    """
+    indices = [df[col_id].dropna().drop_duplicates().index]
+    for c in cols:
+        indices.append(df[[col_id, c]].dropna().drop_duplicates(subset=[col_id]).index)
+    return df.loc[sorted(set().union(*indices))]
+
+
+def _sumar(acumulado, nuevo):
+    """
+    Suma dos tablas de sumas parciales alineando por índice.
+    """
+    if acumulado is None:
+        return nuevo
+    return acumulado.add(nuevo, fill_value=0)
+
+
+class SketchCuantiles:
+    """
+    Sketch de cuantiles por categoría, fusionable (sumar dos sketches es
+    sumar sus conteos).
+
+    Mientras haya pocas claves distintas guarda el conteo exacto por valor,
+    que es el caso de unidades_vendidas y cantidad_stock (enteros pequeños),
+    y la mediana coincide con groupby().median(). Si supera max_claves se
+    colapsa a cubetas logarítmicas con error relativo alpha (estilo DDSketch).
+    """
+
+    def __init__(self, max_claves=4096, alpha=0.005):
+        self.max_claves = max_claves
+        self.alpha = alpha
+        self.colapsado = False
+        self.conteos = pd.Series(
+            dtype=np.int64,
+            index=pd.MultiIndex.from_arrays([[], []], names=["categoria", "valor"]),
+            name="conteo",
+        )
+
+    def _clave(self, valores):
+        if not self.colapsado:
+            return valores
+        gamma = (1 + self.alpha) / (1 - self.alpha)
+        magnitud = np.abs(valores)
+        k = np.ceil(np.log(np.where(magnitud > 0, magnitud, 1)) / np.log(gamma))
+        return np.where(magnitud > 0, np.sign(valores) * 2 * gamma ** k / (gamma + 1), 0.0)
+
+    def _sumar_conteos(self, conteos):
+        self.conteos = (
+            _sumar(self.conteos, conteos).astype(np.int64).rename("conteo")
+        )
+        if not self.colapsado and len(self.conteos) > self.max_claves:
+            self.colapsar()
+
+    def colapsar(self):
+        self.colapsado = True
+        claves = self._clave(self.conteos.index.get_level_values("valor").to_numpy(np.float64))
+        self.conteos = self.conteos.groupby(
+            [self.conteos.index.get_level_values("categoria"), claves]
+        ).sum().rename_axis(["categoria", "valor"]).rename("conteo")
+
+    def agregar(self, categorias, valores):
+        categorias = pd.Series(categorias).astype(object).to_numpy()
+        valores = pd.Series(valores).to_numpy(dtype=np.float64, na_value=np.nan)
+        validas = pd.notna(categorias) & ~np.isnan(valores)
+        if not validas.any():
+            return
+        conteos = (
+            pd.DataFrame({"categoria": categorias[validas], "valor": self._clave(valores[validas])})
+            .groupby(["categoria", "valor"])
+            .size()
+        )
+        self._sumar_conteos(conteos)
+
+    def fusionar(self, otro):
+        if otro.colapsado and not self.colapsado:
+            self.colapsar()
+        conteos = otro.conteos
+        if self.colapsado and not otro.colapsado:
+            conteos = conteos.groupby(
+                [conteos.index.get_level_values("categoria"),
+                 self._clave(conteos.index.get_level_values("valor").to_numpy(np.float64))]
+            ).sum()
+            conteos.index.names = ["categoria", "valor"]
+        self._sumar_conteos(conteos)
+
+    def mediana(self):
+        """
+        Mediana por categoría (promedio de los dos centrales si n es par),
+        redondeada como Int64, igual que las imputaciones por mediana.
+        """
+        medianas = {}
+        for categoria, conteos in self.conteos.groupby(level=0):
+            conteos = conteos.droplevel(0).sort_index()
+            acumulado = conteos.cumsum().to_numpy()
+            valores = conteos.index.to_numpy(dtype=np.float64)
+            n = acumulado[-1]
+            bajo = valores[np.searchsorted(acumulado, (n - 1) // 2, side="right")]
+            alto = valores[np.searchsorted(acumulado, n // 2, side="right")]
+            medianas[categoria] = (bajo + alto) / 2
+        return pd.Series(medianas, dtype=np.float64).round().astype("Int64")
+
+
+class AcumuladorKPI:
+    """
+    Estadísticos suficientes por categoría para GMROI y Markdown (sumas de
+    margen, inventario a costo, descuentos y ventas, con sus conteos),
+    alimentados chunk a chunk o lote a lote con tablas ya completadas (sin la
+    imputación por mediana).
+
+    Las filas con unidades_vendidas / cantidad_stock faltantes no se pueden
+    resolver hasta conocer la mediana de toda la historia, pero su aporte es
+    lineal en la mediana: se acumulan aparte (p. ej. suma de precio - costo)
+    y se multiplican por la mediana al final. Las medianas salen de sketches
+    de cuantiles fusionables (SketchCuantiles).
+
+    El acumulador se puede guardar en disco y retomar para sumar lotes
+    diarios nuevos sin releer la historia (ver actualizar_almacen_kpi).
+    """
+
+    COMPONENTES = {
+        "gmroi_conocido": ["margen_bruto", "filas"],
+        "gmroi_imputable": ["precio", "costo", "filas"],
+        "md_conocido": ["descuentos", "ventas", "filas"],
+        "md_imputable": ["descuentos", "precio", "filas"],
+        "inv_conocido": ["valor", "filas"],
+        "inv_imputable": ["costo", "filas"],
+    }
+
+    def __init__(self):
+        for nombre, columnas in self.COMPONENTES.items():
+            setattr(
+                self,
+                nombre,
+                pd.DataFrame(columns=columnas, dtype=np.float64).rename_axis("categoria"),
+            )
+        self.sketch_unidades = SketchCuantiles()
+        self.sketch_stock = SketchCuantiles()
+        self.lotes = []  # huellas de los lotes ya incorporados
+
+    # ----- Persistencia -----
+
+    def guardar(self, directorio):
+        directorio = Path(directorio)
+        directorio.mkdir(parents=True, exist_ok=True)
+        for nombre in self.COMPONENTES:
+            getattr(self, nombre).to_csv(directorio / f"{nombre}.csv", encoding="utf-8")
+        for nombre in ["sketch_unidades", "sketch_stock"]:
+            getattr(self, nombre).conteos.to_csv(directorio / f"{nombre}.csv", encoding="utf-8")
+        meta = {
+            "lotes": self.lotes,
+            "colapsado": {
+                "sketch_unidades": self.sketch_unidades.colapsado,
+                "sketch_stock": self.sketch_stock.colapsado,
+            },
+        }
+        (directorio / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+    @classmethod
+    def cargar(cls, directorio):
+        directorio = Path(directorio)
+        acumulador = cls()
+        for nombre in cls.COMPONENTES:
+            setattr(
+                acumulador,
+                nombre,
+                pd.read_csv(directorio / f"{nombre}.csv", index_col="categoria", keep_default_na=False)
+                .astype(np.float64),
+            )
+        meta = json.loads((directorio / "meta.json").read_text(encoding="utf-8"))
+        for nombre in ["sketch_unidades", "sketch_stock"]:
+            sketch = getattr(acumulador, nombre)
+            sketch.colapsado = meta["colapsado"][nombre]
+            sketch.conteos = (
+                pd.read_csv(directorio / f"{nombre}.csv", index_col=["categoria", "valor"], keep_default_na=False)
+                ["conteo"].astype(np.int64)
+            )
+        acumulador.lotes = meta["lotes"]
+        return acumulador
+
+    # ----- Acumulación -----
+
+    @staticmethod
+    def _por_categoria(df, columnas):
+        df = df.assign(categoria=df["categoria"].astype(object))
+        return df.groupby("categoria")[columnas].sum().assign(filas=df.groupby("categoria").size())
+
+    def agregar_trx(self, trx):
+        trx = trx.astype({"unidades_vendidas": "float64"})
+        unidades = trx["unidades_vendidas"]
+        con_categoria = trx["categoria"].notna()
+
+        self.sketch_unidades.agregar(trx["categoria"], trx["unidades_vendidas"])
+
+        # GMROI: filas completas / filas que esperan la mediana
+        base = con_categoria & trx["precio_unitario_venta"].notna() & trx["costo_unitario"].notna()
+        g = trx[base & unidades.notna()]
+        g = g.assign(
+            margen_bruto=g["unidades_vendidas"] * g["precio_unitario_venta"]
+            - g["unidades_vendidas"] * g["costo_unitario"]
+        )
+        self.gmroi_conocido = _sumar(self.gmroi_conocido, self._por_categoria(g, ["margen_bruto"]))
+
+        g = trx[base & unidades.isna()]
+        g = g.assign(precio=g["precio_unitario_venta"], costo=g["costo_unitario"])
+        self.gmroi_imputable = _sumar(self.gmroi_imputable, self._por_categoria(g, ["precio", "costo"]))
+
+        # Markdown: mismas reglas que calcular_markdown
+        base = (
+            con_categoria
+            & trx["precio_unitario_venta"].notna()
+            & trx["monto_descuento_unitario"].notna()
+            & (trx["categoria"].astype(object).str.strip() != "")
+        )
+        m = trx[base & unidades.notna()]
+        m = m.assign(
+            descuentos=m["unidades_vendidas"] * m["monto_descuento_unitario"],
+            ventas=m["unidades_vendidas"] * m["precio_unitario_venta"],
+        )
+        m = m[m["ventas"] > 0]
+        self.md_conocido = _sumar(self.md_conocido, self._por_categoria(m, ["descuentos", "ventas"]))
+
+        # Con mediana >= 0, ventas > 0 equivale a mediana > 0 y precio > 0
+        m = trx[base & unidades.isna() & (trx["precio_unitario_venta"] > 0)]
+        m = m.assign(descuentos=m["monto_descuento_unitario"], precio=m["precio_unitario_venta"])
+        self.md_imputable = _sumar(self.md_imputable, self._por_categoria(m, ["descuentos", "precio"]))
+
+    def agregar_inv(self, inv, indice, col_product_id="product_id"):
+        inv = inv.astype({"cantidad_stock": "float64"})
+
+        self.sketch_stock.agregar(inv["categoria"], inv["cantidad_stock"])
+
+        validas = inv[inv["categoria"].notna() & inv["valor_inventario_costo"].notna()]
+        validas = validas.assign(valor=validas["valor_inventario_costo"])
+        self.inv_conocido = _sumar(self.inv_conocido, self._por_categoria(validas, ["valor"]))
+
+        # valor = mediana_stock * costo_unitario, pendiente de la mediana
+        pendientes = inv[
+            inv["valor_inventario_costo"].isna()
+            & inv["cantidad_stock"].isna()
+            & inv["categoria"].notna()
+            & inv[col_product_id].notna()
+        ]
+        pendientes = pendientes.assign(
+            costo=indice.tomar(indice.codificar(pendientes[col_product_id]), "costo_unitario")
+        )
+        pendientes = pendientes[pendientes["costo"].notna()]
+        self.inv_imputable = _sumar(self.inv_imputable, self._por_categoria(pendientes, ["costo"]))
+
+    def gmroi(self):
+        mediana = self.sketch_unidades.mediana().astype("float64")
+
+        imputable = self.gmroi_imputable.join(mediana.rename("mediana"), how="inner").dropna()
+        margen = _sumar(
+            self.gmroi_conocido,
+            pd.DataFrame({
+                "margen_bruto": imputable["mediana"] * imputable["precio"]
+                - imputable["mediana"] * imputable["costo"],
+                "filas": imputable["filas"],
+            }),
+        )
+        margen = margen[margen["filas"] > 0]
+
+        mediana_stock = self.sketch_stock.mediana().astype("float64")
+        imputable = self.inv_imputable.join(mediana_stock.rename("mediana"), how="inner").dropna()
+        inventario = _sumar(
+            self.inv_conocido,
+            pd.DataFrame({
+                "valor": imputable["mediana"] * imputable["costo"],
+                "filas": imputable["filas"],
+            }),
+        )
+        inventario = inventario[inventario["filas"] > 0]
+
+        gmroi_categoria = (
+            margen[["margen_bruto"]]
+            .join(
+                (inventario["valor"] / inventario["filas"]).rename("inventario_promedio_costo"),
+                how="inner",
+            )
+            .sort_index()
+            .rename_axis("categoria")
+            .reset_index()
+        )
+        gmroi_categoria["gmroi"] = (
+            gmroi_categoria["margen_bruto"]
+            / gmroi_categoria["inventario_promedio_costo"]
+        )
+        return gmroi_categoria.replace([np.inf, -np.inf], np.nan)
+
+    def markdown(self):
+        mediana = self.sketch_unidades.mediana().astype("float64")
+        mediana = mediana[mediana > 0]
+
+        imputable = self.md_imputable.join(mediana.rename("mediana"), how="inner")
+        totales = _sumar(
+            self.md_conocido,
+            pd.DataFrame({
+                "descuentos": imputable["mediana"] * imputable["descuentos"],
+                "ventas": imputable["mediana"] * imputable["precio"],
+                "filas": imputable["filas"],
+            }),
+        )
+        totales = totales[totales["filas"] > 0].sort_index()
+
+        markdown_categoria = pd.DataFrame({
+            "categoria": totales.index.astype(object),
+            "descuentos_totales": totales["descuentos"].to_numpy(),
+            "ventas_brutas": totales["ventas"].to_numpy(),
+        })
+        markdown_categoria = markdown_categoria[
+            markdown_categoria["ventas_brutas"] > 0
+        ].reset_index(drop=True)
+        markdown_categoria["markdown"] = (
+            markdown_categoria["descuentos_totales"]
+            / markdown_categoria["ventas_brutas"]
+        )
+        markdown_categoria["markdown_pct"] = markdown_categoria["markdown"] * 100
+        return markdown_categoria
+
+
+def _leer_prod_limpio(ruta_datos, alias, tabla_alias, threshold):
+    prod = pd.read_csv(Path(ruta_datos) / "maestro_productos.csv")
+    prod = normalizar_categoria(prod, "categoria", alias)
+    prod = match_categoria_con_reales(prod, "categoria", categorias_reales, threshold=threshold, tabla_alias=tabla_alias)
+    return limpiar_cols_num(prod, ["costo_unitario", "precio_lista"])
+
+
+def acumular_por_chunks(ruta_datos="data", chunksize=100_000, tabla_alias=None, threshold=UMBRAL_CATEGORIA):
+    """
+    Recorre inventario y transacciones por chunks, con memoria acotada por el
+    tamaño del chunk, y acumula los estadísticos por categoría.
+
+    1ª pasada: limpia cada chunk y guarda solo las filas que necesita
+    construir_prod_completo (primer dato por producto).
+    2ª pasada: limpia y completa cada chunk contra prod y acumula sumas
+    parciales por categoría (ver AcumuladorKPI).
+
+    Retorna
+    -------
+    tuple
+        (acumulador, indice, prod)
+    """
+    ruta_datos = Path(ruta_datos)
+    alias = {}
+    if tabla_alias is None:
+        tabla_alias = TablaAliasCategorias(categorias_reales)
+
+    prod = _leer_prod_limpio(ruta_datos, alias, tabla_alias, threshold)
+
+    # 1ª pasada: insumos de construir_prod_completo
+    resumen_inv, resumen_trx = [], []
+    for chunk in leer_por_chunks(ruta_datos / "inventario_diario.csv", COLUMNAS_INV, chunksize):
+        chunk = limpiar_chunk(chunk, NUMERICAS_INV, alias, tabla_alias, threshold)
+        resumen_inv.append(_primeras_filas(chunk, "product_id", ["categoria"]))
+    for chunk in leer_por_chunks(ruta_datos / "transacciones_ventas.csv", COLUMNAS_TRX, chunksize):
+        chunk = limpiar_chunk(chunk, NUMERICAS_TRX, alias, tabla_alias, threshold)
+        resumen_trx.append(
+            _primeras_filas(chunk, "product_id", ["categoria", "costo_unitario", "precio_lista_original"])
+        )
+
+    prod = construir_prod_completo(
+        prod,
+        pd.concat(resumen_inv).astype({"categoria": object}),
+        pd.concat(resumen_trx).astype({"categoria": object}),
+    )
+    del resumen_inv, resumen_trx
+
+    indice = IndiceProductos.desde_prod(prod)
+
+    # 2ª pasada: completar y acumular
+    acumulador = AcumuladorKPI()
+    for chunk in leer_por_chunks(ruta_datos / "transacciones_ventas.csv", COLUMNAS_TRX, chunksize):
+        chunk = limpiar_chunk(chunk, NUMERICAS_TRX, alias, tabla_alias, threshold)
+        acumulador.agregar_trx(completar_trx_desde_prod(chunk, prod, imputar_mediana=False, indice=indice))
+    for chunk in leer_por_chunks(ruta_datos / "inventario_diario.csv", COLUMNAS_INV, chunksize):
+        chunk = limpiar_chunk(chunk, NUMERICAS_INV, alias, tabla_alias, threshold)
+        acumulador.agregar_inv(completar_inv_desde_prod(chunk, prod, imputar_mediana=False, indice=indice), indice)
+
+    return acumulador, indice, prod
+
+
+def kpis_por_chunks(ruta_datos="data", chunksize=100_000, tabla_alias=None, threshold=UMBRAL_CATEGORIA):
+    """
+    gmroi_categoria y markdown_categoria en modo streaming (ver acumular_por_chunks).
+
+    Retorna
+    -------
+    tuple
+        (gmroi_categoria, markdown_categoria, prod)
+    """
+    acumulador, _, prod = acumular_por_chunks(ruta_datos, chunksize, tabla_alias, threshold)
+    return acumulador.gmroi(), acumulador.markdown(), prod
+
+
+################ Almacén incremental de KPIs ####################
+
+def _huella_archivo(ruta, bloque=1 << 20):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for parte in iter(lambda: f.read(bloque), b""):
+            h.update(parte)
+    return h.hexdigest()[:16]
+
+
+def agregar_lote(acumulador, indice, ruta, tipo, alias, tabla_alias,
+                 chunksize=100_000, threshold=UMBRAL_CATEGORIA):
+    """
+    Incorpora un lote nuevo (CSV de inventario o de transacciones con el
+    mismo formato que los archivos históricos) al acumulador.
+
+    Primero se suman al índice de productos los ids y atributos nuevos del
+    lote (sin sobrescribir lo ya conocido) y luego se completa y acumula.
+    Las filas ya acumuladas no se recalculan: un atributo que recién aparece
+    en este lote no se propaga a filas de días anteriores.
+    """
+    if tipo == "inv":
+        columnas, numericas = COLUMNAS_INV, NUMERICAS_INV
+        fuentes = {"categoria": "categoria"}
+    else:
+        columnas, numericas = COLUMNAS_TRX, NUMERICAS_TRX
+        fuentes = {
+            "categoria": "categoria",
+            "costo_unitario": "costo_unitario",
+            "precio_lista_original": "precio_lista",
+        }
+
+    for chunk in leer_por_chunks(ruta, columnas, chunksize):
+        chunk = limpiar_chunk(chunk, numericas, alias, tabla_alias, threshold)
+        indice.agregar_fuente(chunk, indice.extender(chunk["product_id"]), fuentes)
+
+    for chunk in leer_por_chunks(ruta, columnas, chunksize):
+        chunk = limpiar_chunk(chunk, numericas, alias, tabla_alias, threshold)
+        if tipo == "inv":
+            acumulador.agregar_inv(
+                completar_inv_desde_prod(chunk, None, imputar_mediana=False, indice=indice), indice
+            )
+        else:
+            acumulador.agregar_trx(
+                completar_trx_desde_prod(chunk, None, imputar_mediana=False, indice=indice)
+            )
+
+
+def actualizar_almacen_kpi(directorio, ruta_datos="data", lotes_inv=(), lotes_trx=(),
+                           chunksize=100_000, tabla_alias=None, threshold=UMBRAL_CATEGORIA):
+    """
+    Almacén incremental de KPIs por categoría.
+
+    Si el almacén no existe se inicializa con toda la historia de ruta_datos
+    (modo streaming). Después se incorporan los lotes nuevos de inventario y
+    transacciones; cada archivo se incorpora una sola vez (se registra su
+    huella). gmroi() y markdown() del acumulador retornado salen de los
+    agregados guardados, sin releer la historia.
+
+    Retorna
+    -------
+    AcumuladorKPI
+    """
+    directorio = Path(directorio)
+    alias = {}
+    if tabla_alias is None:
+        tabla_alias = TablaAliasCategorias(categorias_reales)
+
+    if (directorio / "meta.json").exists():
+        acumulador = AcumuladorKPI.cargar(directorio)
+        indice = IndiceProductos.desde_dataframe(
+            pd.read_csv(directorio / "productos.csv", keep_default_na=False, na_values=[""])
+        )
+    else:
+        acumulador, indice, _ = acumular_por_chunks(ruta_datos, chunksize, tabla_alias, threshold)
+
+    nuevos = 0
+    for tipo, rutas in [("inv", lotes_inv), ("trx", lotes_trx)]:
+        for ruta in rutas:
+            huella = _huella_archivo(ruta)
+            if huella in acumulador.lotes:
+                continue
+            agregar_lote(acumulador, indice, ruta, tipo, alias, tabla_alias, chunksize, threshold)
+            acumulador.lotes.append(huella)
+            nuevos += 1
+
+    if nuevos or not (directorio / "meta.json").exists():
+        acumulador.guardar(directorio)
+        indice.a_dataframe().to_csv(directorio / "productos.csv", index=False, encoding="utf-8")
+
+    return acumulador
+
+
+################ Benchmark ####################
+
+def benchmark_limpiar_fecha(inv, col_fecha="fecha", escala=10, repeticiones=1):
+    """
+    Compara limpiar_fecha contra limpiar_fecha_referencia sobre la columna
+    de fecha replicada `escala` veces, verificando que el resultado sea igual.
+
+    Retorna
+    -------
+    pd.DataFrame
+        Tiempos (s) por implementación y speedup
+    """
+    datos = pd.concat([inv[[col_fecha]]] * escala, ignore_index=True)
+
+    tiempos = {}
+    resultados = {}
+    for nombre, funcion in [
+        ("limpiar_fecha_referencia", limpiar_fecha_referencia),
+        ("limpiar_fecha", limpiar_fecha),
+    ]:
+        mejor = np.inf
+        for _ in range(repeticiones):
+            t0 = time.perf_counter()
+            resultados[nombre] = funcion(datos, col_fecha)
+            mejor = min(mejor, time.perf_counter() - t0)
+        tiempos[nombre] = mejor
+
+    iguales = resultados["limpiar_fecha"][col_fecha].equals(
+        resultados["limpiar_fecha_referencia"][col_fecha]
+    )
+
+    return pd.DataFrame({
+        "filas": [len(datos)] * 2,
+        "implementacion": list(tiempos),
+        "segundos": list(tiempos.values()),
+        "speedup": [1.0, tiempos["limpiar_fecha_referencia"] / tiempos["limpiar_fecha"]],
+        "mismo_resultado": [iguales] * 2,
+    })
+
+#_________________________________________________________________________
+
+@_copy_on_write
+def main():
+    parser = argparse.ArgumentParser(
+        description="Parte 1: GMROI y Markdown por categoría"
+    )
+    parser.add_argument("--datos", default="data", help="carpeta con los CSV (default: data)")
+    parser.add_argument("--chunksize", type=int, default=0,
+                        help="N>0: lee inventario y transacciones en chunks de N filas (memoria acotada)")
+    parser.add_argument("--kpi-store", default=None,
+                        help="carpeta del almacén incremental de KPIs (se inicializa con la historia si no existe)")
+    parser.add_argument("--lote-inv", action="append", default=[],
+                        help="CSV diario de inventario a incorporar al almacén (repetible)")
+    parser.add_argument("--lote-trx", action="append", default=[],
+                        help="CSV diario de transacciones a incorporar al almacén (repetible)")
+    parser.add_argument("--cache-tablas", type=int, default=1,
+                        help="1=reutiliza tablas limpias en data/cache si los CSV no cambiaron (requiere pyarrow)")
+    parser.add_argument("--motor-kpi", choices=["pandas", "duckdb"], default="pandas",
+                        help="motor para GMROI y Markdown; duckdb corre SQL sobre el caché Parquet")
+    parser.add_argument("--procesos", type=int, default=1,
+                        help="N>1: limpia inventario y transacciones por particiones en N procesos")
+    parser.add_argument("--quiebres", type=int, default=0,
+                        help="1=detecta quiebres de stock y muestra el GMROI con demanda no censurada")
+    parser.add_argument("--inventario-ponderado", type=int, default=0,
+                        help="N>0: GMROI con inventario promedio ponderado en el tiempo (relleno de hasta N días)")
+    parser.add_argument("--sustituciones", type=int, default=0,
+                        help="1=busca SKUs que reemplazan a otros (nombre + cronología de ventas)")
+    parser.add_argument("--reporte-etapas", type=int, default=0,
+                        help="1=tiempo y filas por etapa de limpieza; 2=además memoria (tracemalloc, más lento)")
+    parser.add_argument("--reporte-memoria", type=int, default=0,
+                        help="1=muestra la memoria de las tablas del pipeline vs. con ids y fechas como strings")
+    parser.add_argument("--benchmark-fechas", type=int, default=0,
+                        help="N>0: compara limpiar_fecha con la versión original en inventario xN y termina")
+    args = parser.parse_args()
+
+    if args.kpi_store:
+        tabla_alias = TablaAliasCategorias(categorias_reales, directorio=Path(args.datos) / "cache")
+        acumulador = actualizar_almacen_kpi(
+            args.kpi_store,
+            args.datos,
+            lotes_inv=args.lote_inv,
+            lotes_trx=args.lote_trx,
+            chunksize=args.chunksize or 100_000,
+            tabla_alias=tabla_alias,
+        )
+        print(acumulador.gmroi())
+        print(acumulador.markdown())
+        return 0
+
+    if args.chunksize > 0:
+        tabla_alias = TablaAliasCategorias(categorias_reales, directorio=Path(args.datos) / "cache")
+        gmroi_categoria, markdown_categoria, _ = kpis_por_chunks(
+            args.datos, args.chunksize, tabla_alias
+        )
+        print(gmroi_categoria)
+        print(markdown_categoria)
+        return 0
+
+    if args.motor_kpi == "duckdb" and not (args.cache_tablas and PYARROW_DISPONIBLE and DUCKDB_DISPONIBLE):
+        parser.error("--motor-kpi duckdb requiere duckdb, pyarrow y --cache-tablas 1")
+
+    if args.benchmark_fechas > 0:
+        inv, _, _ = cargar_tablas(args.datos)
+        print(benchmark_limpiar_fecha(inv, escala=args.benchmark_fechas))
+        return 0
+
+    ##### Corregir, normalizar e imputar tablas (o leerlas del caché) #####
+    tabla_alias = TablaAliasCategorias(categorias_reales, directorio=Path(args.datos) / "cache")
+    registro = []
+    inv, trx, prod, desde_cache = cargar_tablas_limpias(
+        args.datos, tabla_alias=tabla_alias, usar_cache=bool(args.cache_tablas), procesos=args.procesos,
+        registro=registro, medir_memoria=args.reporte_etapas == 2,
+    )
+    if desde_cache:
+        print("Tablas limpias leídas desde el caché Parquet.")
+    else:
+        print(f"Tabla de alias de categorías: {tabla_alias.reporte()}")
+        if args.reporte_etapas:
+            print(pd.DataFrame(registro))
+
+    if args.reporte_memoria:
+        # Tablas con las que se calculan los KPIs vs. las mismas con strings Python
+        print(reporte_memoria(
+            {"inv": esquema_ancho(inv), "trx": esquema_ancho(trx), "prod": esquema_ancho(prod)},
+            {"inv": inv, "trx": trx, "prod": prod},
+        ))
+
+    usar_duckdb = args.motor_kpi == "duckdb"
+    if usar_duckdb:
+        carpeta_cache = carpeta_tablas_limpias(args.datos)
+        # guardar_tablas_limpias solo avisa si falla la escritura del caché
+        usar_duckdb = (carpeta_cache / "prod.parquet").exists()
+        if not usar_duckdb:
+            warnings.warn(f"Sin caché Parquet en {carpeta_cache}: GMROI y Markdown se calculan con pandas")
+    if usar_duckdb:
+        gmroi_categoria, markdown_categoria = calcular_kpis_duckdb(carpeta_cache)
+    else:
+        gmroi_categoria = calcular_gmroi(inv, trx)
+        markdown_categoria = calcular_markdown(trx)
+
+    print(gmroi_categoria)
+    print(markdown_categoria)
+
+    ##### Pregunta 1.3: GMROI alto con Markdown > 20% #####
+    cubo = CuboKPI.desde_tablas(inv, trx)
+    alertas = cubo.alertas_markdown(["categoria"])
+    print(alertas.loc[alertas["alerta"], ["categoria", "gmroi", "markdown_pct"]])
+
+    ##### Pregunta 1.1: ceros censurados por quiebre de stock #####
+    if args.quiebres:
+        panel, rachas = estimar_demanda_sin_censura(inv, trx)
+        print(f"Rachas de quiebre: {len(rachas)} | SKU-días censurados: {int(panel['censurado'].sum())}")
+        print(calcular_gmroi_sin_censura(inv, trx, panel)[
+            ["categoria", "gmroi", "margen_perdido", "gmroi_sin_censura"]
+        ])
+
+    if args.inventario_ponderado:
+        print(calcular_gmroi_ponderado(inv, trx, limite_relleno=args.inventario_ponderado))
+
+    ##### Pregunta 1.1: sustituciones de SKUs #####
+    if args.sustituciones:
+        mapa = IndiceSustitucion(prod, ventas_fechadas(trx, args.datos)).mapa()
+        print(f"Sustituciones detectadas: {len(mapa)}")
+        print(mapa.head(20))
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -19,46 +19,104 @@ Uso (simple):
 Uso (configurable):
     python pregunta_02.py --max-pages 3 --max-items 120 --throttle-min 2 --throttle-max 4 --headless 1
 
+Uso (varias comunas en paralelo, mismo ritmo total contra el portal):
+    python pregunta_02.py --comunas huechuraba,renca,quilicura --concurrency 4
+
 Outputs:
-- data/out/portal_huechuraba_*.csv      (filas extraídas, aunque sean parciales)
+- data/out/portal_huechuraba_*.csv      (filas extraídas, escritas por lotes durante el crawl)
 - data/out/metrics_*.csv               (métricas del cuadro 2.1)
 - data/logs/scrape_*.log               (bitácora)
 - data/raw/blocked_*.html              (dumps ante bloqueo/captcha)
+- data/raw/cache/                      (caché de páginas por URL, ver --cache-mode)
+- data/state/crawl.sqlite              (frontera y avisos vistos; reanuda el crawl, ver --state)
 """
 
 from __future__ import annotations
 
 import argparse
+import asyncio
+import bisect
 import datetime as dt
+import gzip
+import hashlib
+import http.client
 import json
 import random
 import re
+import sqlite3
+import threading
 import time
-from dataclasses import dataclass
+import zlib
+from dataclasses import dataclass, replace
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urljoin, urlsplit
 
 import numpy as np
 import pandas as pd
 from bs4 import BeautifulSoup
-from playwright.sync_api import sync_playwright, Response
+
+# pyarrow (opcional): salida incremental en Parquet (--output-format parquet)
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+from playwright.async_api import async_playwright, Response
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+# lxml (opcional): motor rápido del fallback DOM de parse_listings
+try:
+    from lxml import etree as lxml_etree
+    from lxml import html as lxml_html
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
 
 
 # -----------------------------
 # Constantes del sitio objetivo
 # -----------------------------
 BASE = "https://www.portalinmobiliario.com"
-ROBOTS_URL = f"{BASE}/robots.txt"
 
 LISTING_TEMPLATES = [
-    f"{BASE}/venta/{{tipo}}/{{comuna}}-{{region}}",
+    "{base}/venta/{tipo}/{comuna}-{region}",
 ]
 
 # Regex robustos para UF y m2 (best-effort)
 UF_RE = re.compile(r"\bUF\s*([\d\.\,]+)", re.IGNORECASE)
 M2_RE = re.compile(r"(\d+(?:[\,\.]\d+)?)\s*m2\b", re.IGNORECASE)
 
+# ID de aviso de Mercado Libre Chile (Portal Inmobiliario usa la misma plataforma)
+LISTING_ID_RE = re.compile(r"\bMLC-?(\d{6,})")
+# Monedas que equivalen a UF (CLF es el código ISO 4217 de la UF)
+UF_CURRENCIES = ("CLF", "UF")
+
 USER_AGENT_GROUP = "*"  # para evaluación de robots
+HTTP_USER_AGENT = "Mozilla/5.0"  # mismo User-Agent que la descarga de robots.txt
+
+# Perfil de carga liviano: solo interesa el HTML (y el JS que lo completa)
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "media", "font", "stylesheet", "texttrack", "manifest"})
+TRACKER_DOMAINS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+    "facebook.net",
+    "facebook.com",
+    "hotjar.com",
+    "clarity.ms",
+    "newrelic.com",
+    "nr-data.net",
+    "criteo.com",
+    "criteo.net",
+)
+# Página lista: resultados del listado o datos estructurados presentes
+READY_SELECTOR = "ol.ui-search-layout, li.ui-search-layout__item, script[type='application/ld+json']"
+# Ítems del listado de READY_SELECTOR en el HTML servido (sin construir DOM)
+LISTING_ITEM_RE = re.compile(r"""class\s*=\s*["'][^"']*\bui-search-layout__item\b""", re.IGNORECASE)
+
+TIPOS = ("departamento", "casa")  # orden solicitado: primero deptos, luego casas
 
 # -----------------------------
 # Configuración de ejecución
@@ -74,6 +132,13 @@ class ScrapeConfig:
     headless: bool
     timeout_ms: int
     debug_dump: bool
+    tipos: Tuple[str, ...] = TIPOS
+    base_url: str = BASE  # se cambia para probar contra un servidor local
+    parser: str = "fast"  # motor del fallback DOM: fast (lxml) | legacy (html.parser)
+    block_resources: bool = True  # aborta imágenes, fuentes, CSS, media y trackers
+    ready_selector: str = READY_SELECTOR  # vacío = esperar network idle
+    ready_timeout_ms: int = 5000
+    fetcher: str = "playwright"  # playwright | http (sin navegador, Playwright solo si hace falta JS)
 
 # -----------------------------
 # Robots.txt (parser simple)
@@ -170,37 +235,43 @@ def log_line(log_path: Path, msg: str) -> None:
     with log_path.open("a", encoding="utf-8") as f:
         f.write(line + "\n")
 
-def polite_sleep(cfg: ScrapeConfig) -> None:
-    # Throttling (mínimo impacto). No concurrencia.
-    time.sleep(random.uniform(cfg.throttle_min_s, cfg.throttle_max_s))
-
-def fetch_robots(log_path: Path, timeout_s: int = 20) -> RobotsRules:
+def fetch_robots(
+    log_path: Path, timeout_s: int = 20, base_url: str = BASE, client: Optional["HttpFetcher"] = None
+) -> RobotsRules:
     """
-    Descarga robots.txt (usando urllib estándar) y retorna reglas parseadas.
+    Descarga robots.txt (usando urllib estándar, o el cliente keep-alive de
+    --fetcher http) y retorna reglas parseadas.
+    Se descarga una vez por ejecución y se comparte entre todos los jobs.
     """
     import urllib.request
 
-    log_line(log_path, f"Descargando robots.txt: {ROBOTS_URL}")
-    req = urllib.request.Request(ROBOTS_URL, headers={"User-Agent": "Mozilla/5.0"})
-    with urllib.request.urlopen(req, timeout=timeout_s) as resp:
-        raw = resp.read().decode("utf-8", errors="replace")
+    robots_url = f"{base_url}/robots.txt"
+    log_line(log_path, f"Descargando robots.txt: {robots_url}")
+    if client is not None:
+        status, raw, _, _ = client.get_sync(robots_url)
+        if not 200 <= status < 300:
+            raise OSError(f"robots.txt respondió status={status}")
+    else:
+        req = urllib.request.Request(robots_url, headers={"User-Agent": HTTP_USER_AGENT})
+        with urllib.request.urlopen(req, timeout=timeout_s) as resp:
+            raw = resp.read().decode("utf-8", errors="replace")
     log_line(log_path, "robots.txt descargado OK.")
     return RobotsRules(raw)
 
-def build_listing_urls(tipo: str, comuna: str, region: str, page: int) -> List[str]:
+def build_listing_urls(tipo: str, comuna: str, region: str, page: int, base_url: str = BASE) -> List[str]:
     """
     Construye URLs de listado:
     - Page 1: base
     - Page > 1: intenta paginación tipo "_Desde_" (frecuentemente permitida en robots.txt)
     Nota: el offset real puede variar; sirve como intento y se documenta en logs.
     """
-    base_url = LISTING_TEMPLATES[0].format(tipo=tipo, comuna=comuna, region=region)
+    listing_url = LISTING_TEMPLATES[0].format(base=base_url, tipo=tipo, comuna=comuna, region=region)
     if page <= 1:
-        return [base_url]
+        return [listing_url]
 
     # Offset aproximado, típico de 48 items por página (best-effort)
     offset = 48 * (page - 1) + 1
-    return [f"{base_url}_Desde_{offset}"]
+    return [f"{listing_url}_Desde_{offset}"]
 
 def save_dump(raw_dir: Path, prefix: str, url: str, status: Optional[int], html: str) -> Path:
     stamp = now_stamp()
@@ -218,31 +289,362 @@ def response_status(resp: Optional[Response]) -> Optional[int]:
     except Exception:
         return None
 
-def fetch_page_html(page, url: str, cfg: ScrapeConfig, log_path: Path) -> Tuple[Optional[int], str]:
+# -----------------------------
+# Caché de páginas en disco
+# -----------------------------
+CACHE_MODES = ("off", "read", "refresh")
+
+class PageCache:
+    """
+    Caché de HTML por URL en data/raw/cache/<hh>/<sha256(url)>.{html,json}.
+    El .json guarda url, status, ETag, Last-Modified y la hora de la última
+    validación contra el sitio.
+
+    Modos:
+    - off: no lee ni escribe.
+    - read: si la URL está en disco se usa tal cual (sin red, sin mirar el TTL);
+      las URLs que faltan se descargan y se guardan. Pensado para iterar el parser.
+    - refresh: se usa el disco mientras la entrada tenga menos de `ttl_s`;
+      las vencidas se revalidan con un GET condicional (304 = se reutiliza).
+
+    Las páginas bloqueadas (403/captcha) nunca se guardan.
+    """
+
+    def __init__(self, root: Path, mode: str = "refresh", ttl_s: float = 6 * 3600):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"cache mode inválido: {mode} (usar {', '.join(CACHE_MODES)})")
+        self.root = root
+        self.mode = mode
+        self.ttl_s = ttl_s
+        self.stats = {"hit": 0, "revalidated": 0, "stored": 0}
+
+    def _paths(self, url: str) -> Tuple[Path, Path]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        folder = self.root / key[:2]
+        return folder / f"{key}.html", folder / f"{key}.json"
+
+    def get(self, url: str) -> Optional[dict]:
+        """
+        Retorna los metadatos de la entrada con el HTML en "html", o None.
+        """
+        if self.mode == "off":
+            return None
+        html_path, meta_path = self._paths(url)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            meta["html"] = html_path.read_text(encoding="utf-8")
+        except (OSError, ValueError):
+            return None
+        return meta if meta.get("url") == url else None
+
+    def is_fresh(self, entry: dict) -> bool:
+        if self.mode == "read":
+            return True
+        return time.time() - float(entry.get("validated_at", 0)) < self.ttl_s
+
+    def validators(self, entry: dict) -> Dict[str, str]:
+        """
+        Headers del GET condicional (vacío si el sitio no entregó validadores).
+        """
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url: str, status: Optional[int], html: str, headers: Dict[str, str]) -> None:
+        if self.mode == "off":
+            return
+        html_path, meta_path = self._paths(url)
+        html_path.parent.mkdir(parents=True, exist_ok=True)
+        now = time.time()
+        meta = {
+            "url": url,
+            "status": status,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "fetched_at": now,
+            "validated_at": now,
+        }
+        # Escritura atómica: nunca queda un .html a medias si el proceso se corta
+        for path, text in ((html_path, html), (meta_path, json.dumps(meta))):
+            tmp = path.with_suffix(path.suffix + ".tmp")
+            tmp.write_text(text, encoding="utf-8")
+            tmp.replace(path)
+        self.stats["stored"] += 1
+
+    def touch(self, entry: dict) -> None:
+        """
+        Marca la entrada como recién validada (respuesta 304).
+        """
+        _, meta_path = self._paths(entry["url"])
+        meta = {k: v for k, v in entry.items() if k != "html"}
+        meta["validated_at"] = time.time()
+        tmp = meta_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        tmp.replace(meta_path)
+
+# -----------------------------
+# Fetch con Playwright (perfil liviano)
+# -----------------------------
+def is_tracker(url: str) -> bool:
+    host = urlsplit(url).hostname or ""
+    return any(host == d or host.endswith("." + d) for d in TRACKER_DOMAINS)
+
+class ResourceBlocker:
     """
-    Navega a la URL con Playwright y devuelve (status_code, html).
+    Ruta del contexto que aborta los tipos de recurso que no aportan HTML
+    (imágenes, fuentes, CSS, media) y cualquier request a dominios de tracking.
+    Documentos, scripts propios y XHR pasan, por si el listado se completa con JS.
+    """
+
+    def __init__(self):
+        self.blocked = 0
+
+    async def install(self, context) -> None:
+        await context.route("**/*", self.handle)
+
+    async def handle(self, route) -> None:
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or is_tracker(request.url):
+            self.blocked += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+async def wait_until_ready(page, cfg: ScrapeConfig) -> str:
+    """
+    Reemplaza la espera fija: espera el selector de listado (o network idle si no
+    hay selector o no aparece). Retorna qué condición se cumplió, para el log.
+    """
+    if cfg.ready_selector:
+        try:
+            await page.wait_for_selector(cfg.ready_selector, state="attached", timeout=cfg.ready_timeout_ms)
+            return "selector"
+        except PlaywrightTimeoutError:
+            pass
+    try:
+        await page.wait_for_load_state("networkidle", timeout=cfg.ready_timeout_ms)
+        return "networkidle"
+    except PlaywrightTimeoutError:
+        return "timeout"
+
+async def transferred_bytes(requests: List) -> int:
+    """
+    Bytes recibidos (headers + body) de los requests terminados de una página.
+    """
+    total = 0
+    for req in requests:
+        try:
+            sizes = await req.sizes()
+        except Exception:
+            continue
+        total += max(sizes.get("responseBodySize", 0), 0) + max(sizes.get("responseHeadersSize", 0), 0)
+    return total
+
+async def fetch_page_html(
+    page, url: str, cfg: ScrapeConfig, log_path: Path, blocker: Optional[ResourceBlocker] = None
+) -> Tuple[Optional[int], str, Dict[str, str]]:
+    """
+    Navega a la URL con Playwright y devuelve (status_code, html, headers).
+    Registra en el log bytes transferidos, requests, recursos bloqueados y tiempo.
     """
     log_line(log_path, f"GET {url}")
-    resp = page.goto(url, wait_until="domcontentloaded", timeout=cfg.timeout_ms)
-    status = response_status(resp)
+    finished: List = []
+    on_finished = finished.append
+    page.on("requestfinished", on_finished)
+    blocked_before = blocker.blocked if blocker is not None else 0
+    t0 = time.perf_counter()
+    try:
+        resp = await page.goto(url, wait_until="domcontentloaded", timeout=cfg.timeout_ms)
+        status = response_status(resp)
+        ready = await wait_until_ready(page, cfg)
+        html = await page.content()
+    finally:
+        page.remove_listener("requestfinished", on_finished)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    headers = dict(resp.headers) if resp is not None else {}
+    n_bytes = await transferred_bytes(finished)
+    n_blocked = (blocker.blocked if blocker is not None else 0) - blocked_before
+    log_line(
+        log_path,
+        f"Status={status} len(html)={len(html)} bytes={n_bytes} requests={len(finished)} "
+        f"bloqueados={n_blocked} listo={ready} t={elapsed_ms:.0f}ms",
+    )
+    return status, html, headers
 
-    # Espera breve adicional para contenido base (sin insistencia)
-    page.wait_for_timeout(800)
-    html = page.content()
-    log_line(log_path, f"Status={status} len(html)={len(html)}")
-    return status, html
+# -----------------------------
+# Fetch HTTP sin navegador (keep-alive)
+# -----------------------------
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+def _decode_body(body: bytes, headers: Dict[str, str]) -> str:
+    encoding = headers.get("content-encoding", "").lower()
+    if encoding == "gzip":
+        body = gzip.decompress(body)
+    elif encoding == "deflate":
+        try:
+            body = zlib.decompress(body)
+        except zlib.error:
+            body = zlib.decompress(body, -zlib.MAX_WBITS)
+    m = re.search(r"charset=([\w\-]+)", headers.get("content-type", ""), re.IGNORECASE)
+    try:
+        return body.decode(m.group(1) if m else "utf-8", errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+class HttpFetcher:
+    """
+    Cliente HTTP sin navegador sobre http.client. Las conexiones quedan
+    abiertas (keep-alive) en un pool por host y se reutilizan entre páginas,
+    jobs y robots.txt. Las llamadas bloqueantes corren en hilos para convivir
+    con el scheduler async; cada hilo toma una conexión libre del pool.
+    """
+
+    MAX_REDIRECTS = 5
+
+    def __init__(self, timeout_s: float = 25.0, user_agent: str = HTTP_USER_AGENT):
+        self.timeout_s = timeout_s
+        self.user_agent = user_agent
+        self._idle: Dict[Tuple[str, str], List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "connections": 0}
+
+    def _connection(self, scheme: str, netloc: str) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                return idle.pop(), True
+            self.stats["connections"] += 1
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(netloc, timeout=self.timeout_s), False
+
+    def _request(self, url: str, headers: Optional[Dict[str, str]]) -> Tuple[int, bytes, Dict[str, str]]:
+        parts = urlsplit(url)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        req_headers = {
+            "User-Agent": self.user_agent,
+            "Accept": "text/html,application/xhtml+xml,*/*;q=0.8",
+            "Accept-Encoding": "gzip, deflate",
+            "Accept-Language": "es-CL,es;q=0.9",
+            **(headers or {}),
+        }
+        for attempt in range(2):
+            conn, reused = self._connection(parts.scheme, parts.netloc)
+            try:
+                conn.request("GET", target, headers=req_headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                # El servidor pudo cerrar una conexión ociosa: un reintento con una nueva
+                if reused and attempt == 0:
+                    continue
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                with self._lock:
+                    self._idle.setdefault((parts.scheme, parts.netloc), []).append(conn)
+            with self._lock:
+                self.stats["requests"] += 1
+            return resp.status, body, {k.lower(): v for k, v in resp.getheaders()}
+        raise OSError(f"sin respuesta de {url}")
+
+    def get_sync(self, url: str, headers: Optional[Dict[str, str]] = None) -> Tuple[int, str, Dict[str, str], int]:
+        """
+        GET siguiendo redirecciones. Retorna (status, html, headers, bytes recibidos).
+
+        Solo se siguen redirecciones al mismo esquema y host: robots.txt y el
+        throttle son por host, así que un salto a otro host no se sigue y se
+        retorna la respuesta 3xx tal cual.
+        """
+        n_bytes = 0
+        for _ in range(self.MAX_REDIRECTS + 1):
+            status, body, resp_headers = self._request(url, headers)
+            n_bytes += len(body)
+            if status in REDIRECT_STATUSES and resp_headers.get("location"):
+                target = urljoin(url, resp_headers["location"])
+                if urlsplit(target)[:2] != urlsplit(url)[:2]:
+                    break
+                url = target
+                continue
+            break
+        return status, _decode_body(body, resp_headers), resp_headers, n_bytes
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> Tuple[int, str, Dict[str, str], int]:
+        return await asyncio.to_thread(self.get_sync, url, headers)
+
+    def close(self) -> None:
+        with self._lock:
+            for conns in self._idle.values():
+                for conn in conns:
+                    conn.close()
+            self._idle.clear()
+
+async def fetch_page_http(
+    client: HttpFetcher, url: str, log_path: Path, validators: Optional[Dict[str, str]] = None
+) -> Tuple[Optional[int], str, Dict[str, str]]:
+    """
+    GET directo del HTML (sin navegador). Mismo retorno que fetch_page_html.
+    Con `validators` es un GET condicional: un 304 llega sin cuerpo.
+    """
+    log_line(log_path, f"GET (http{', condicional' if validators else ''}) {url}")
+    t0 = time.perf_counter()
+    status, html, headers, n_bytes = await client.get(url, validators)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    log_line(log_path, f"Status={status} len(html)={len(html)} bytes={n_bytes} t={elapsed_ms:.0f}ms")
+    return status, html, headers
+
+def needs_javascript(html: str) -> bool:
+    """
+    True si el HTML servido es un cascarón que se completa con JavaScript:
+    sin datos estructurados (JSON-LD / estado embebido) y sin ítems del
+    listado (li.ui-search-layout__item de READY_SELECTOR). No basta con ver
+    "UF" en el markup: el menú y el pie de página también lo traen.
+    """
+    if not html or not html.strip():
+        return True
+    jsonld, state = embedded_json_scripts(html)
+    if jsonld or state:
+        return False
+    return LISTING_ITEM_RE.search(html) is None
+
+async def revalidate(context, url: str, validators: Dict[str, str], cfg: ScrapeConfig) -> Optional[int]:
+    """
+    GET condicional (If-None-Match / If-Modified-Since) con el cliente HTTP del
+    contexto de Playwright, sin renderizar. Retorna el status o None si falla.
+    """
+    try:
+        resp = await context.request.get(
+            url, headers=validators, timeout=cfg.timeout_ms, fail_on_status_code=False
+        )
+    except Exception:
+        return None
+    status = resp.status
+    await resp.dispose()
+    return status
+
+def detect_block(status: Optional[int], html: str) -> Tuple[bool, bool]:
+    """
+    Detección de bloqueo (WAF/anti-bot). Retorna (bloqueado, es_captcha).
+    """
+    lower = (html or "").lower()
+    is_captcha = "captcha" in lower
+    is_denied = "access denied" in lower
+    return status in (401, 403, 429) or is_captcha or is_denied, is_captcha
 
 # -----------------------------
 # Parsing (best-effort)
 # -----------------------------
-def parse_items_from_jsonld(soup: BeautifulSoup) -> List[dict]:
+def items_from_jsonld_texts(texts) -> List[dict]:
     """
-    Intenta extraer estructuras JSON-LD (si existen).
-    Si el sitio entrega ItemList, puede haber itemListElement.
+    itemListElement de los ItemList contenidos en los textos JSON-LD dados.
     """
     items: List[dict] = []
-    for s in soup.find_all("script", attrs={"type": "application/ld+json"}):
-        text = (s.string or "").strip()
+    for text in texts:
+        text = text.strip()
         if not text:
             continue
         try:
@@ -260,95 +662,469 @@ def parse_items_from_jsonld(soup: BeautifulSoup) -> List[dict]:
                         items.append(el)
     return items
 
+def _uf_from_match(m: Optional[re.Match]) -> Optional[float]:
+    if not m:
+        return None
+    num = m.group(1).replace(".", "").replace(",", ".")
+    try:
+        return float(num)
+    except Exception:
+        return None
+
+def _m2_from_match(mm: Optional[re.Match]) -> Optional[float]:
+    if not mm:
+        return None
+    num = mm.group(1).replace(",", ".")
+    try:
+        return float(num)
+    except Exception:
+        return None
+
 def extract_price_uf_and_m2_from_text(text: str) -> Tuple[Optional[float], Optional[float]]:
     """
     Extrae UF y m2 desde texto libre (JSON o DOM).
     Normaliza formatos 1.234,56 o 1,234.56 a float (best-effort).
     """
-    uf_val = None
-    m = UF_RE.search(text)
-    if m:
-        num = m.group(1).replace(".", "").replace(",", ".")
-        try:
-            uf_val = float(num)
-        except Exception:
-            uf_val = None
+    return _uf_from_match(UF_RE.search(text)), _m2_from_match(M2_RE.search(text))
+
+# -----------------------------
+# Datos estructurados (JSON-LD y estado embebido)
+# -----------------------------
+ROW_COLUMNS = ["tipo", "source_url", "listing_id", "price_uf", "m2", "price", "currency", "raw_hint"]
+
+SCRIPT_RE = re.compile(r"<script\b([^>]*)>(.*?)</script\s*>", re.IGNORECASE | re.DOTALL)
+# Scripts con el estado inicial de la página (Mercado Libre / Next.js)
+STATE_SCRIPT_IDS = ("__PRELOADED_STATE__", "__NEXT_DATA__")
+# Atributos de superficie de la API de Mercado Libre, en orden de preferencia
+AREA_ATTRIBUTE_IDS = ("COVERED_AREA", "TOTAL_AREA")
+
+def embedded_json_scripts(html: str) -> Tuple[List[str], List[str]]:
+    """
+    Ubica los <script> con JSON-LD y con el estado embebido directamente en el
+    HTML, sin construir un árbol DOM. Retorna (textos_jsonld, textos_estado).
+    """
+    jsonld: List[str] = []
+    state: List[str] = []
+    for m in SCRIPT_RE.finditer(html):
+        attrs, body = m.group(1), m.group(2)
+        if "ld+json" in attrs:
+            jsonld.append(body)
+        elif any(k in attrs or k in body[:200] for k in STATE_SCRIPT_IDS):
+            state.append(body)
+    return jsonld, state
+
+def _json_from_script(text: str):
+    """
+    JSON de un script de estado: puro (type=application/json) o asignado a una
+    variable (window.__PRELOADED_STATE__ = {...};).
+    """
+    text = text.strip()
+    start = 0 if text[:1] in "{[" else min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return None
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text, start)
+    except ValueError:
+        return None
+    return data
 
-    m2_val = None
-    mm = M2_RE.search(text)
-    if mm:
-        num = mm.group(1).replace(",", ".")
+def _to_float(value) -> Optional[float]:
+    """
+    Número desde un campo estructurado: 74, "74", "74,5" o "74 m²".
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        head = value.strip().split(" ")[0].replace(",", ".")
         try:
-            m2_val = float(num)
-        except Exception:
-            m2_val = None
+            return float(head)
+        except ValueError:
+            return None
+    return None
+
+def _listing_id(*values) -> Optional[str]:
+    for v in values:
+        if isinstance(v, (str, int)) and v != "":
+            m = LISTING_ID_RE.search(str(v))
+            if m:
+                return f"MLC{m.group(1)}"
+    return None
+
+def _structured_row(tipo: str, url: str, listing_id, price, currency, m2) -> dict:
+    price = _to_float(price)
+    currency = currency.upper() if isinstance(currency, str) else None
+    return {
+        "tipo": tipo,
+        "source_url": url,
+        "listing_id": listing_id,
+        "price_uf": price if currency in UF_CURRENCIES else None,
+        "m2": _to_float(m2),
+        "price": price,
+        "currency": currency,
+        "raw_hint": None,
+    }
+
+def listing_from_jsonld(item: dict, tipo: str, url: str) -> Optional[dict]:
+    """
+    Lee un elemento de ItemList (ListItem con "item", o el objeto directo):
+    offers.price / priceCurrency, floorSize.value y el ID del aviso desde
+    @id, sku, productID o url. None si no trae precio ni superficie.
+    """
+    obj = item.get("item") if isinstance(item.get("item"), dict) else item
+    offers = obj.get("offers")
+    if isinstance(offers, list):
+        offers = offers[0] if offers else None
+    price = currency = None
+    if isinstance(offers, dict):
+        spec = offers.get("priceSpecification")
+        spec = spec if isinstance(spec, dict) else {}
+        price = offers.get("price", spec.get("price"))
+        currency = offers.get("priceCurrency", spec.get("priceCurrency"))
+
+    m2 = None
+    floor = obj.get("floorSize")
+    if isinstance(floor, dict):
+        m2 = floor.get("value")
+    elif floor is not None:
+        m2 = floor
+    if m2 is None and isinstance(obj.get("additionalProperty"), list):
+        for prop in obj["additionalProperty"]:
+            name = str(prop.get("name", "")).lower() if isinstance(prop, dict) else ""
+            if "superficie" in name or "área" in name or "area" in name:
+                m2 = prop.get("value")
+                break
+
+    if _to_float(price) is None and _to_float(m2) is None:
+        return None
+    listing_id = _listing_id(obj.get("@id"), obj.get("sku"), obj.get("productID"), obj.get("url"), item.get("url"))
+    return _structured_row(tipo, url, listing_id, price, currency, m2)
+
+def _listing_from_state(obj: dict, tipo: str, url: str) -> Optional[dict]:
+    """
+    Resultado de búsqueda con el esquema de ítems de Mercado Libre:
+    id, price (número o {amount, currency_id}), currency_id y attributes
+    (COVERED_AREA / TOTAL_AREA con value_struct.number o value_name).
+    """
+    listing_id = _listing_id(obj.get("id"))
+    if listing_id is None or "price" not in obj:
+        return None
+    price = obj["price"]
+    currency = obj.get("currency_id")
+    if isinstance(price, dict):
+        currency = price.get("currency_id", price.get("currency", currency))
+        price = price.get("amount", price.get("value"))
+
+    m2 = None
+    attrs = {a.get("id"): a for a in obj.get("attributes") or [] if isinstance(a, dict)}
+    for attr_id in AREA_ATTRIBUTE_IDS:
+        attr = attrs.get(attr_id)
+        if attr is None:
+            continue
+        struct = attr.get("value_struct")
+        m2 = struct.get("number") if isinstance(struct, dict) else attr.get("value_name")
+        if m2 is not None:
+            break
+    return _structured_row(tipo, url, listing_id, price, currency, m2)
 
-    return uf_val, m2_val
+def listings_from_state(data, tipo: str, url: str) -> List[dict]:
+    """
+    Recorre el JSON de estado (sin recursión) y lee cada objeto con forma de
+    aviso; no se baja dentro de un aviso ya reconocido.
+    """
+    rows: List[dict] = []
+    stack = [data]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, dict):
+            row = _listing_from_state(obj, tipo, url)
+            if row is not None:
+                rows.append(row)
+                continue
+            stack.extend(reversed(list(obj.values())))
+        elif isinstance(obj, list):
+            stack.extend(reversed(obj))
+    return rows
+
+def structured_rows(html: str, tipo: str, url: str) -> List[dict]:
+    """
+    Filas desde datos estructurados: JSON-LD (ItemList) y, si no hay, el estado
+    embebido de la página. No construye DOM ni corre UF_RE/M2_RE sobre texto,
+    salvo para ítems JSON-LD sin ningún campo estructurado de precio o superficie.
+    """
+    jsonld_texts, state_texts = embedded_json_scripts(html)
+    rows: List[dict] = []
+    for it in items_from_jsonld_texts(jsonld_texts):
+        row = listing_from_jsonld(it, tipo, url)
+        if row is None:
+            # Ítem sin campos estructurados: último recurso sobre el JSON serializado.
+            # price / currency quedan vacíos (no vinieron) y raw_hint marca el origen.
+            text = json.dumps(it, ensure_ascii=False)
+            uf, m2 = extract_price_uf_and_m2_from_text(text)
+            row = _structured_row(tipo, url, None, None, None, m2)
+            row.update(price_uf=uf, raw_hint=f"json-ld sin precio estructurado (UF por regex): {text[:200]}")
+        rows.append(row)
+    if rows:
+        return rows
+    for text in state_texts:
+        data = _json_from_script(text)
+        if data is not None:
+            rows.extend(listings_from_state(data, tipo, url))
+    return rows
+
+# Fallback DOM: bloques candidatos y tope, iguales en ambos motores
+DOM_CANDIDATE_TAGS = ("article", "li", "div")
+DOM_CANDIDATE_LIMIT = 700
+# Contenido que BeautifulSoup.get_text no cuenta como texto
+NON_TEXT_TAGS = frozenset({"script", "style", "template"})
+
+def _card_blocks(parents: List[int], has_row: List[bool]) -> List[bool]:
+    """
+    Tarjetas de aviso entre los bloques candidatos (en orden de documento, con
+    el índice de su candidato padre). Una hoja es un bloque con fila sin otro
+    bloque con fila adentro (p.ej. el div del precio). Es tarjeta el bloque
+    con fila más externo que contiene una sola hoja: uno con varias es un
+    contenedor del listado y los bloques dentro de una tarjeta son fragmentos.
+    Así cada aviso da una sola fila.
+    """
+    leaves = [0] * len(parents)
+    for k in range(len(parents) - 1, -1, -1):  # los hijos van después del padre
+        if has_row[k] and not leaves[k]:
+            leaves[k] = 1
+        if parents[k] >= 0:
+            leaves[parents[k]] += leaves[k]
+    card = [False] * len(parents)
+    inside = [False] * len(parents)
+    for k, parent in enumerate(parents):
+        inside[k] = parent >= 0 and (inside[parent] or card[parent])
+        card[k] = has_row[k] and leaves[k] <= 1 and not inside[k]
+    return card
+
+def dom_rows_legacy(soup: BeautifulSoup, tipo: str, url: str) -> List[dict]:
+    """
+    Fallback DOM original: get_text y regex sobre cada bloque candidato.
+    El texto de un nodo interno se vuelve a extraer en cada ancestro, así que
+    el costo crece con la profundidad del anidamiento. Solo dan fila las
+    tarjetas (ver _card_blocks).
+    """
+    candidates = soup.find_all(list(DOM_CANDIDATE_TAGS), limit=DOM_CANDIDATE_LIMIT)
+    index = {id(c): k for k, c in enumerate(candidates)}
+    parents = [next((index[id(a)] for a in c.parents if id(a) in index), -1) for c in candidates]
+    found = []
+    for c in candidates:
+        text = c.get_text(" ", strip=True)
+        uf, m2 = extract_price_uf_and_m2_from_text(text) if "UF" in text else (None, None)
+        found.append((uf, m2, text))
+
+    rows: List[dict] = []
+    has_row = [uf is not None or m2 is not None for uf, m2, _ in found]
+    for (uf, m2, text), card in zip(found, _card_blocks(parents, has_row)):
+        if not card:
+            continue
+        rows.append(
+            {
+                "tipo": tipo,
+                "source_url": url,
+                "price_uf": uf,
+                "m2": m2,
+                "raw_hint": text[:250],
+            }
+        )
+    return rows
+
+def _dom_text_spans(root) -> Tuple[str, List[Tuple[int, int]], List[int]]:
+    """
+    Un solo recorrido del árbol lxml. Arma el texto del documento como lo haría
+    get_text(" ", strip=True) y, para cada bloque candidato, el rango [ini, fin)
+    de ese texto que le corresponde: el texto de un bloque es siempre un tramo
+    contiguo del texto del documento. También entrega el candidato padre de
+    cada uno (-1 si no está dentro de otro candidato).
+    """
+    pieces: List[str] = []
+    bounds: List[List[int]] = []  # [pieza inicial, pieza final) por candidato
+    parents: List[int] = []
+    stack: List[int] = []
+    open_candidates: List[int] = []
+    skip = 0
+
+    def add(t: Optional[str]) -> None:
+        if t:
+            t = t.strip()
+            if t:
+                pieces.append(t)
+
+    for event, el in lxml_etree.iterwalk(root, events=("start", "end", "comment", "pi")):
+        tag = el.tag
+        if event in ("comment", "pi"):
+            # sin texto propio; solo cuenta lo que sigue al comentario
+            if not skip:
+                add(el.tail)
+        elif event == "start":
+            k = -1
+            if tag in DOM_CANDIDATE_TAGS and len(bounds) < DOM_CANDIDATE_LIMIT:
+                k = len(bounds)
+                bounds.append([len(pieces), len(pieces)])
+                parents.append(open_candidates[-1] if open_candidates else -1)
+                open_candidates.append(k)
+            stack.append(k)
+            if tag in NON_TEXT_TAGS:
+                skip += 1
+            elif not skip:
+                add(el.text)
+        else:
+            k = stack.pop()
+            if k >= 0:
+                bounds[k][1] = len(pieces)
+                open_candidates.pop()
+            if tag in NON_TEXT_TAGS:
+                skip -= 1
+            if not skip:
+                add(el.tail)
+
+    offsets = []
+    pos = 0
+    for piece in pieces:
+        offsets.append(pos)
+        pos += len(piece) + 1
+    spans = [
+        (offsets[i], offsets[j - 1] + len(pieces[j - 1])) if j > i else (0, 0)
+        for i, j in bounds
+    ]
+    return " ".join(pieces), spans, parents
+
+def _first_in_span(
+    pattern: re.Pattern, starts: List[int], matches: List[re.Match], text: str, ini: int, fin: int
+) -> Optional[re.Match]:
+    """
+    Primer match de `pattern` dentro de text[ini:fin], usando los matches que
+    ya se calcularon sobre todo el documento. Si uno de ellos cruza el inicio
+    del tramo (p.ej. "120" fuera del bloque y "m2 m2" dentro), la búsqueda
+    local podría encontrar otro, así que solo en ese caso se busca en el tramo.
+    """
+    k = bisect.bisect_left(starts, ini)
+    if k > 0 and matches[k - 1].end() > ini:
+        return pattern.search(text, ini, fin)
+    # Los matches de finditer no se solapan: si el primero que parte en el
+    # tramo se sale de él, no hay otro adentro.
+    if k < len(matches) and matches[k].end() <= fin:
+        return matches[k]
+    return None
+
+def dom_rows_fast(root, tipo: str, url: str) -> List[dict]:
+    """
+    Fallback DOM con lxml: mismo resultado que dom_rows_legacy, pero el árbol se
+    recorre una vez y UF_RE / M2_RE corren una sola vez sobre el texto del
+    documento. Cada bloque toma el primer match dentro de su tramo (bisect),
+    en vez de re-extraer el texto de sus descendientes; solo dan fila las
+    tarjetas (ver _card_blocks).
+    """
+    text, spans, parents = _dom_text_spans(root)
+    uf_token = [m.start() for m in re.finditer("UF", text)]
+    uf_matches = list(UF_RE.finditer(text))
+    uf_starts = [m.start() for m in uf_matches]
+    m2_matches = list(M2_RE.finditer(text))
+    m2_starts = [m.start() for m in m2_matches]
+
+    found = []
+    for ini, fin in spans:
+        # equivalente a: "UF" in texto_del_bloque
+        k = bisect.bisect_left(uf_token, ini)
+        if k == len(uf_token) or uf_token[k] + 2 > fin:
+            found.append((None, None))
+            continue
+        uf = _uf_from_match(_first_in_span(UF_RE, uf_starts, uf_matches, text, ini, fin))
+        m2 = _m2_from_match(_first_in_span(M2_RE, m2_starts, m2_matches, text, ini, fin))
+        found.append((uf, m2))
 
-def parse_listings(html: str, tipo: str, url: str) -> List[dict]:
+    rows: List[dict] = []
+    has_row = [uf is not None or m2 is not None for uf, m2 in found]
+    for (ini, fin), (uf, m2), card in zip(spans, found, _card_blocks(parents, has_row)):
+        if not card:
+            continue
+        rows.append(
+            {
+                "tipo": tipo,
+                "source_url": url,
+                "price_uf": uf,
+                "m2": m2,
+                "raw_hint": text[ini:min(fin, ini + 250)],
+            }
+        )
+    return rows
+
+def parse_listings(html: str, tipo: str, url: str, engine: str = "fast") -> List[dict]:
     """
     Parser robusto (best-effort):
-    1) Prefiere JSON-LD.
+    1) Prefiere datos estructurados: JSON-LD y estado embebido de la página.
     2) Fallback: inspecciona texto del DOM en bloques grandes buscando UF y m2.
 
-    Retorna filas con columnas:
+    engine="fast" usa lxml (si está instalado) con un solo recorrido del árbol;
+    engine="legacy" usa BeautifulSoup/html.parser como la versión original.
+
+    Retorna filas con columnas (ROW_COLUMNS):
     - tipo: casa|departamento
     - source_url: listado fuente
+    - listing_id: ID del aviso (MLC...) si viene en los datos estructurados
     - price_uf: float o NaN
     - m2: float o NaN
+    - price / currency: precio y moneda tal como vienen (estructurados)
     - raw_hint: snippet textual (solo para debug)
     """
-    soup = BeautifulSoup(html, "html.parser")
-    rows: List[dict] = []
-
-    # 1) JSON-LD
-    jsonld_items = parse_items_from_jsonld(soup)
-    if jsonld_items:
-        for it in jsonld_items:
-            blob = json.dumps(it, ensure_ascii=False)
-            uf, m2 = extract_price_uf_and_m2_from_text(blob)
-            rows.append(
-                {
-                    "tipo": tipo,
-                    "source_url": url,
-                    "price_uf": uf,
-                    "m2": m2,
-                    "raw_hint": None,
-                }
-            )
+    # 1) Datos estructurados: JSON-LD o estado embebido (sin DOM ni regex)
+    rows = structured_rows(html or "", tipo, url)
 
     # 2) Fallback DOM (sin depender de clases CSS específicas)
     if not rows:
-        candidates = soup.find_all(["article", "li", "div"], limit=700)
-        for c in candidates:
-            text = c.get_text(" ", strip=True)
-            if "UF" not in text:
-                continue
-            uf, m2 = extract_price_uf_and_m2_from_text(text)
-            if uf is None and m2 is None:
-                continue
-            rows.append(
-                {
-                    "tipo": tipo,
-                    "source_url": url,
-                    "price_uf": uf,
-                    "m2": m2,
-                    "raw_hint": text[:250],
-                }
-            )
-
-    # Deduplicación simple
+        if engine == "fast" and LXML_AVAILABLE:
+            if not html or not html.strip():
+                return []
+            rows = dom_rows_fast(lxml_html.document_fromstring(html), tipo, url)
+        else:
+            rows = dom_rows_legacy(BeautifulSoup(html, "html.parser"), tipo, url)
+
+    # Deduplicación: por ID de aviso cuando existe; si no, por (precio, m2)
     uniq: List[dict] = []
     seen = set()
     for r in rows:
-        key = (r["tipo"], r.get("price_uf"), r.get("m2"), r["source_url"])
+        if r.get("listing_id"):
+            key = (r["tipo"], r["listing_id"])
+        else:
+            key = (r["tipo"], r.get("price_uf"), r.get("m2"), r["source_url"])
         if key in seen:
             continue
         seen.add(key)
-        uniq.append(r)
+        uniq.append({c: r.get(c) for c in ROW_COLUMNS})
 
     return uniq
 
+def compare_parsers(files: Sequence[Path], tipo: str = "departamento") -> pd.DataFrame:
+    """
+    Corre ambos motores sobre páginas guardadas (caché o dumps) y reporta si
+    las filas coinciden y el throughput de cada uno en páginas/s.
+    """
+    pages = [(f, f.read_text(encoding="utf-8", errors="replace")) for f in files]
+    results = {}
+    timings = {}
+    for engine in ("legacy", "fast"):
+        t0 = time.perf_counter()
+        results[engine] = [parse_listings(html, tipo, str(f), engine) for f, html in pages]
+        timings[engine] = time.perf_counter() - t0
+    same = sum(a == b for a, b in zip(results["legacy"], results["fast"]))
+    return pd.DataFrame(
+        [
+            {
+                "motor": engine,
+                "paginas": len(pages),
+                "filas": sum(len(r) for r in results[engine]),
+                "paginas_iguales": same,
+                "segundos": round(timings[engine], 3),
+                "paginas_por_s": round(len(pages) / timings[engine], 1) if timings[engine] > 0 else float("nan"),
+            }
+            for engine in ("legacy", "fast")
+        ]
+    )
+
 # -----------------------------
 # Métricas (cuadro 2.1)
 # -----------------------------
@@ -392,6 +1168,603 @@ def compute_metrics(df: pd.DataFrame) -> pd.DataFrame:
 
     return pd.DataFrame(metrics, columns=["Métrica", "Valor"])
 
+# -----------------------------
+# Escritura incremental de filas
+# -----------------------------
+OUTPUT_COLUMNS = ROW_COLUMNS + ["comuna"]
+FLOAT_COLUMNS = ("price_uf", "m2", "price")
+
+class RowWriter:
+    """
+    Salida append-only: las filas se escriben a medida que se parsean, en lotes
+    de `batch_size`, así el crawl corre en memoria acotada y lo escrito queda
+    utilizable aunque la ejecución se corte.
+    - csv: un archivo; el header va una vez y cada lote se agrega al final.
+    - parquet: una carpeta con un archivo por lote (part-00000.parquet, ...),
+      cada uno completo; pd.read_parquet(carpeta) lee el conjunto.
+    Lleva los conteos por tipo de forma incremental.
+    """
+
+    def __init__(self, path: Path, fmt: str = "csv", batch_size: int = 200, columns: Sequence[str] = OUTPUT_COLUMNS):
+        if fmt == "parquet" and not PYARROW_AVAILABLE:
+            raise RuntimeError("--output-format parquet requiere pyarrow")
+        self.path = path
+        self.fmt = fmt
+        self.batch_size = max(1, batch_size)
+        self.columns = list(columns)
+        self.buffer: List[dict] = []
+        self.counts: Dict[str, int] = {}
+        self.rows_written = 0
+        self._parts = 0
+        self._started = False
+
+    def write(self, rows: List[dict]) -> None:
+        for r in rows:
+            self.counts[r["tipo"]] = self.counts.get(r["tipo"], 0) + 1
+        self.buffer.extend(rows)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def _frame(self, rows: List[dict]) -> pd.DataFrame:
+        df = pd.DataFrame(rows, columns=self.columns)
+        # Tipos fijos: todos los lotes comparten esquema aunque una columna venga vacía
+        for col in self.columns:
+            df[col] = df[col].astype("float64" if col in FLOAT_COLUMNS else "string")
+        return df
+
+    def flush(self) -> None:
+        if not self.buffer and self._started:
+            return
+        df = self._frame(self.buffer)
+        if self.fmt == "parquet":
+            self.path.mkdir(parents=True, exist_ok=True)
+            if len(df):
+                df.to_parquet(self.path / f"part-{self._parts:05d}.parquet", index=False)
+                self._parts += 1
+        else:
+            df.to_csv(self.path, mode="a" if self._started else "w", header=not self._started,
+                      index=False, encoding="utf-8")
+        self._started = True
+        self.rows_written += len(self.buffer)
+        self.buffer = []
+
+    def close(self) -> None:
+        self.flush()
+
+    def read(self, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """
+        Relee lo escrito (solo `columns`), p.ej. para las métricas finales.
+        """
+        if self.fmt == "parquet":
+            if not self._parts:
+                return self._frame([])[list(columns or self.columns)]
+            return pd.read_parquet(self.path, columns=list(columns) if columns else None)
+        return pd.read_csv(self.path, usecols=list(columns) if columns else None, encoding="utf-8")
+
+# -----------------------------
+# Estado persistente del crawl (SQLite)
+# -----------------------------
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS frontier (
+    url         TEXT PRIMARY KEY,
+    comuna      TEXT NOT NULL,
+    tipo        TEXT NOT NULL,
+    page        INTEGER NOT NULL,
+    status      TEXT NOT NULL,  -- pending | done | blocked | robots
+    http_status INTEGER,
+    n_rows      INTEGER,
+    updated_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS listings (
+    listing_key TEXT PRIMARY KEY,
+    listing_id  TEXT,
+    tipo        TEXT NOT NULL,
+    comuna      TEXT,
+    source_url  TEXT,
+    price_uf    REAL,
+    m2          REAL,
+    price       REAL,
+    currency    TEXT,
+    raw_hint    TEXT,
+    fingerprint TEXT NOT NULL,
+    first_seen  REAL NOT NULL,
+    last_seen   REAL NOT NULL,
+    changed_at  REAL
+);
+CREATE INDEX IF NOT EXISTS listings_last_seen ON listings (last_seen);
+"""
+
+class CrawlState:
+    """
+    Estado del crawl en SQLite para reanudar y no re-scrapear:
+    - frontier: cada URL de listado con su (comuna, tipo, página) y estado.
+      Una página "done" dentro de la ventana no se vuelve a pedir; una que quedó
+      "pending" (caída) o "blocked" se reintenta en la siguiente ejecución.
+    - listings: un registro por aviso (por listing_id, o por precio/m2/URL si no
+      hay ID) con la huella de sus campos y first_seen / last_seen. Solo los
+      avisos nuevos o con huella distinta se reescriben; al resto se le
+      actualiza last_seen y source_url (la última página donde apareció).
+    - skipped_pages (temporal, de esta ejecución): páginas saltadas por estar
+      completadas en la ventana.
+    Se confirma cada página, así que una caída pierde a lo más la página en curso.
+    """
+
+    FIELDS = ("listing_id", "tipo", "comuna", "source_url", "price_uf", "m2", "price", "currency", "raw_hint")
+
+    def __init__(self, db_path: Path, window_s: float = 24 * 3600):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        self.window_s = window_s
+        self.started_at = time.time()
+        self.conn = sqlite3.connect(str(db_path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(STATE_SCHEMA)
+        self.conn.execute("CREATE TEMP TABLE skipped_pages (url TEXT PRIMARY KEY)")
+        self.stats = {"pages_skipped": 0, "new": 0, "changed": 0, "unchanged": 0}
+
+    def page_done(self, url: str) -> Optional[int]:
+        """
+        Filas de la página si ya se completó dentro de la ventana; si no, None.
+        """
+        row = self.conn.execute(
+            "SELECT n_rows FROM frontier WHERE url = ? AND status = 'done' AND updated_at >= ?",
+            (url, self.started_at - self.window_s),
+        ).fetchone()
+        return None if row is None else int(row[0] or 0)
+
+    def skip_page(self, url: str) -> None:
+        """
+        Registra una página saltada en esta ejecución: sus avisos salen de export.
+        """
+        self.conn.execute("INSERT OR IGNORE INTO skipped_pages (url) VALUES (?)", (url,))
+        self.conn.commit()
+        self.stats["pages_skipped"] += 1
+
+    def mark_page(
+        self, url: str, comuna: str, tipo: str, page: int, status: str,
+        http_status: Optional[int] = None, n_rows: Optional[int] = None,
+    ) -> None:
+        self.conn.execute(
+            "INSERT INTO frontier (url, comuna, tipo, page, status, http_status, n_rows, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (url) DO UPDATE SET status = excluded.status, http_status = excluded.http_status, "
+            "n_rows = excluded.n_rows, updated_at = excluded.updated_at",
+            (url, comuna, tipo, page, status, http_status, n_rows, time.time()),
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def listing_key(r: dict) -> str:
+        if r.get("listing_id"):
+            return f"{r['tipo']}:{r['listing_id']}"
+        raw = f"{r['tipo']}|{r.get('source_url')}|{r.get('price_uf')}|{r.get('m2')}"
+        return "h:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def fingerprint(r: dict) -> str:
+        raw = json.dumps([r.get("price_uf"), r.get("m2"), r.get("price"), r.get("currency")])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def upsert_listings(self, rows: List[dict]) -> Tuple[int, int]:
+        """
+        Inserta avisos nuevos, reescribe los que cambiaron de huella y solo
+        toca last_seen en los demás. Retorna (nuevos, cambiados).
+        """
+        if not rows:
+            return 0, 0
+        now = time.time()
+        keyed = {self.listing_key(r): r for r in rows}
+        keys = list(keyed)
+        known: Dict[str, str] = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            known.update(self.conn.execute(
+                f"SELECT listing_key, fingerprint FROM listings WHERE listing_key IN ({marks})", chunk
+            ).fetchall())
+
+        new, changed, unchanged = [], [], []
+        for key, r in keyed.items():
+            fp = self.fingerprint(r)
+            values = tuple(r.get(f) for f in self.FIELDS)
+            if key not in known:
+                new.append((key, *values, fp, now, now))
+            elif known[key] != fp:
+                changed.append((*values, fp, now, now, key))
+            else:
+                unchanged.append((now, r.get("source_url"), key))
+
+        cols = ", ".join(self.FIELDS)
+        self.conn.executemany(
+            f"INSERT INTO listings (listing_key, {cols}, fingerprint, first_seen, last_seen) "
+            f"VALUES ({', '.join('?' * (len(self.FIELDS) + 4))})",
+            new,
+        )
+        sets = ", ".join(f"{f} = ?" for f in self.FIELDS)
+        self.conn.executemany(
+            f"UPDATE listings SET {sets}, fingerprint = ?, last_seen = ?, changed_at = ? WHERE listing_key = ?",
+            changed,
+        )
+        self.conn.executemany("UPDATE listings SET last_seen = ?, source_url = ? WHERE listing_key = ?", unchanged)
+        self.conn.commit()
+        self.stats["new"] += len(new)
+        self.stats["changed"] += len(changed)
+        self.stats["unchanged"] += len(unchanged)
+        return len(new), len(changed)
+
+    def export(
+        self, comunas: Sequence[str], tipos: Sequence[str], previous_only: bool = False, chunksize: int = 5000
+    ):
+        """
+        Itera (en DataFrames de `chunksize` filas) los avisos vistos dentro de la
+        ventana para estas comunas y tipos. Con previous_only=True, solo los de
+        páginas que esta ejecución saltó por estar ya completadas (según la
+        última página donde se vio cada aviso) y que no volvió a ver en otra
+        página; así se agregan a la salida sin duplicar lo ya escrito. Los
+        avisos de páginas que sí se volvieron a pedir y ya no aparecen
+        (despublicados) no salen.
+        """
+        marks_c = ",".join("?" * len(comunas))
+        marks_t = ",".join("?" * len(tipos))
+        query = (
+            f"SELECT {', '.join(self.FIELDS)}, first_seen, last_seen, changed_at FROM listings "
+            f"WHERE comuna IN ({marks_c}) AND tipo IN ({marks_t}) AND last_seen >= ?"
+        )
+        params = [*comunas, *tipos, self.started_at - self.window_s]
+        if previous_only:
+            query += " AND last_seen < ? AND source_url IN (SELECT url FROM skipped_pages)"
+            params.append(self.started_at)
+        query += " ORDER BY first_seen, rowid"
+        for df in pd.read_sql_query(query, self.conn, params=params, chunksize=chunksize):
+            for col in ("first_seen", "last_seen", "changed_at"):
+                df[col] = pd.to_datetime(df[col], unit="s")
+            yield df
+
+    def close(self) -> None:
+        self.conn.close()
+
+# -----------------------------
+# Scheduler concurrente (comuna x tipo)
+# -----------------------------
+class TokenBucket:
+    """
+    Token bucket asíncrono: `rate` requests/s con ráfaga máxima `capacity`.
+    Con capacity=1 dos requests quedan separados al menos 1/rate segundos,
+    sin importar cuántos jobs lo compartan. Los que esperan salen en orden FIFO.
+
+    Con jitter_s=(min_s, max_s) el intervalo de recarga de cada token se
+    sortea uniforme en ese rango en vez de ser 1/rate fijo: el ritmo medio es
+    1/promedio(min_s, max_s) y la separación entre requests no es regular.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0, jitter_s: Optional[Tuple[float, float]] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.jitter_s = jitter_s
+        self.interval = 1.0 / rate if 0 < rate < float("inf") else 0.0
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """
+        Espera hasta obtener un token. Retorna los segundos esperados.
+        """
+        if self.rate <= 0 or self.rate == float("inf"):
+            return 0.0
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                refill = (now - self.updated) / self.interval if self.interval > 0 else self.capacity
+                self.tokens = min(self.capacity, self.tokens + refill)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    if self.jitter_s is not None:
+                        self.interval = random.uniform(*self.jitter_s)
+                    return waited
+                delay = (1.0 - self.tokens) * self.interval
+                await asyncio.sleep(delay)
+                waited += delay
+
+class HostThrottle:
+    """
+    Un TokenBucket por host. Cada intervalo entre requests se sortea entre
+    throttle_min_s y throttle_max_s, como el sleep de 2-4 s del scraper
+    secuencial (ritmo medio 1 / promedio), ahora como tope del total de
+    requests al host y no por job.
+    """
+
+    def __init__(self, cfg: ScrapeConfig):
+        mean_s = (cfg.throttle_min_s + cfg.throttle_max_s) / 2.0
+        self.rate = 1.0 / mean_s if mean_s > 0 else float("inf")
+        self.jitter_s = (cfg.throttle_min_s, cfg.throttle_max_s)
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    async def acquire(self, url: str) -> float:
+        host = urlsplit(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, jitter_s=self.jitter_s)
+        return await self.buckets[host].acquire()
+
+def build_jobs(cfg: ScrapeConfig, comunas: Sequence[str]) -> List[ScrapeConfig]:
+    """
+    Expande la config base en un job por (comuna, tipo), en orden estable.
+    """
+    return [replace(cfg, comuna=c, tipos=(t,)) for c in comunas for t in cfg.tipos]
+
+class LazyBrowser:
+    """
+    Chromium compartido que se lanza recién con el primer new_context().
+    Con --fetcher http y páginas server-rendered nunca se lanza.
+    """
+
+    def __init__(self, headless: bool):
+        self.headless = headless
+        self._playwright = None
+        self._browser = None
+        self._lock = asyncio.Lock()
+
+    async def new_context(self, **kwargs):
+        async with self._lock:
+            if self._browser is None:
+                self._playwright = await async_playwright().start()
+                self._browser = await self._playwright.chromium.launch(headless=self.headless)
+        return await self._browser.new_context(**kwargs)
+
+    async def close(self) -> None:
+        if self._browser is not None:
+            await self._browser.close()
+            await self._playwright.stop()
+
+class BrowserSession:
+    """
+    Contexto y pestaña de un job, creados en el primer uso (con su ruta de
+    bloqueo de recursos si corresponde).
+    """
+
+    def __init__(self, browser, job: ScrapeConfig):
+        self.browser = browser
+        self.job = job
+        self.context = None
+        self.blocker: Optional[ResourceBlocker] = None
+        self._page = None
+
+    async def page(self):
+        if self._page is None:
+            self.context = await self.browser.new_context()
+            if self.job.block_resources:
+                self.blocker = ResourceBlocker()
+                await self.blocker.install(self.context)
+            self._page = await self.context.new_page()
+        return self._page
+
+    async def close(self) -> None:
+        if self.context is not None:
+            await self.context.close()
+
+async def fetch_listing(
+    session: BrowserSession,
+    url: str,
+    job: ScrapeConfig,
+    cache: Optional[PageCache],
+    throttle: HostThrottle,
+    stop: asyncio.Event,
+    log_path: Path,
+    client: Optional[HttpFetcher] = None,
+) -> Optional[Tuple[Optional[int], str]]:
+    """
+    Obtiene (status, html) de un listado pasando por la caché de páginas.
+    Con `client` la página se pide sin navegador y solo se renderiza con
+    Playwright si el HTML necesita JavaScript.
+    Solo lo que sale a la red consume turno del token bucket.
+    Retorna None si `stop` se activó mientras se esperaba turno.
+    """
+    entry = cache.get(url) if cache is not None else None
+    if entry is not None and cache.is_fresh(entry):
+        cache.stats["hit"] += 1
+        log_line(log_path, f"CACHE {url} (status={entry['status']})")
+        return entry["status"], entry["html"]
+
+    await throttle.acquire(url)
+    if stop.is_set():
+        return None
+
+    # Respuesta completa del GET condicional por HTTP (la página cambió)
+    response = None
+    if entry is not None:
+        validators = cache.validators(entry)
+        if validators:
+            if client is not None:
+                try:
+                    response = await fetch_page_http(client, url, log_path, validators)
+                    status = response[0]
+                except (http.client.HTTPException, OSError):
+                    status = None
+            else:
+                status = await revalidate((await session.page()).context, url, validators, job)
+            if status == 304:
+                cache.touch(entry)
+                cache.stats["revalidated"] += 1
+                log_line(log_path, f"CACHE 304 {url}")
+                return entry["status"], entry["html"]
+            if status is None or client is None:
+                # Sin cuerpo utilizable: la descarga completa es otro request al host
+                await throttle.acquire(url)
+                if stop.is_set():
+                    return None
+
+    if client is not None:
+        status, html, headers = response or await fetch_page_http(client, url, log_path)
+        if status == 200 and not detect_block(status, html)[0] and needs_javascript(html):
+            log_line(log_path, f"Sin listados en el HTML servido (requiere JavaScript): Playwright {url}")
+            await throttle.acquire(url)
+            if stop.is_set():
+                return None
+            status, html, headers = await fetch_page_html(await session.page(), url, job, log_path, session.blocker)
+    else:
+        status, html, headers = await fetch_page_html(await session.page(), url, job, log_path, session.blocker)
+    if cache is not None and status == 200 and not detect_block(status, html)[0]:
+        cache.put(url, status, html, headers)
+    return status, html
+
+async def scrape_job(
+    browser,
+    job: ScrapeConfig,
+    robots: RobotsRules,
+    throttle: HostThrottle,
+    stop: asyncio.Event,
+    paths: Dict[str, Path],
+    log_path: Path,
+    cache: Optional[PageCache] = None,
+    seen_ids: Optional[set] = None,
+    client: Optional[HttpFetcher] = None,
+    state: Optional[CrawlState] = None,
+    writer: Optional[RowWriter] = None,
+) -> List[dict]:
+    """
+    Recorre las páginas de un job en su propio contexto de navegador (creado
+    al primer uso; con `client` solo si alguna página requiere JavaScript).
+    El parseo corre en un hilo para no frenar la navegación de los otros jobs.
+    Un bloqueo en cualquier job activa `stop` y detiene a todos (fail-fast).
+    Con `state`, las páginas ya completadas en la ventana se saltan (sus filas
+    cuentan para el tope por tipo) y los avisos se guardan en SQLite.
+    Con `writer` las filas van directo a la salida y no se acumulan: retorna [].
+    """
+    job_rows: List[dict] = []
+    seen_ids = set() if seen_ids is None else seen_ids
+    session = BrowserSession(browser, job)
+    try:
+        for tipo in job.tipos:
+            tag = f"[{job.comuna}/{tipo}]"
+            log_line(log_path, f"{tag} Iniciando...")
+            blocked = False
+            collected_for_type = 0
+
+            for page_i in range(1, job.max_pages + 1):
+                for url in build_listing_urls(tipo, job.comuna, job.region, page_i, job.base_url):
+                    # Respeto robots.txt (si el path está desautorizado, se salta)
+                    path = urlsplit(url).path
+                    if not robots.can_fetch(path, USER_AGENT_GROUP):
+                        log_line(log_path, f"{tag} SKIP por robots.txt: {path}")
+                        if state is not None:
+                            state.mark_page(url, job.comuna, tipo, page_i, "robots")
+                        continue
+
+                    if state is not None:
+                        done_rows = state.page_done(url)
+                        if done_rows is not None:
+                            log_line(log_path, f"{tag} página {page_i} ya completada en la ventana ({done_rows} filas): se salta")
+                            state.skip_page(url)
+                            collected_for_type += done_rows
+                            if collected_for_type >= job.max_items_per_type:
+                                break
+                            continue
+                        state.mark_page(url, job.comuna, tipo, page_i, "pending")
+
+                    fetched = await fetch_listing(session, url, job, cache, throttle, stop, log_path, client)
+                    if fetched is None:
+                        blocked = True
+                        break
+                    status, html = fetched
+
+                    is_blocked, is_captcha = detect_block(status, html)
+                    if is_blocked:
+                        log_line(log_path, f"{tag} BLOQUEO detectado (status={status}, captcha={is_captcha}). Deteniendo todos los jobs.")
+                        if job.debug_dump:
+                            dump_path = save_dump(paths["raw"], f"blocked_{job.comuna}_{tipo}_p{page_i}", url, status, html)
+                            log_line(log_path, f"{tag} Dump guardado: {dump_path}")
+                        if state is not None:
+                            state.mark_page(url, job.comuna, tipo, page_i, "blocked", status)
+                        stop.set()
+                        blocked = True
+                        break
+
+                    # Parseo de listados
+                    rows = await asyncio.to_thread(parse_listings, html, tipo, url, job.parser)
+                    # Un aviso puede repetirse entre páginas o comunas: se cuenta una vez
+                    rows = [r for r in rows if not r["listing_id"] or (tipo, r["listing_id"]) not in seen_ids]
+                    seen_ids.update((tipo, r["listing_id"]) for r in rows if r["listing_id"])
+                    log_line(log_path, f"{tag} items parseados en página: {len(rows)}")
+                    for r in rows:
+                        r["comuna"] = job.comuna
+                    if writer is not None:
+                        writer.write(rows)
+                    else:
+                        job_rows.extend(rows)
+                    if state is not None:
+                        n_new, n_changed = state.upsert_listings(rows)
+                        state.mark_page(url, job.comuna, tipo, page_i, "done", status, len(rows))
+                        log_line(log_path, f"{tag} avisos nuevos={n_new} cambiados={n_changed}")
+
+                    # Límite por tipo
+                    collected_for_type += len(rows)
+                    if collected_for_type >= job.max_items_per_type:
+                        log_line(log_path, f"{tag} alcanzado max_items_per_type={job.max_items_per_type}.")
+                        break
+
+                if blocked or stop.is_set() or collected_for_type >= job.max_items_per_type:
+                    blocked = blocked or stop.is_set()
+                    break
+
+            log_line(log_path, f"{tag} Finalizado. Total tipo={collected_for_type} blocked={blocked}")
+    finally:
+        await session.close()
+    return job_rows
+
+async def crawl(
+    browser,
+    jobs: Sequence[ScrapeConfig],
+    robots: RobotsRules,
+    paths: Dict[str, Path],
+    log_path: Path,
+    concurrency: int = 1,
+    cache: Optional[PageCache] = None,
+    client: Optional[HttpFetcher] = None,
+    state: Optional[CrawlState] = None,
+    writer: Optional[RowWriter] = None,
+) -> List[dict]:
+    """
+    Corre los jobs con a lo más `concurrency` contextos abiertos a la vez sobre
+    un mismo navegador. El ritmo contra cada host lo fija HostThrottle, de modo
+    que la concurrencia solo solapa render, espera de red y parseo.
+    Retorna las filas en el orden de `jobs` (vacío si se escriben con `writer`).
+    """
+    throttle = HostThrottle(jobs[0])
+    stop = asyncio.Event()
+    slots = asyncio.Semaphore(max(1, concurrency))
+    seen_ids: set = set()  # (tipo, listing_id) ya entregados, compartido entre jobs
+
+    async def run_one(job: ScrapeConfig) -> List[dict]:
+        async with slots:
+            if stop.is_set():
+                return []
+            return await scrape_job(browser, job, robots, throttle, stop, paths, log_path, cache, seen_ids, client, state, writer)
+
+    results = await asyncio.gather(*(run_one(j) for j in jobs))
+    return [r for rows in results for r in rows]
+
+async def run_jobs(
+    jobs: Sequence[ScrapeConfig],
+    robots: RobotsRules,
+    paths: Dict[str, Path],
+    log_path: Path,
+    concurrency: int = 1,
+    cache: Optional[PageCache] = None,
+    client: Optional[HttpFetcher] = None,
+    state: Optional[CrawlState] = None,
+    writer: Optional[RowWriter] = None,
+) -> List[dict]:
+    """
+    Un solo Chromium (async, lanzado al primer uso) para todos los jobs y `crawl`.
+    """
+    browser = LazyBrowser(headless=jobs[0].headless)
+    try:
+        return await crawl(browser, jobs, robots, paths, log_path, concurrency, cache, client, state, writer)
+    finally:
+        await browser.close()
+
 # -----------------------------
 # Main (CLI)
 # -----------------------------
@@ -409,8 +1782,46 @@ def main() -> int:
     parser.add_argument("--headless", type=int, default=1, help="1=headless, 0=con ventana (debug)")
     parser.add_argument("--timeout-ms", type=int, default=25000, help="timeout navegación playwright (ms)")
     parser.add_argument("--debug-dump", type=int, default=1, help="1=guardar dumps HTML ante bloqueo/falla")
+    parser.add_argument("--comunas", default=None,
+                        help="slugs separados por coma; un job por comuna x tipo (default: --comuna)")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="jobs simultáneos; el ritmo total por host no cambia (default: 1)")
+    parser.add_argument("--base-url", default=BASE,
+                        help="raíz del sitio (p.ej. http://127.0.0.1:8000 para un servidor de prueba local)")
+    parser.add_argument("--parser", choices=("fast", "legacy"), default="fast",
+                        help="motor del fallback DOM: fast (lxml, un recorrido) | legacy (BeautifulSoup)")
+    parser.add_argument("--compare-parsers", default=None,
+                        help="carpeta con páginas .html guardadas: compara ambos motores (filas y páginas/s) y termina")
+    parser.add_argument("--fetcher", choices=("playwright", "http"), default="playwright",
+                        help="http = HTML directo con conexiones keep-alive; Playwright solo si la página requiere JavaScript")
+    parser.add_argument("--block-resources", type=int, default=1,
+                        help="1=abortar imágenes, fuentes, CSS, media y trackers (solo se usa el HTML)")
+    parser.add_argument("--ready-selector", default=READY_SELECTOR,
+                        help="selector que indica listado cargado; vacío = esperar network idle")
+    parser.add_argument("--state", default="data/state/crawl.sqlite",
+                        help="SQLite con frontera y avisos vistos para reanudar el crawl; vacío = sin estado")
+    parser.add_argument("--state-window-h", type=float, default=24.0,
+                        help="horas en que una página completada no se vuelve a pedir (default: 24)")
+    parser.add_argument("--output-format", choices=("csv", "parquet"), default="csv",
+                        help="salida incremental: csv (un archivo) | parquet (carpeta con un archivo por lote)")
+    parser.add_argument("--flush-every", type=int, default=200,
+                        help="filas por lote escrito a disco durante el crawl (default: 200)")
+    parser.add_argument("--cache-mode", choices=CACHE_MODES, default="refresh",
+                        help="caché de páginas en data/raw/cache: off | read (solo disco si existe) | refresh (revalida vencidas)")
+    parser.add_argument("--cache-ttl-h", type=float, default=6.0,
+                        help="horas que una página en caché se usa sin revalidar (default: 6)")
     args = parser.parse_args()
 
+    if args.compare_parsers:
+        files = sorted(Path(args.compare_parsers).rglob("*.html"))
+        if not files:
+            print(f"Sin páginas .html en {args.compare_parsers}")
+            return 2
+        if not LXML_AVAILABLE:
+            print("lxml no está instalado: el motor fast usa el mismo camino que legacy.")
+        print(compare_parsers(files).to_string(index=False))
+        return 0
+
     cfg = ScrapeConfig(
         comuna=args.comuna,
         region=args.region,
@@ -421,7 +1832,13 @@ def main() -> int:
         headless=bool(args.headless),
         timeout_ms=args.timeout_ms,
         debug_dump=bool(args.debug_dump),
+        base_url=args.base_url.rstrip("/"),
+        parser=args.parser,
+        block_resources=bool(args.block_resources),
+        ready_selector=args.ready_selector,
+        fetcher=args.fetcher,
     )
+    comunas = [c.strip() for c in (args.comunas or args.comuna).split(",") if c.strip()]
 
     root = Path.cwd()
     paths = ensure_dirs(root)
@@ -433,80 +1850,55 @@ def main() -> int:
     log_line(log_path, "Nota: Si hay 403/captcha, el script se detiene y guarda evidencia en data/raw/.")
 
     # 1) robots.txt (se usa para decidir si visitar o no ciertas rutas)
-    robots = fetch_robots(log_path)
-
-    all_rows: List[dict] = []
-
-    # 2) Playwright: un solo navegador, una sola pestaña, sin paralelismo
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=cfg.headless)
-        context = browser.new_context()
-        page = context.new_page()
-
-        # Orden solicitado por el usuario: primero deptos, luego casas
-        for tipo in ["departamento", "casa"]:
-            log_line(log_path, f"[{tipo}] Iniciando...")
-
-            blocked = False
-            collected_for_type = 0
-
-            for page_i in range(1, cfg.max_pages + 1):
-                candidate_urls = build_listing_urls(tipo, cfg.comuna, cfg.region, page_i)
-
-                for url in candidate_urls:
-                    # Respeto robots.txt (si el path está desautorizado, se salta)
-                    path = url.replace(BASE, "", 1)
-                    if not robots.can_fetch(path, USER_AGENT_GROUP):
-                        log_line(log_path, f"[{tipo}] SKIP por robots.txt: {path}")
-                        continue
-
-                    polite_sleep(cfg)
-
-                    status, html = fetch_page_html(page, url, cfg, log_path)
-
-                    # Detección de bloqueo (WAF/anti-bot)
-                    is_captcha = "captcha" in (html or "").lower()
-                    is_denied = (html and ("Access Denied" in html or "access denied" in html.lower()))
-                    if status in (401, 403, 429) or is_captcha or is_denied:
-                        log_line(log_path, f"[{tipo}] BLOQUEO detectado (status={status}, captcha={is_captcha}). Deteniendo tipo.")
-                        if cfg.debug_dump:
-                            dump_path = save_dump(paths["raw"], f"blocked_{tipo}_p{page_i}", url, status, html)
-                            log_line(log_path, f"[{tipo}] Dump guardado: {dump_path}")
-                        blocked = True
-                        break
-
-                    # Parseo de listados
-                    rows = parse_listings(html, tipo, url)
-                    log_line(log_path, f"[{tipo}] items parseados en página: {len(rows)}")
-                    all_rows.extend(rows)
-
-                    # Límite por tipo
-                    collected_for_type = sum(1 for r in all_rows if r["tipo"] == tipo)
-                    if collected_for_type >= cfg.max_items_per_type:
-                        log_line(log_path, f"[{tipo}] alcanzado max_items_per_type={cfg.max_items_per_type}.")
-                        break
-
-                if blocked or collected_for_type >= cfg.max_items_per_type:
-                    break
-
-            log_line(log_path, f"[{tipo}] Finalizado. Total tipo={collected_for_type} blocked={blocked}")
-
-        context.close()
-        browser.close()
-
-    # 3) Guardar dataset extraído (aunque sea parcial)
-    df = pd.DataFrame(all_rows)
-    out_csv = paths["out"] / f"portal_huechuraba_{stamp}.csv"
-    df.to_csv(out_csv, index=False, encoding="utf-8")
-
-    log_line(log_path, f"CSV guardado: {out_csv} (rows={len(df)})")
+    client = HttpFetcher(timeout_s=cfg.timeout_ms / 1000) if cfg.fetcher == "http" else None
+    robots = fetch_robots(log_path, base_url=cfg.base_url, client=client)
+
+    # 2) Scheduler async: un contexto de navegador por job (comuna x tipo).
+    #    Con --concurrency 1 los jobs corren uno tras otro, como antes; con
+    #    --fetcher http el HTML se pide directo y Chromium se lanza solo si hace falta JS.
+    jobs = build_jobs(cfg, comunas)
+    log_line(log_path, f"Jobs: {len(jobs)} (comunas={len(comunas)}) concurrency={args.concurrency}")
+    cache = None
+    if args.cache_mode != "off":
+        cache = PageCache(paths["raw"] / "cache", args.cache_mode, args.cache_ttl_h * 3600)
+    state = CrawlState(root / args.state, args.state_window_h * 3600) if args.state else None
+    if state is not None:
+        log_line(log_path, f"Estado del crawl: {state.db_path} (ventana {args.state_window_h} h)")
+
+    # 3) Las filas se escriben por lotes mientras avanza el crawl: si se corta,
+    #    lo ya parseado queda en disco.
+    out_name = comunas[0] if len(comunas) == 1 else "multicomuna"
+    suffix = ".csv" if args.output_format == "csv" else ""
+    out_path = paths["out"] / f"portal_{out_name}_{stamp}{suffix}"
+    writer = RowWriter(out_path, args.output_format, args.flush_every)
+    try:
+        asyncio.run(run_jobs(jobs, robots, paths, log_path, args.concurrency, cache, client, state, writer))
+    finally:
+        if client is not None:
+            client.close()
+            log_line(log_path, f"HTTP keep-alive: {client.stats}")
+        if state is not None:
+            # Avisos de páginas saltadas (ya completadas en la ventana): se agregan
+            # al final, así la salida cubre toda la ventana sin duplicar.
+            for chunk in state.export(comunas, cfg.tipos, previous_only=True):
+                writer.write(chunk[OUTPUT_COLUMNS].to_dict("records"))
+            log_line(log_path, f"Estado: {state.stats}")
+            state.close()
+        writer.close()
+    if cache is not None:
+        log_line(log_path, f"Caché ({cache.mode}): {cache.stats}")
+
+    log_line(log_path, f"Salida guardada: {out_path} (rows={writer.rows_written}, por tipo={writer.counts})")
 
     # 4) Si no hubo filas, igual dejamos evidencia en logs para el informe
-    if len(df) == 0:
+    if writer.rows_written == 0:
         log_line(log_path, "No se obtuvieron filas. Revisa logs/dumps para justificar bloqueo en el informe.")
         log_line(log_path, f"LOG: {log_path}")
         return 2
 
+    # Métricas sobre lo escrito: solo las columnas que usan
+    df = writer.read(["tipo", "price_uf", "m2"])
+
     # 5) Limpieza/normalización numérica
     df["price_uf"] = pd.to_numeric(df.get("price_uf"), errors="coerce")
     df["m2"] = pd.to_numeric(df.get("m2"), errors="coerce")
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+# Verificaciones reproducibles de pregunta_01.py sobre datos sintéticos
+#
+#   python verificar_pregunta_01.py
+#   python verificar_pregunta_01.py --escala 0.5 --destino data/verificacion
+#
+# Los datos se generan con benchmark_pregunta_01.generar_datos (semilla fija)
+# en una carpeta temporal, salvo que se indique --destino. El script termina
+# con código 1 si alguna verificación falla.
+
+#librerias
+import argparse
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import pregunta_01 as p01
+from benchmark_pregunta_01 import generar_datos
+
+
+ARCHIVOS_HECHOS = {"inv": "inventario_diario.csv", "trx": "transacciones_ventas.csv"}
+
+
+def _comparar(nombre, esperado, obtenido, columnas, clave="categoria", rtol=1e-9):
+    """
+    Compara columnas numéricas de dos resultados por categoría. Retorna una
+    fila del reporte (ok, categorías y máxima diferencia relativa).
+    """
+    esperado = esperado.assign(**{clave: esperado[clave].astype(object)}).set_index(clave)
+    obtenido = obtenido.assign(**{clave: obtenido[clave].astype(object)}).set_index(clave)
+    mismas = esperado.index.sort_values().equals(obtenido.index.sort_values())
+    a = esperado.loc[esperado.index.intersection(obtenido.index), columnas].to_numpy(np.float64)
+    b = obtenido.loc[esperado.index.intersection(obtenido.index), columnas].to_numpy(np.float64)
+    diferencia = np.abs(a - b) / np.maximum(np.abs(a), 1e-12)
+    return {
+        "verificacion": nombre,
+        "ok": bool(mismas and np.allclose(a, b, rtol=rtol, atol=0, equal_nan=True)),
+        "categorias": len(esperado),
+        "max_dif_relativa": float(np.nanmax(diferencia)) if diferencia.size else 0.0,
+    }
+
+
+################ Almacén incremental de KPIs ####################
+
+def separar_lotes(origen, destino, lotes=2, fraccion=0.1):
+    """
+    Copia los CSV de origen dejando en destino/historia el maestro y las
+    primeras filas de inventario y transacciones; la última fraccion de
+    filas se reparte en `lotes` archivos diarios (texto crudo, sin limpiar).
+
+    Retorna
+    -------
+    tuple
+        (carpeta_historia, [(lote_inv, lote_trx), ...])
+    """
+    origen, destino = Path(origen), Path(destino)
+    historia = destino / "historia"
+    historia.mkdir(parents=True, exist_ok=True)
+    shutil.copy(origen / "maestro_productos.csv", historia / "maestro_productos.csv")
+
+    archivos = {}
+    for tipo, nombre in ARCHIVOS_HECHOS.items():
+        df = pd.read_csv(origen / nombre, dtype=str, keep_default_na=False)
+        cortes = np.linspace(int(len(df) * (1 - fraccion)), len(df), lotes + 1).astype(int)
+        df.iloc[:cortes[0]].to_csv(historia / nombre, index=False, encoding="utf-8")
+        archivos[tipo] = []
+        for i, (a, b) in enumerate(zip(cortes[:-1], cortes[1:]), start=1):
+            ruta = destino / f"lote_{i}_{nombre}"
+            df.iloc[a:b].to_csv(ruta, index=False, encoding="utf-8")
+            archivos[tipo].append(ruta)
+    return historia, list(zip(archivos["inv"], archivos["trx"]))
+
+
+def verificar_almacen_kpi(ruta_datos, destino, lotes=2):
+    """
+    Inicializa el almacén con la historia y le agrega los lotes de a uno,
+    recargándolo desde disco en cada actualización (el uso diario), más un
+    lote repetido que no debe contarse dos veces. El GMROI y el Markdown del
+    almacén se comparan con calcular_gmroi / calcular_markdown sobre la
+    historia completa en memoria.
+
+    La comparación es exacta mientras ningún producto de la historia reciba
+    su categoría recién en un lote (agregar_lote no corrige filas pasadas);
+    a escala 1 eso ya ocurre en un par de filas.
+    """
+    historia, archivos = separar_lotes(ruta_datos, destino, lotes)
+    almacen = Path(destino) / "almacen"
+
+    p01.actualizar_almacen_kpi(almacen, historia)
+    for lote_inv, lote_trx in archivos + archivos[-1:]:
+        acumulador = p01.actualizar_almacen_kpi(almacen, historia, [lote_inv], [lote_trx])
+
+    inv, trx, _, _ = p01.cargar_tablas_limpias(
+        ruta_datos, tabla_alias=p01.TablaAliasCategorias(p01.categorias_reales), usar_cache=False
+    )
+    return [
+        {
+            "verificacion": "almacen.lotes",
+            "ok": len(acumulador.lotes) == 2 * lotes,
+            "categorias": len(acumulador.lotes),
+            "max_dif_relativa": 0.0,
+        },
+        _comparar(
+            "almacen.gmroi", p01.calcular_gmroi(inv, trx), acumulador.gmroi(),
+            ["margen_bruto", "inventario_promedio_costo", "gmroi"],
+        ),
+        _comparar(
+            "almacen.markdown", p01.calcular_markdown(trx), acumulador.markdown(),
+            ["descuentos_totales", "ventas_brutas", "markdown_pct"],
+        ),
+    ]
+
+
+################ Sustitución de SKUs ####################
+
+def verificar_sustituciones(ruta_datos, min_precision=0.9, min_recall=0.6):
+    """
+    Corre IndiceSustitucion sobre datos con pares plantados
+    (generar_datos(..., sustituciones=N)) por el mismo camino que
+    main --sustituciones (tablas limpias + ventas_fechadas) y mide precisión
+    y recall del mapa con los umbrales por defecto contra sustituciones.csv.
+    """
+    ruta_datos = Path(ruta_datos)
+    _, trx, prod, _ = p01.cargar_tablas_limpias(
+        ruta_datos, tabla_alias=p01.TablaAliasCategorias(p01.categorias_reales), usar_cache=False
+    )
+
+    verdad = pd.read_csv(ruta_datos / "sustituciones.csv", dtype=str)
+    plantados = set(zip(verdad["product_id_antiguo"], verdad["product_id_nuevo"]))
+    mapa = p01.IndiceSustitucion(prod, p01.ventas_fechadas(trx, ruta_datos)).mapa()
+    encontrados = set(zip(mapa["product_id_antiguo"].astype(object), mapa["product_id_nuevo"].astype(object)))
+
+    aciertos = len(encontrados & plantados)
+    precision = aciertos / len(encontrados) if encontrados else 0.0
+    recall = aciertos / len(plantados)
+    return [
+        {"verificacion": "sustituciones.precision", "ok": precision >= min_precision,
+         "categorias": len(encontrados), "max_dif_relativa": precision},
+        {"verificacion": "sustituciones.recall", "ok": recall >= min_recall,
+         "categorias": len(plantados), "max_dif_relativa": recall},
+    ]
+
+
+################ CLI ####################
+
+def main():
+    parser = argparse.ArgumentParser(description="Verificaciones de pregunta_01.py sobre datos sintéticos")
+    parser.add_argument("--escala", type=float, default=0.2,
+                        help="escala de los datos sintéticos (1 ≈ tamaño de los CSV originales)")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--lotes", type=int, default=2, help="lotes diarios agregados al almacén")
+    parser.add_argument("--sustituciones", type=int, default=50,
+                        help="pares de SKUs sustitutos plantados en datos de escala 1 (0: no verificar)")
+    parser.add_argument("--destino", default=None,
+                        help="carpeta de trabajo (default: temporal, se borra al terminar)")
+    args = parser.parse_args()
+
+    destino = Path(args.destino) if args.destino else Path(tempfile.mkdtemp(prefix="verificar_p01_"))
+    try:
+        datos = generar_datos(destino / "datos", args.escala, args.semilla)
+        filas = verificar_almacen_kpi(datos, destino / "almacen_kpi", args.lotes)
+        if args.sustituciones:
+            datos = generar_datos(destino / "sustituciones", 1, args.semilla, sustituciones=args.sustituciones)
+            filas += verificar_sustituciones(datos)
+    finally:
+        if args.destino is None:
+            shutil.rmtree(destino, ignore_errors=True)
+
+    reporte = pd.DataFrame(filas)
+    print(reporte.to_string(index=False))
+    return 0 if reporte["ok"].all() else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,456 @@
+# -*- coding: utf-8 -*-
+
+# Verificaciones reproducibles de pregunta_02.py sin salir a internet
+#
+#   python verificar_pregunta_02.py
+#   python verificar_pregunta_02.py --concurrencia 8 --tasa 40
+#
+# Un servidor HTTP local hace de portal: robots.txt y listados server-rendered
+# (tarjetas poly-card y el estado de la búsqueda embebido) con ETag / 304.
+# El crawl corre con --fetcher http contra él, sin navegador. El script
+# termina con código 1 si alguna verificación falla.
+
+#librerias
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pandas as pd
+
+import pregunta_02 as p02
+
+
+COMUNAS = ("huechuraba", "renca", "quilicura")
+# Páginas de listado guardadas y anonimizadas, con las filas esperadas por página
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "pregunta_02"
+AVISOS_POR_PAGINA = 48
+# Avisos publicados en más de una comuna (el crawl debe entregarlos una vez)
+AVISOS_COMPARTIDOS = 5
+
+
+# -----------------------------
+# Portal local
+# -----------------------------
+def tarjeta(listing_id: int, uf: int, m2: int, dormitorios: int) -> str:
+    precio = f"{uf:,}".replace(",", ".")
+    return (
+        '<li class="ui-search-layout__item"><div class="poly-card"><div class="poly-card__content">'
+        f'<h3 class="poly-component__title-wrapper"><a href="/MLC-{listing_id}-departamento-_JM">Departamento en venta</a></h3>'
+        '<div class="poly-price__current"><span class="andes-money-amount__currency-symbol">UF</span> '
+        f'<span class="andes-money-amount__fraction">{precio}</span></div>'
+        '<ul class="poly-attributes-list">'
+        f'<li class="poly-attributes-list__item">{dormitorios} dormitorios</li>'
+        f'<li class="poly-attributes-list__item">{m2} m2 útiles</li></ul></div></div></li>'
+    )
+
+
+def pagina_listado(tipo: str, comuna: str, pagina: int, version: int = 0, retirados: int = 0) -> str:
+    """
+    Página de listado determinística; `version` cambia los precios (y el ETag)
+    y `retirados` despublica los últimos avisos de la página 1. Los primeros
+    AVISOS_COMPARTIDOS avisos de la página 1 son los mismos en todas las
+    comunas.
+    """
+    rnd = random.Random(f"{tipo}/{comuna}/{pagina}/{version}")
+    base = 1_500_000_000 + (sum(map(ord, tipo + comuna)) % 997) * 10_000
+    tarjetas, resultados = [], []
+    for k in range(AVISOS_POR_PAGINA - (retirados if pagina == 1 else 0)):
+        compartido = pagina == 1 and k < AVISOS_COMPARTIDOS
+        listing_id = 1_400_000_000 + k if compartido else base + pagina * 100 + k
+        uf = (7_000 + 100 * k + version) if compartido else rnd.randint(1_500, 20_000)
+        m2 = 40 + k if compartido else rnd.randint(30, 300)
+        tarjetas.append(tarjeta(listing_id, uf, m2, k % 4 + 1))
+        resultados.append({
+            "id": f"MLC{listing_id}",
+            "price": {"amount": uf, "currency_id": "CLF"},
+            "attributes": [{"id": "COVERED_AREA", "value_struct": {"number": m2, "unit": "m²"}}],
+        })
+    # Estado de la búsqueda embebido como en Mercado Libre (lo lee structured_rows)
+    estado = json.dumps({"initialState": {"results": resultados}})
+    return (
+        f"<html><head><title>{tipo} en venta en {comuna}</title></head><body>"
+        "<header><nav>Portal</nav></header><main><ol class='ui-search-layout'>"
+        + "".join(tarjetas)
+        + "</ol></main><footer>Valores en UF referenciales</footer>"
+        f"<script>window.__PRELOADED_STATE__ = {estado};</script></body></html>"
+    )
+
+
+class PortalLocal(BaseHTTPRequestHandler):
+    """
+    Listados /venta/<tipo>/<comuna>-<region>[_Desde_<offset>] y
+    /redirigir?a=<url> (302 a esa URL). Cada request queda en `registro`
+    como (hora monotónica, path).
+    """
+
+    protocol_version = "HTTP/1.1"
+    registro = []
+    version = 0
+    retirados = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, status, body=b"", headers=()):
+        self.send_response(status)
+        for k, v in headers:
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        PortalLocal.registro.append((time.monotonic(), self.path))
+        if self.path == "/robots.txt":
+            return self._responder(200, b"User-agent: *\nAllow: /\n", [("Content-Type", "text/plain")])
+        if self.path.startswith("/redirigir?a="):
+            return self._responder(302, headers=[("Location", self.path.split("=", 1)[1])])
+
+        partes = self.path.split("/")
+        if len(partes) != 4 or partes[1] != "venta":
+            return self._responder(404)
+        tipo, resto = partes[2], partes[3]
+        pagina = 1
+        if "_Desde_" in resto:
+            resto, offset = resto.split("_Desde_")
+            pagina = (int(offset) - 1) // AVISOS_POR_PAGINA + 1
+        comuna = resto.rsplit("-", 1)[0]
+
+        body = pagina_listado(tipo, comuna, pagina, PortalLocal.version, PortalLocal.retirados).encode("utf-8")
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()[:16]
+        if self.headers.get("If-None-Match") == etag:
+            return self._responder(304, headers=[("ETag", etag)])
+        self._responder(200, body, [("Content-Type", "text/html; charset=utf-8"), ("ETag", etag)])
+
+
+def servir():
+    """
+    Levanta el portal local en un puerto libre. Retorna (servidor, base_url).
+    """
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), PortalLocal)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+class SinNavegador:
+    """
+    Los listados del portal local vienen server-rendered: con --fetcher http
+    nunca se debería abrir un contexto de navegador.
+    """
+
+    async def new_context(self, **kwargs):
+        raise AssertionError("el crawl intentó abrir un navegador")
+
+
+# -----------------------------
+# Crawl contra el portal local
+# -----------------------------
+def correr_crawl(base_url, carpeta, concurrencia, tasa, max_pages=3, cache=None, state=None):
+    """
+    Crawl de COMUNAS x TIPOS con --fetcher http. Retorna (filas, requests al
+    portal como [(hora, path)], sin robots.txt).
+    """
+    cfg = p02.ScrapeConfig(
+        comuna=COMUNAS[0], region="metropolitana", max_pages=max_pages, max_items_per_type=10_000,
+        throttle_min_s=1 / tasa, throttle_max_s=1 / tasa, headless=True, timeout_ms=10_000,
+        debug_dump=False, base_url=base_url, fetcher="http",
+    )
+    paths = p02.ensure_dirs(Path(carpeta))
+    log_path = paths["logs"] / "verificacion.log"
+    client = p02.HttpFetcher(timeout_s=10)
+    try:
+        # log_line también imprime cada línea: el reporte queda solo al final
+        with contextlib.redirect_stdout(io.StringIO()):
+            robots = p02.fetch_robots(log_path, base_url=base_url, client=client)
+            PortalLocal.registro = []
+            filas = asyncio.run(p02.crawl(
+                SinNavegador(), p02.build_jobs(cfg, COMUNAS), robots, paths, log_path,
+                concurrencia, cache, client, state,
+            ))
+    finally:
+        client.close()
+    return filas, list(PortalLocal.registro)
+
+
+def _clave(fila):
+    return fila["tipo"], fila["listing_id"], fila["price_uf"], fila["m2"]
+
+
+def verificar_concurrencia(base_url, carpeta, concurrencia=4, tasa=20.0, max_pages=3):
+    """
+    Mismo crawl con concurrencia 1 y `concurrencia`:
+    - ritmo: el token bucket por host separa dos requests al menos 1/tasa s
+      (con holgura para el despacho de hilos) y la tasa global no la supera;
+    - sin duplicados: ninguna página se pide dos veces y ningún aviso sale
+      dos veces;
+    - mismas filas que con concurrencia 1.
+    """
+    filas_1, _ = correr_crawl(base_url, Path(carpeta) / "c1", 1, tasa, max_pages)
+    filas_n, registro = correr_crawl(base_url, Path(carpeta) / f"c{concurrencia}", concurrencia, tasa, max_pages)
+
+    horas = sorted(t for t, _ in registro)
+    brechas = [b - a for a, b in zip(horas, horas[1:])]
+    paths = [p for _, p in registro]
+    esperadas = len(COMUNAS) * len(p02.TIPOS) * max_pages
+    tasa_observada = (len(horas) - 1) / (horas[-1] - horas[0]) if len(horas) > 1 else 0.0
+    ids = [(f["tipo"], f["listing_id"]) for f in filas_n]
+    return [
+        {
+            "verificacion": "concurrencia.ritmo",
+            "ok": bool(brechas) and min(brechas) >= 0.8 / tasa and tasa_observada <= tasa * 1.05,
+            "detalle": f"brecha mínima {min(brechas, default=0):.3f}s (1/tasa={1 / tasa:.3f}s), "
+                       f"{tasa_observada:.1f} req/s",
+        },
+        {
+            "verificacion": "concurrencia.sin_duplicados",
+            "ok": len(paths) == len(set(paths)) == esperadas and len(ids) == len(set(ids)),
+            "detalle": f"{len(paths)} requests / {esperadas} páginas, {len(ids)} avisos",
+        },
+        {
+            "verificacion": "concurrencia.mismas_filas",
+            "ok": sorted(map(_clave, filas_1)) == sorted(map(_clave, filas_n)),
+            "detalle": f"{len(filas_1)} filas (concurrencia 1) vs {len(filas_n)} (concurrencia {concurrencia})",
+        },
+    ]
+
+
+def verificar_jitter(min_s=0.01, max_s=0.03, requests=40):
+    """
+    HostThrottle con throttle_min_s < throttle_max_s: cada brecha entre
+    requests al mismo host cae en [min_s, max_s] (con holgura para el event
+    loop) y las brechas no son todas iguales.
+    """
+    cfg = p02.ScrapeConfig(
+        comuna=COMUNAS[0], region="metropolitana", max_pages=1, max_items_per_type=1,
+        throttle_min_s=min_s, throttle_max_s=max_s, headless=True, timeout_ms=1_000, debug_dump=False,
+    )
+
+    async def pedir():
+        throttle = p02.HostThrottle(cfg)
+        horas = []
+        for _ in range(requests):
+            await throttle.acquire("http://portal.local/venta")
+            horas.append(time.monotonic())
+        return horas
+
+    horas = asyncio.run(pedir())
+    brechas = [b - a for a, b in zip(horas, horas[1:])]
+    return [
+        {
+            "verificacion": "concurrencia.jitter",
+            "ok": min(brechas) >= 0.9 * min_s and max(brechas) <= max_s + 0.01
+                  and max(brechas) - min(brechas) >= (max_s - min_s) / 2,
+            "detalle": f"brechas {min(brechas):.3f}-{max(brechas):.3f}s (rango {min_s:.3f}-{max_s:.3f}s)",
+        },
+    ]
+
+
+def verificar_revalidacion(base_url, carpeta, tasa=20.0, max_pages=3):
+    """
+    Caché en modo refresh con TTL 0 (toda entrada vencida se revalida con un
+    GET condicional):
+    - sin cambios en el portal, cada página es un request que responde 304;
+    - si las páginas cambian, el 200 del GET condicional ya trae el HTML
+      nuevo: un solo request por página (sin una segunda descarga ni otro
+      turno del token bucket) y la caché queda con ese HTML, así la
+      siguiente revalidación vuelve a ser 304.
+    """
+    cache = p02.PageCache(Path(carpeta) / "cache", mode="refresh", ttl_s=0)
+    PortalLocal.version = 0
+    try:
+        filas_0, _ = correr_crawl(base_url, carpeta, 1, tasa, max_pages, cache)
+        _, registro_304 = correr_crawl(base_url, carpeta, 1, tasa, max_pages, cache)
+        revalidadas = cache.stats["revalidated"]
+
+        PortalLocal.version = 1
+        filas_1, registro_200 = correr_crawl(base_url, carpeta, 1, tasa, max_pages, cache)
+        filas_cache, _ = correr_crawl(base_url, carpeta, 1, tasa, max_pages, cache)
+    finally:
+        PortalLocal.version = 0
+
+    paginas = len(COMUNAS) * len(p02.TIPOS) * max_pages
+    paths_200 = [p for _, p in registro_200]
+    return [
+        {
+            "verificacion": "revalidacion.304",
+            "ok": len(registro_304) == revalidadas == paginas,
+            "detalle": f"{len(registro_304)} requests, {revalidadas} respuestas 304 / {paginas} páginas",
+        },
+        {
+            "verificacion": "revalidacion.200_un_request",
+            "ok": len(paths_200) == len(set(paths_200)) == paginas,
+            "detalle": f"{len(paths_200)} requests / {paginas} páginas cambiadas",
+        },
+        {
+            "verificacion": "revalidacion.cache_actualizada",
+            "ok": (
+                sorted(map(_clave, filas_1)) != sorted(map(_clave, filas_0))
+                and sorted(map(_clave, filas_cache)) == sorted(map(_clave, filas_1))
+                and cache.stats["revalidated"] == revalidadas + paginas
+            ),
+            "detalle": f"{cache.stats['stored']} páginas guardadas, {cache.stats['revalidated']} revalidadas",
+        },
+    ]
+
+
+def verificar_estado(base_url, carpeta, tasa=20.0, max_pages=3, retirados=6):
+    """
+    Crawl reanudable: tras un crawl completo se simula una caída dejando
+    pendientes las páginas 1, y el portal despublica `retirados` avisos de
+    cada una. La ejecución siguiente solo pide las páginas 1 y completa la
+    salida con export(previous_only=True) (como main); el resultado debe ser
+    el de un crawl nuevo: sin avisos despublicados ni repetidos.
+    """
+    db_path = Path(carpeta) / "crawl.sqlite"
+    state = p02.CrawlState(db_path, window_s=3600)
+    try:
+        correr_crawl(base_url, carpeta, 1, tasa, max_pages, state=state)
+    finally:
+        state.close()
+    with contextlib.closing(sqlite3.connect(db_path)) as conn, conn:
+        conn.execute("UPDATE frontier SET status = 'pending' WHERE page = 1")
+
+    PortalLocal.retirados = retirados
+    try:
+        state = p02.CrawlState(db_path, window_s=3600)
+        try:
+            filas, registro = correr_crawl(base_url, carpeta, 1, tasa, max_pages, state=state)
+            for chunk in state.export(COMUNAS, p02.TIPOS, previous_only=True):
+                filas += chunk[p02.OUTPUT_COLUMNS].to_dict("records")
+        finally:
+            state.close()
+        esperadas, _ = correr_crawl(base_url, carpeta, 1, tasa, max_pages)
+    finally:
+        PortalLocal.retirados = 0
+
+    paginas_1 = len(COMUNAS) * len(p02.TIPOS)
+    return [
+        {
+            "verificacion": "estado.solo_pendientes",
+            "ok": len(registro) == paginas_1,
+            "detalle": f"{len(registro)} requests / {paginas_1} páginas pendientes",
+        },
+        {
+            "verificacion": "estado.salida_completa",
+            "ok": sorted(map(_clave, filas)) == sorted(map(_clave, esperadas)),
+            "detalle": f"{len(filas)} filas (reanudado + export) vs {len(esperadas)} (crawl nuevo)",
+        },
+    ]
+
+
+def verificar_redirecciones(base_url):
+    """
+    HttpFetcher sigue una redirección al mismo host y no una a otro host
+    (localhost apunta al mismo portal, pero es otro host para robots.txt y
+    el throttle): esa queda como 302 y el portal no recibe el segundo request.
+    """
+    puerto = base_url.rsplit(":", 1)[1]
+    client = p02.HttpFetcher(timeout_s=10)
+    try:
+        PortalLocal.registro = []
+        mismo = client.get_sync(f"{base_url}/redirigir?a=/robots.txt")[0]
+        requests_mismo = len(PortalLocal.registro)
+        PortalLocal.registro = []
+        otro = client.get_sync(f"{base_url}/redirigir?a=http://localhost:{puerto}/robots.txt")[0]
+        requests_otro = len(PortalLocal.registro)
+    finally:
+        client.close()
+    return [
+        {
+            "verificacion": "http.redireccion_mismo_host",
+            "ok": mismo == 200 and requests_mismo == 2,
+            "detalle": f"status {mismo}, {requests_mismo} requests",
+        },
+        {
+            "verificacion": "http.redireccion_otro_host",
+            "ok": otro == 302 and requests_otro == 1,
+            "detalle": f"status {otro}, {requests_otro} requests",
+        },
+    ]
+
+
+# -----------------------------
+# Parser sobre páginas guardadas
+# -----------------------------
+def verificar_parsers(carpeta=FIXTURES):
+    """
+    compare_parsers sobre las páginas de fixture (markup poly-card y anterior,
+    JSON-LD, estado embebido, bordes del fallback DOM, bloqueo y cascarón
+    JS): ambos motores deben entregar las mismas filas en todas las páginas,
+    y cada página las filas / precios UF / superficies de esperado.json.
+    """
+    carpeta = Path(carpeta)
+    archivos = sorted(carpeta.glob("*.html"))
+    esperado = json.loads((carpeta / "esperado.json").read_text(encoding="utf-8"))
+    comparacion = p02.compare_parsers(archivos).set_index("motor")
+
+    distintas = []
+    for f in archivos:
+        filas = p02.parse_listings(f.read_text(encoding="utf-8"), "departamento", str(f))
+        obtenido = {
+            "filas": len(filas),
+            "con_uf": sum(r["price_uf"] is not None for r in filas),
+            "con_m2": sum(r["m2"] is not None for r in filas),
+        }
+        if esperado.get(f.name) != obtenido:
+            distintas.append(f.name)
+    return [
+        {
+            "verificacion": "parsers.motores_iguales",
+            "ok": bool((comparacion["paginas_iguales"] == len(archivos)).all()) and len(archivos) > 0,
+            "detalle": f"{comparacion.loc['fast', 'paginas_iguales']}/{len(archivos)} páginas iguales, "
+                       f"{comparacion.loc['fast', 'filas']} filas, fast {comparacion.loc['fast', 'paginas_por_s']} pág/s "
+                       f"vs legacy {comparacion.loc['legacy', 'paginas_por_s']} pág/s",
+        },
+        {
+            "verificacion": "parsers.filas_esperadas",
+            "ok": not distintas and set(esperado) == {f.name for f in archivos},
+            "detalle": f"distintas: {', '.join(distintas)}" if distintas else f"{len(archivos)} páginas",
+        },
+    ]
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Verificaciones de pregunta_02.py contra un portal local")
+    parser.add_argument("--concurrencia", type=int, default=4, help="jobs concurrentes (default: 4)")
+    parser.add_argument("--tasa", type=float, default=20.0, help="requests/s al host (default: 20)")
+    parser.add_argument("--destino", default=None,
+                        help="carpeta de trabajo (default: temporal, se borra al terminar)")
+    args = parser.parse_args()
+
+    filas = verificar_parsers()
+    destino = Path(args.destino) if args.destino else Path(tempfile.mkdtemp(prefix="verificar_p02_"))
+    servidor, base_url = servir()
+    try:
+        filas += verificar_concurrencia(base_url, destino / "concurrencia", args.concurrencia, args.tasa)
+        filas += verificar_jitter()
+        filas += verificar_revalidacion(base_url, destino / "revalidacion", args.tasa)
+        filas += verificar_estado(base_url, destino / "estado", args.tasa)
+        filas += verificar_redirecciones(base_url)
+    finally:
+        servidor.shutdown()
+        if args.destino is None:
+            shutil.rmtree(destino, ignore_errors=True)
+
+    reporte = pd.DataFrame(filas)
+    with pd.option_context("display.max_colwidth", None):
+        print(reporte.to_string(index=False))
+    return 0 if reporte["ok"].all() else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())